@@ -0,0 +1,249 @@
+"""
+Fixtures for benchmarking the database tooling against a local Postgres pair.
+
+A throwaway primary and a streaming replica are created with `initdb`,
+`pg_basebackup` and `pg_ctl` for the benchmark session. The PostgreSQL
+binaries are looked up in `PG_BIN`, on `PATH` and in the usual Debian
+location; the benchmarks are skipped when none are found. The unit tests
+next to the benchmarks do not use these fixtures and always run.
+
+Dataset sizes can be overridden with `BENCHMARK_SIZES=100,1000,10000`.
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import pytest
+from sqlalchemy import Engine, text
+
+from pgtools.db import create_db_engine
+from pgtools.models import Base, Order, Product
+from pgtools.workload import generate_products
+
+DATASET_SIZES = [
+    int(size) for size in os.environ.get("BENCHMARK_SIZES", "100,1000,10000").split(",")
+]
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    """Run every benchmark using `dataset_size` once per configured size."""
+    if "dataset_size" in metafunc.fixturenames:
+        metafunc.parametrize("dataset_size", DATASET_SIZES, scope="session")
+
+
+def find_pg_bin() -> Optional[Path]:
+    """Locate the directory containing the PostgreSQL server binaries."""
+    candidates = []
+    if os.environ.get("PG_BIN"):
+        candidates.append(Path(os.environ["PG_BIN"]))
+    pg_ctl = shutil.which("pg_ctl")
+    if pg_ctl:
+        candidates.append(Path(pg_ctl).parent)
+    candidates.extend(sorted(Path("/usr/lib/postgresql").glob("*/bin"), reverse=True))
+
+    for candidate in candidates:
+        if (candidate / "initdb").exists() and (candidate / "pg_ctl").exists():
+            return candidate
+    return None
+
+
+def free_port() -> int:
+    """Ask the OS for a free TCP port on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_pg_tool(pg_bin: Path, tool: str, *args: str) -> None:
+    """Run a PostgreSQL command line tool and fail loudly on errors."""
+    result = subprocess.run(
+        [str(pg_bin / tool), *args], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{tool} failed:\n{result.stdout}\n{result.stderr}")
+
+
+def append_config(data_dir: Path, settings: Dict[str, str]) -> None:
+    """Append settings to postgresql.conf; later entries override earlier ones."""
+    with open(data_dir / "postgresql.conf", "a") as file:
+        for name, value in settings.items():
+            file.write(f"{name} = {value}\n")
+
+
+def db_config(port: int) -> Dict[str, Optional[str]]:
+    """Connection settings for a local server, in the same shape as get_db_config."""
+    return {
+        "host": "127.0.0.1",
+        "port": str(port),
+        "user": "postgres",
+        # Authentication is trust, but the URL builder requires a password
+        "password": "postgres",
+        "database": "bench",
+        "sslmode": "disable",
+    }
+
+
+@pytest.fixture(scope="session")
+def pg_bin() -> Path:
+    bin_dir = find_pg_bin()
+    if bin_dir is None:
+        pytest.skip("PostgreSQL binaries not found; set PG_BIN to run the benchmarks")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("PostgreSQL refuses to run as root")
+    return bin_dir
+
+
+@pytest.fixture(scope="session")
+def pg_pair(
+    pg_bin: Path, tmp_path_factory: pytest.TempPathFactory
+) -> Iterator[Dict[str, Dict[str, Optional[str]]]]:
+    """Start a local primary with a streaming replica for the session."""
+    root = tmp_path_factory.mktemp("pg")
+    primary_dir = root / "primary"
+    replica_dir = root / "replica"
+    primary_port = free_port()
+    replica_port = free_port()
+
+    run_pg_tool(
+        pg_bin, "initdb", "-D", str(primary_dir), "-U", "postgres", "-A", "trust",
+        "-E", "UTF8", "--no-sync",
+    )
+    append_config(
+        primary_dir,
+        {
+            "port": str(primary_port),
+            "listen_addresses": "'127.0.0.1'",
+            "unix_socket_directories": f"'{primary_dir}'",
+            "wal_level": "replica",
+            "max_wal_senders": "4",
+        },
+    )
+    run_pg_tool(
+        pg_bin, "pg_ctl", "-D", str(primary_dir), "-l", str(root / "primary.log"),
+        "-w", "start",
+    )
+
+    started = [primary_dir]
+    try:
+        run_pg_tool(
+            pg_bin, "createdb", "-h", "127.0.0.1", "-p", str(primary_port),
+            "-U", "postgres", "bench",
+        )
+        run_pg_tool(
+            pg_bin, "pg_basebackup", "-h", "127.0.0.1", "-p", str(primary_port),
+            "-U", "postgres", "-D", str(replica_dir), "-R", "-X", "stream",
+        )
+        append_config(
+            replica_dir,
+            {
+                "port": str(replica_port),
+                "unix_socket_directories": f"'{replica_dir}'",
+            },
+        )
+        run_pg_tool(
+            pg_bin, "pg_ctl", "-D", str(replica_dir), "-l", str(root / "replica.log"),
+            "-w", "start",
+        )
+        started.append(replica_dir)
+
+        yield {"primary": db_config(primary_port), "replica": db_config(replica_port)}
+    finally:
+        for data_dir in reversed(started):
+            run_pg_tool(pg_bin, "pg_ctl", "-D", str(data_dir), "-m", "fast", "-w", "stop")
+
+
+@pytest.fixture(scope="session")
+def primary_engine(pg_pair: Dict[str, Dict[str, Optional[str]]]) -> Iterator[Engine]:
+    engine = create_db_engine(pg_pair["primary"])
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def replica_engine(
+    pg_pair: Dict[str, Dict[str, Optional[str]]], primary_engine: Engine
+) -> Iterator[Engine]:
+    engine = create_db_engine(pg_pair["replica"])
+    wait_for_replica(primary_engine, engine)
+    yield engine
+    engine.dispose()
+
+
+def wait_for_replica(primary: Engine, replica: Engine, timeout: float = 30.0) -> None:
+    """Block until the replica has replayed everything written on the primary."""
+    with primary.connect() as conn:
+        target_lsn = conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+
+    deadline = time.monotonic() + timeout
+    with replica.connect() as conn:
+        while time.monotonic() < deadline:
+            caught_up = conn.execute(
+                text("SELECT pg_wal_lsn_diff(pg_last_wal_replay_lsn(), :lsn) >= 0"),
+                {"lsn": target_lsn},
+            ).scalar()
+            if caught_up:
+                return
+            time.sleep(0.05)
+    raise TimeoutError(f"Replica did not reach {target_lsn} within {timeout} seconds")
+
+
+def truncate_tables(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("TRUNCATE orders, products"))
+
+
+def populate(engine: Engine, size: int) -> None:
+    """Fill products and orders with `size` rows each, unless already done."""
+    with engine.connect() as conn:
+        product_count = conn.execute(text("SELECT count(*) FROM products")).scalar()
+        order_count = conn.execute(text("SELECT count(*) FROM orders")).scalar()
+    if product_count == size and order_count == size:
+        return
+
+    truncate_tables(engine)
+    products = generate_products(size)
+    with engine.begin() as conn:
+        conn.execute(
+            Product.__table__.insert(),
+            [dict(product, id=uuid.UUID(product["id"])) for product in products],
+        )
+        conn.execute(
+            Order.__table__.insert(),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "product_id": uuid.UUID(products[index]["id"]),
+                    "quantity": index % 10 + 1,
+                }
+                for index in range(size)
+            ],
+        )
+
+
+@pytest.fixture
+def populated(
+    primary_engine: Engine, replica_engine: Engine, dataset_size: int
+) -> int:
+    """Primary and replica holding `dataset_size` products and orders."""
+    populate(primary_engine, dataset_size)
+    wait_for_replica(primary_engine, replica_engine)
+    return dataset_size
+
+
+@pytest.fixture(scope="session")
+def sample_data_path(
+    dataset_size: int, tmp_path_factory: pytest.TempPathFactory
+) -> Path:
+    """A sample data JSON file holding `dataset_size` products."""
+    path = tmp_path_factory.mktemp("data") / f"sample_data_{dataset_size}.json"
+    with open(path, "w") as file:
+        json.dump(generate_products(dataset_size), file)
+    return path
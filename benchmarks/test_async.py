@@ -0,0 +1,184 @@
+"""
+Benchmarks comparing the asyncio tooling on asyncpg with the sync versions.
+
+The lookup benchmarks keep `IN_FLIGHT` product lookups outstanding against
+primary and replica, either from one event loop or from one thread per
+lookup, with the same connection pool size per server. `extra_info`
+records the lookups per second and the connections each run opened.
+"""
+
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import pytest
+from sqlalchemy import Engine, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+import verify_replication
+import verify_replication_async
+from pgtools.aio import get_product_by_id, product_to_dict
+from pgtools.db import create_async_db_engine, create_db_engine
+from pgtools.models import Product
+
+# Lookups outstanding at once, split evenly between primary and replica
+IN_FLIGHT = 200
+
+# Connections per server available to the lookups
+POOL_SIZES = [10, 50]
+
+DbConfig = Dict[str, Optional[str]]
+
+
+@pytest.fixture
+def loop() -> Iterator[asyncio.AbstractEventLoop]:
+    """An event loop for the test; asyncpg connections cannot change loops."""
+    event_loop = asyncio.new_event_loop()
+    yield event_loop
+    event_loop.close()
+
+
+async def dispose(*engines: AsyncEngine) -> None:
+    await asyncio.gather(*[engine.dispose() for engine in engines])
+
+
+def pooled_connections(engine: Engine) -> int:
+    """Number of connections the engine's pool has open."""
+    return engine.pool.checkedin() + engine.pool.checkedout()
+
+
+def product_ids(engine: Engine) -> List[uuid.UUID]:
+    with engine.connect() as conn:
+        return list(conn.execute(select(Product.id).order_by(Product.created_at)).scalars())
+
+
+def lookup_product(engine: Engine, product_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+    """Synchronous counterpart of `pgtools.aio.get_product_by_id`."""
+    with Session(engine) as session:
+        product = session.get(Product, product_id)
+        return product_to_dict(product) if product is not None else None
+
+
+def test_compare_tables_async(
+    benchmark,
+    loop: asyncio.AbstractEventLoop,
+    pg_pair: Dict[str, DbConfig],
+    populated: int,
+) -> None:
+    primary = create_async_db_engine(pg_pair["primary"])
+    replica = create_async_db_engine(pg_pair["replica"])
+    try:
+        result = benchmark(
+            lambda: loop.run_until_complete(
+                verify_replication_async.compare_tables(primary, replica)
+            )
+        )
+        assert result
+        benchmark.extra_info["connections"] = pooled_connections(
+            primary.sync_engine
+        ) + pooled_connections(replica.sync_engine)
+    finally:
+        loop.run_until_complete(dispose(primary, replica))
+
+
+def test_compare_tables_sync(
+    benchmark,
+    pg_pair: Dict[str, DbConfig],
+    populated: int,
+) -> None:
+    primary = create_db_engine(pg_pair["primary"])
+    replica = create_db_engine(pg_pair["replica"])
+    try:
+        result = benchmark(verify_replication.compare_tables, primary, replica)
+        assert result
+        benchmark.extra_info["connections"] = pooled_connections(
+            primary
+        ) + pooled_connections(replica)
+    finally:
+        primary.dispose()
+        replica.dispose()
+
+
+def test_check_replication_lag_async(
+    benchmark,
+    loop: asyncio.AbstractEventLoop,
+    pg_pair: Dict[str, DbConfig],
+    populated: int,
+) -> None:
+    primary = create_async_db_engine(pg_pair["primary"])
+    replica = create_async_db_engine(pg_pair["replica"])
+    try:
+        benchmark(
+            lambda: loop.run_until_complete(
+                verify_replication_async.check_replication_lag(primary, replica)
+            )
+        )
+    finally:
+        loop.run_until_complete(dispose(primary, replica))
+
+
+@pytest.mark.parametrize("pool_size", POOL_SIZES)
+def test_product_lookups_async(
+    benchmark,
+    loop: asyncio.AbstractEventLoop,
+    pg_pair: Dict[str, DbConfig],
+    primary_engine: Engine,
+    populated: int,
+    pool_size: int,
+) -> None:
+    ids = product_ids(primary_engine)
+    engines: List[AsyncEngine] = [
+        create_async_db_engine(pg_pair[role], pool_size=pool_size, max_overflow=0)
+        for role in ("primary", "replica")
+    ]
+
+    async def lookup(index: int) -> Optional[Dict[str, Any]]:
+        async with AsyncSession(engines[index % 2]) as session:
+            return await get_product_by_id(session, ids[index % len(ids)])
+
+    async def round_trip() -> List[Optional[Dict[str, Any]]]:
+        return await asyncio.gather(*[lookup(index) for index in range(IN_FLIGHT)])
+
+    try:
+        products = benchmark(lambda: loop.run_until_complete(round_trip()))
+        assert all(product is not None for product in products)
+        benchmark.extra_info["lookups_per_s"] = IN_FLIGHT / benchmark.stats.stats.mean
+        benchmark.extra_info["connections"] = sum(
+            pooled_connections(engine.sync_engine) for engine in engines
+        )
+        benchmark.extra_info["threads"] = 1
+    finally:
+        loop.run_until_complete(dispose(*engines))
+
+
+@pytest.mark.parametrize("pool_size", POOL_SIZES)
+def test_product_lookups_threads(
+    benchmark,
+    pg_pair: Dict[str, DbConfig],
+    primary_engine: Engine,
+    populated: int,
+    pool_size: int,
+) -> None:
+    ids = product_ids(primary_engine)
+    engines = [
+        create_db_engine(pg_pair[role], pool_size=pool_size, max_overflow=0)
+        for role in ("primary", "replica")
+    ]
+
+    def lookup(index: int) -> Optional[Dict[str, Any]]:
+        return lookup_product(engines[index % 2], ids[index % len(ids)])
+
+    try:
+        with ThreadPoolExecutor(max_workers=IN_FLIGHT) as executor:
+            products = benchmark(lambda: list(executor.map(lookup, range(IN_FLIGHT))))
+        assert all(product is not None for product in products)
+        benchmark.extra_info["lookups_per_s"] = IN_FLIGHT / benchmark.stats.stats.mean
+        benchmark.extra_info["connections"] = sum(
+            pooled_connections(engine) for engine in engines
+        )
+        benchmark.extra_info["threads"] = IN_FLIGHT
+    finally:
+        for engine in engines:
+            engine.dispose()
@@ -0,0 +1,131 @@
+"""Unit tests for decoding the changes streamed by the replication audit."""
+
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+
+from pgtools.audit import PG_EPOCH, PgOutputDecoder, Wal2JsonDecoder, format_lsn, parse_lsn
+
+COMMITTED_AT = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def cstring(value: str) -> bytes:
+    return value.encode() + b"\0"
+
+
+def relation(relation_id: int, name: str, columns: Sequence[str], keys: Sequence[str]) -> bytes:
+    message = b"R" + struct.pack("!I", relation_id) + cstring("public") + cstring(name)
+    message += b"d" + struct.pack("!h", len(columns))
+    for column in columns:
+        message += bytes([column in keys]) + cstring(column) + struct.pack("!Ii", 25, -1)
+    return message
+
+
+def tuple_data(values: Sequence[Optional[str]]) -> bytes:
+    data = struct.pack("!h", len(values))
+    for value in values:
+        if value is None:
+            data += b"n"
+        elif value == "unchanged":
+            data += b"u"
+        else:
+            data += b"t" + struct.pack("!i", len(value.encode())) + value.encode()
+    return data
+
+
+def begin() -> bytes:
+    return b"B" + struct.pack("!qqI", 0, 0, 1)
+
+
+def commit(end_lsn: int) -> bytes:
+    microseconds = (COMMITTED_AT - PG_EPOCH) // timedelta(microseconds=1)
+    return b"C" + struct.pack("!bqqq", 0, end_lsn - 8, end_lsn, microseconds)
+
+
+def test_lsn_round_trip() -> None:
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert format_lsn(parse_lsn("16/B374D848")) == "16/B374D848"
+    assert format_lsn(0) == "0/0"
+
+
+def test_pgoutput_decodes_a_transaction() -> None:
+    decoder = PgOutputDecoder("audit", ["products"])
+    columns = ["id", "name", "price", "description"]
+    messages = [
+        relation(16384, "products", columns, ["id"]),
+        relation(16390, "other", ["id"], ["id"]),
+        begin(),
+        b"I" + struct.pack("!I", 16384) + b"N" + tuple_data(["a", "Lamp", "10", None]),
+        b"U" + struct.pack("!I", 16384) + b"N" + tuple_data(["a", "Lamp", "12", "unchanged"]),
+        b"I" + struct.pack("!I", 16390) + b"N" + tuple_data(["x"]),
+        b"D" + struct.pack("!I", 16384) + b"K" + tuple_data(["b", None, None, None]),
+    ]
+    for message in messages:
+        assert decoder.decode(message, 0) == []
+
+    changes = decoder.decode(commit(0x1000), 0)
+
+    assert [(change.operation, change.key) for change in changes] == [
+        ("insert", ("a",)),
+        ("update", ("a",)),
+        ("delete", ("b",)),
+    ]
+    assert changes[0].values == {"id": "a", "name": "Lamp", "price": "10", "description": None}
+    assert "description" not in changes[1].values  # Unchanged TOAST value
+    assert changes[2].values == {}
+    assert all(change.lsn == 0x1000 for change in changes)
+    assert all(change.committed_at == COMMITTED_AT for change in changes)
+    assert changes[0].describe() == "insert products (id=a) at 0/1000"
+    assert decoder.transaction == []
+
+
+def test_pgoutput_update_with_old_key() -> None:
+    decoder = PgOutputDecoder("audit", ["products"])
+    decoder.decode(relation(1, "products", ["id", "price"], ["id"]), 0)
+
+    old_key = b"K" + tuple_data(["old", None])
+    decoder.decode(begin(), 0)
+    decoder.decode(b"U" + struct.pack("!I", 1) + old_key + b"N" + tuple_data(["new", "5"]), 0)
+    (change,) = decoder.decode(commit(0x2000), 0)
+
+    assert change.key == ("new",)
+    assert change.values == {"id": "new", "price": "5"}
+
+
+def test_wal2json_decodes_a_transaction() -> None:
+    decoder = Wal2JsonDecoder(["products"])
+    messages = [
+        {"action": "B"},
+        {
+            "action": "I",
+            "table": "products",
+            "pk": [{"name": "id", "type": "uuid"}],
+            "columns": [
+                {"name": "id", "value": "a"},
+                {"name": "price", "value": 10},
+                {"name": "active", "value": True},
+            ],
+        },
+        {
+            "action": "D",
+            "table": "products",
+            "pk": [{"name": "id", "type": "uuid"}],
+            "identity": [{"name": "id", "value": "b"}],
+        },
+    ]
+    for message in messages:
+        assert decoder.decode(json.dumps(message).encode(), 0) == []
+
+    commit_message = {"action": "C", "nextlsn": "0/2000", "timestamp": "2025-01-01 12:00:00+00"}
+    changes = decoder.decode(json.dumps(commit_message).encode(), 0)
+
+    assert [(change.operation, change.key) for change in changes] == [
+        ("insert", ("a",)),
+        ("delete", ("b",)),
+    ]
+    assert changes[0].values == {"id": "a", "price": "10", "active": "t"}
+    assert changes[1].values == {}
+    assert all(change.lsn == 0x2000 for change in changes)
+    assert all(change.committed_at == COMMITTED_AT for change in changes)
+    assert "add-tables" in decoder.options()
@@ -0,0 +1,52 @@
+"""Checks that the CLI starts quickly, without its heavy dependencies."""
+
+import subprocess
+import sys
+from typing import Dict, List, Sequence
+
+import pytest
+
+from cli import DEFAULT_IMPORT_BUDGETS_MS, SCRIPT_DIR
+
+# Imported lazily by the subcommands that need them
+HEAVY_MODULES = ["sqlalchemy", "pandas", "streamlit"]
+
+
+def import_times(arguments: Sequence[str]) -> Dict[str, int]:
+    """Run Python with `-X importtime` and return the microseconds per imported module.
+
+    Nested imports are included in the cumulative time of the module that
+    imported them; they are returned with a leading space.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name[1:].rstrip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("arguments", [["--help"], ["verify", "--help"]])
+def test_help_import_time(arguments: List[str]) -> None:
+    startup = import_times(["-c", "pass"])
+    times = import_times(["cli.py", *arguments])
+
+    imported = {name.strip().split(".")[0] for name in times}
+    assert not imported & set(HEAVY_MODULES)
+
+    # Top-level imports caused by the CLI, without the interpreter's own startup
+    total_ms = sum(
+        microseconds
+        for name, microseconds in times.items()
+        if not name.startswith(" ") and name not in startup
+    ) / 1000
+    assert total_ms <= DEFAULT_IMPORT_BUDGETS_MS["cli"]
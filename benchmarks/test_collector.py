@@ -0,0 +1,120 @@
+"""Unit tests for the interval deltas and output of the metrics collector."""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+from sqlalchemy import create_engine
+
+from pgtools.collector import PRIMARY, SOURCES, ColumnarWriter, MetricsCollector
+
+STATEMENTS = next(source for source in SOURCES if source.name == "pg_stat_statements")
+DATABASE = next(source for source in SOURCES if source.name == "pg_stat_database")
+
+
+def statement_row(queryid: str, calls: float) -> Dict[str, Any]:
+    row: Dict[str, Any] = {metric: calls for metric in STATEMENTS.counters}
+    row.update(key=queryid, label=f"query {queryid}")
+    return row
+
+
+def calls(
+    collector: MetricsCollector, row: Dict[str, Any], snapshot: int, interval_s: Optional[float]
+) -> Optional[float]:
+    samples = collector._row_samples(
+        "primary", STATEMENTS, row, datetime.now(timezone.utc), interval_s, snapshot
+    )
+    values = [sample["value"] for sample in samples if sample["metric"] == "calls"]
+    return values[0] if values else None
+
+
+def test_first_sighting_only_sets_baseline() -> None:
+    collector = MetricsCollector({})
+
+    assert calls(collector, statement_row("1", 10), 1, None) is None
+    assert calls(collector, statement_row("1", 25), 2, 5.0) == 15
+    assert calls(collector, statement_row("1", 30), 3, 5.0) == 5
+
+
+def test_counter_reset_counts_from_zero() -> None:
+    collector = MetricsCollector({})
+    calls(collector, statement_row("1", 100), 1, None)
+
+    assert calls(collector, statement_row("1", 7), 2, 5.0) == 7
+
+
+def test_statement_back_in_top_n_gets_new_baseline() -> None:
+    collector = MetricsCollector({})
+    calls(collector, statement_row("1", 10), 1, None)
+    calls(collector, statement_row("1", 20), 2, 5.0)
+
+    # Missing from snapshot 3, so its counters grew over two intervals
+    assert calls(collector, statement_row("1", 90), 4, 5.0) is None
+    assert calls(collector, statement_row("1", 95), 5, 5.0) == 5
+
+
+def test_gauges_are_reported_as_is() -> None:
+    collector = MetricsCollector({})
+    row: Dict[str, Any] = {metric: 1 for metric in DATABASE.counters}
+    row.update(key="postgres", numbackends=12)
+
+    samples = collector._row_samples(
+        "replica", DATABASE, row, datetime.now(timezone.utc), None, 1
+    )
+
+    assert [(s["metric"], s["kind"], s["value"]) for s in samples] == [
+        ("numbackends", "gauge", 12.0)
+    ]
+    assert samples[0]["server"] == "replica"
+    assert samples[0]["label"] is None
+
+
+def test_failing_source_is_retried() -> None:
+    # SQLite has none of the statistics views, but its errors carry no
+    # SQLSTATE, so they are treated like transient failures
+    collector = MetricsCollector({"primary": create_engine("sqlite://")})
+    collector._roles["primary"] = PRIMARY
+
+    assert collector.snapshot("primary") == []
+    assert collector.snapshot("primary") == []
+    assert collector._disabled["primary"] == set()
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrows"])
+def test_columnar_writer_round_trip(tmp_path: Path, suffix: str) -> None:
+    pyarrow = pytest.importorskip("pyarrow")
+    path = tmp_path / f"metrics{suffix}"
+    samples: List[Dict[str, Any]] = [
+        {
+            "ts": datetime(2025, 1, 1, tzinfo=timezone.utc),
+            "server": "primary",
+            "source": "pg_stat_database",
+            "key": "postgres",
+            "label": None,
+            "metric": metric,
+            "kind": "delta",
+            "value": value,
+            "interval_s": 5.0,
+        }
+        for metric, value in (("xact_commit", 120.0), ("blks_hit", 4000.0))
+    ]
+
+    writer = ColumnarWriter(path)
+    writer.write(samples)
+    writer.write(samples[:1])
+    writer.write([])
+    writer.close()
+
+    if suffix == ".parquet":
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(str(path))
+    else:
+        import pyarrow.ipc
+
+        with pyarrow.ipc.open_stream(str(path)) as reader:
+            table = reader.read_all()
+    assert table.num_rows == 3
+    assert table.column("value").to_pylist() == [120.0, 4000.0, 120.0]
+    assert isinstance(table, pyarrow.Table)
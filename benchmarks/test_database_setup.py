@@ -0,0 +1,44 @@
+"""Benchmarks for the data loading and query paths of database_setup.py."""
+
+from pathlib import Path
+
+from sqlalchemy import Engine, text
+
+import database_setup
+from pgtools.summaries import create_summaries, drop_summaries, refresh_summaries
+
+
+def test_load_sample_data(
+    benchmark, primary_engine: Engine, sample_data_path: Path
+) -> None:
+    def empty_tables() -> None:
+        with primary_engine.begin() as conn:
+            conn.execute(text("TRUNCATE orders, products"))
+
+    benchmark.pedantic(
+        database_setup.load_sample_data,
+        args=(primary_engine, sample_data_path),
+        setup=empty_tables,
+        rounds=5,
+    )
+
+
+def test_query_data(benchmark, primary_engine: Engine, populated: int) -> None:
+    benchmark(database_setup.query_data, primary_engine)
+
+
+def test_query_data_from_summaries(benchmark, primary_engine: Engine, populated: int) -> None:
+    create_summaries(primary_engine)
+    refresh_summaries(primary_engine)
+    try:
+        benchmark(database_setup.query_data, primary_engine)
+    finally:
+        drop_summaries(primary_engine)
+
+
+def test_refresh_summaries(benchmark, primary_engine: Engine, populated: int) -> None:
+    create_summaries(primary_engine)
+    try:
+        benchmark(refresh_summaries, primary_engine)
+    finally:
+        drop_summaries(primary_engine)
@@ -0,0 +1,83 @@
+"""Unit tests for the connection setup probe and its report."""
+
+import socket
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+from pgtools.handshake import (
+    PHASES,
+    SSL_REQUEST_CODE,
+    ConnectProfiler,
+    ConnectTiming,
+    probe_handshake,
+)
+
+
+@pytest.fixture
+def server() -> Iterator[Tuple[int, List[bytes]]]:
+    """A local server that answers an SSLRequest with `N`, like `ssl = off`."""
+    listener = socket.create_server(("127.0.0.1", 0))
+    requests: List[bytes] = []
+
+    def serve() -> None:
+        conn, _ = listener.accept()
+        with conn:
+            request = conn.recv(8)
+            requests.append(request)
+            if request:
+                conn.sendall(b"N")
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield listener.getsockname()[1], requests
+    thread.join(timeout=5)
+    listener.close()
+
+
+def config(port: int, sslmode: Optional[str] = None) -> Dict[str, Optional[str]]:
+    return {"host": "127.0.0.1", "port": str(port), "sslmode": sslmode}
+
+
+def test_probe_without_tls_only_times_tcp(server: Tuple[int, List[bytes]]) -> None:
+    port, _ = server
+
+    tcp, tls, tls_sock = probe_handshake(config(port, "disable"), timeout=5)
+
+    assert tcp > 0
+    assert (tls, tls_sock) == (0.0, None)
+
+
+def test_probe_sends_ssl_request(
+    server: Tuple[int, List[bytes]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("PGSSLNEGOTIATION", raising=False)
+    port, requests = server
+
+    with pytest.raises(ConnectionError, match="does not accept SSL"):
+        probe_handshake(config(port), timeout=5)
+
+    assert requests == [struct.pack("!ii", 8, SSL_REQUEST_CODE)]
+
+
+def test_connect_is_setup_without_queries() -> None:
+    timing = ConnectTiming(tcp=0.001, tls=0.002, auth=0.003, first_query=0.5, query=0.5)
+
+    assert timing.connect == pytest.approx(0.006)
+
+
+def test_report_lists_every_phase(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("PGSSLNEGOTIATION", raising=False)
+    profiler = ConnectProfiler(config(5432))
+    for resumed in (False, True, False):
+        timing = ConnectTiming(0.001, 0.002, 0.003, 0.002, 0.001, "TLSv1.3", resumed)
+        profiler.samples.append(timing)
+        for phase in PHASES:
+            profiler.phases[phase].observe(getattr(timing, phase))
+
+    report = profiler.report().splitlines()
+
+    assert [line.split()[0] for line in report[1:-1]] == PHASES
+    assert report[-1] == "TLS: TLSv1.3, SSLRequest negotiation, 1/2 sessions resumed"
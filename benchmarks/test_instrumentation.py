@@ -0,0 +1,137 @@
+"""Unit tests for the latency histograms and query instrumentation."""
+
+import gc
+import weakref
+from typing import Any, Dict
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import pgtools.instrumentation
+from pgtools.instrumentation import (
+    CHECKOUT_WAIT,
+    MAX_STATEMENT_LENGTH,
+    Histogram,
+    QueryInstrumentation,
+    normalize_statement,
+)
+
+
+def test_percentile_is_upper_bound_of_bucket() -> None:
+    histogram = Histogram(buckets=[0.001, 0.01, 0.1])
+    for _ in range(90):
+        histogram.observe(0.0005)
+    for _ in range(10):
+        histogram.observe(0.05)
+
+    assert histogram.percentile(0.5) == 0.001
+    assert histogram.percentile(0.9) == 0.001
+    assert histogram.percentile(0.95) == 0.05  # Capped at the largest value seen
+    assert histogram.count == 100
+    assert histogram.mean == pytest.approx((90 * 0.0005 + 10 * 0.05) / 100)
+
+
+def test_percentile_of_overflow_bucket_is_max() -> None:
+    histogram = Histogram(buckets=[0.001])
+    histogram.observe(0.0001)
+    histogram.observe(2.5)
+
+    assert histogram.percentile(0.99) == 2.5
+    assert histogram.counts == [1, 1]
+
+
+def test_empty_histogram() -> None:
+    histogram = Histogram()
+
+    assert histogram.percentile(0.99) == 0.0
+    assert histogram.summary()["mean_ms"] == 0.0
+
+
+def test_summary_in_milliseconds() -> None:
+    histogram = Histogram(buckets=[0.001, 0.01])
+    histogram.observe(0.004, rows=3)
+    histogram.observe(0.006, rows=-1)
+
+    summary = histogram.summary()
+    assert summary["count"] == 2
+    assert summary["rows"] == 3  # Negative row counts (unknown) are ignored
+    assert summary["total_ms"] == pytest.approx(10.0)
+    assert summary["p99_ms"] == pytest.approx(6.0)
+    assert summary["max_ms"] == pytest.approx(6.0)
+
+
+def test_normalize_statement() -> None:
+    assert normalize_statement("SELECT *\n  FROM products\tWHERE id = %(id)s ") == (
+        "SELECT * FROM products WHERE id = %(id)s"
+    )
+    long_statement = normalize_statement("SELECT " + "x, " * 200 + "y")
+    assert len(long_statement) == MAX_STATEMENT_LENGTH
+    assert long_statement.endswith("...")
+
+
+def test_attach_records_statements() -> None:
+    instrumentation = QueryInstrumentation()
+    engine = instrumentation.attach(create_engine("sqlite://"))
+    instrumentation.attach(engine)  # No-op
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            conn.execute(text("SELECT 1"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing_table"))
+
+    assert instrumentation.statements["SELECT 1"].count == 3
+    assert "SELECT * FROM missing_table" not in instrumentation.statements
+    assert instrumentation.pool[CHECKOUT_WAIT].count >= 1
+    assert "SELECT 1" in instrumentation.report()
+
+
+def test_attach_does_not_keep_engines_alive() -> None:
+    instrumentation = QueryInstrumentation()
+    engine = instrumentation.attach(create_engine("sqlite://"))
+    reference = weakref.ref(engine)
+
+    del engine
+    gc.collect()
+
+    assert reference() is None
+
+
+@pytest.mark.parametrize(
+    "value, enabled", [("1", True), ("Yes", True), ("true", True), ("0", False)]
+)
+def test_environment_flags(monkeypatch: pytest.MonkeyPatch, value: str, enabled: bool) -> None:
+    settings: Dict[str, Any] = {}
+    monkeypatch.setattr(pgtools.instrumentation, "_default", None)
+    monkeypatch.setattr(pgtools.instrumentation, "_env_checked", False)
+    monkeypatch.setattr(pgtools.instrumentation, "enable", lambda **kwargs: settings.update(kwargs))
+    monkeypatch.setenv("DB_INSTRUMENT", value)
+    monkeypatch.setenv("DB_OTEL_METRICS", value)
+
+    pgtools.instrumentation.get_default()
+
+    assert settings.get("opentelemetry", False) == enabled
+
+
+def test_slow_query_log(caplog: pytest.LogCaptureFixture) -> None:
+    instrumentation = QueryInstrumentation(slow_query_ms=0)
+    engine = instrumentation.attach(create_engine("sqlite://"))
+
+    with caplog.at_level("WARNING", logger="pgtools.slow_query"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    assert "Slow query" in caplog.text
+
+
+def test_exporters_receive_measurements() -> None:
+    observed = []
+
+    class Recorder:
+        def observe(self, kind: str, name: str, seconds: float, rows: int) -> None:
+            observed.append((kind, name, seconds, rows))
+
+    instrumentation = QueryInstrumentation(exporters=[Recorder()])
+    instrumentation.record("statement", "SELECT 1", 0.002, 1)
+
+    assert observed == [("statement", "SELECT 1", 0.002, 1)]
@@ -0,0 +1,124 @@
+"""Unit tests for the read balancing policies and the load balancer."""
+
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from sqlalchemy import QueuePool, create_engine, text
+
+import pgtools.replicas
+from pgtools.replicas import (
+    POLICIES,
+    BalancingPolicy,
+    LagAwarePolicy,
+    LeastOutstandingPolicy,
+    LoadBalancer,
+    ReplicaEndpoint,
+    RoundRobinPolicy,
+    make_policy,
+)
+
+
+def endpoints(*lags: Optional[float]) -> List[ReplicaEndpoint]:
+    return [
+        ReplicaEndpoint(f"replica-{index}", create_engine("sqlite://"), lag_seconds=lag)
+        for index, lag in enumerate(lags)
+    ]
+
+
+def test_round_robin_takes_turns() -> None:
+    replicas = endpoints(None, None, None)
+    policy = RoundRobinPolicy()
+
+    chosen = [policy.choose(replicas).name for _ in range(6)]
+
+    assert chosen == ["replica-0", "replica-1", "replica-2"] * 2
+
+
+def test_least_outstanding_prefers_idle_replica() -> None:
+    replicas = endpoints(None, None, None)
+    replicas[0].outstanding = 3
+    replicas[2].outstanding = 1
+
+    assert LeastOutstandingPolicy().choose(replicas).name == "replica-1"
+
+
+def test_least_outstanding_spreads_ties() -> None:
+    replicas = endpoints(None, None)
+    policy = LeastOutstandingPolicy()
+
+    counts = Counter(policy.choose(replicas).name for _ in range(10))
+
+    assert counts == {"replica-0": 5, "replica-1": 5}
+
+
+def test_lag_aware_skips_lagging_replicas() -> None:
+    replicas = endpoints(5.0, 0.1, None)
+    policy = LagAwarePolicy(max_lag_s=1.0)
+
+    assert {policy.choose(replicas).name for _ in range(10)} == {"replica-1", "replica-2"}
+
+
+def test_lag_aware_falls_back_to_least_lagging() -> None:
+    replicas = endpoints(5.0, 2.0, float("inf"))
+
+    assert LagAwarePolicy(max_lag_s=1.0).choose(replicas).name == "replica-1"
+
+
+def test_make_policy() -> None:
+    for name in POLICIES:
+        assert isinstance(make_policy(name), BalancingPolicy)
+    assert make_policy("lag_aware", max_lag_s=3.0).max_lag_s == 3.0  # type: ignore[attr-defined]
+    with pytest.raises(ValueError, match="Unknown balancing policy"):
+        make_policy("random")
+    with pytest.raises(TypeError):
+        BalancingPolicy()  # type: ignore[abstract]
+
+
+def test_load_balancer_counts_reads_and_errors() -> None:
+    balancer = LoadBalancer(endpoints(None, None))
+
+    for _ in range(3):
+        with balancer.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    with pytest.raises(Exception):
+        with balancer.connect() as conn:
+            conn.execute(text("SELECT * FROM missing_table"))
+
+    stats = {row["name"]: row for row in balancer.stats()}
+    assert stats["replica-0"]["requests"] == 2
+    assert stats["replica-1"]["requests"] == 2
+    assert stats["replica-1"]["errors"] == 1
+    assert all(endpoint.outstanding == 0 for endpoint in balancer.endpoints)
+
+
+def test_unreachable_replica_is_never_fresh() -> None:
+    # SQLite cannot run the replay delay query, like a replica that is down
+    balancer = LoadBalancer(endpoints(None))
+
+    assert balancer.refresh_lag() == {"replica-0": float("inf")}
+
+
+def test_lag_monitor_does_not_wait_for_read_pool(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(pgtools.replicas, "REPLAY_DELAY_QUERY", text("SELECT 0.25"))
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'replica.sqlite'}",
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    balancer = LoadBalancer([ReplicaEndpoint("replica-0", engine)])
+
+    # Every read connection is checked out, as under a saturating workload
+    with balancer.connect():
+        assert balancer.refresh_lag() == {"replica-0": 0.25}
+    balancer.stop()
+
+
+def test_load_balancer_needs_a_replica() -> None:
+    with pytest.raises(ValueError):
+        LoadBalancer([])
@@ -0,0 +1,177 @@
+"""Unit tests for the run store, run comparison and the JMeter import."""
+
+import argparse
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List
+
+import pytest
+
+import pgtools.runstore
+from cli import compare_recorded_runs
+from pgtools.runstore import (
+    Comparison,
+    RunStore,
+    compare_runs,
+    import_jmeter_results,
+    read_jmeter_samples,
+)
+
+JTL_HEADER = "timeStamp,elapsed,label,responseCode,success\n"
+
+
+@pytest.fixture
+def store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[RunStore]:
+    # Keep the variables of a local load_test_variables.env out of the runs
+    monkeypatch.setattr(pgtools.runstore, "terraform_vars", lambda: {"MAIN_THREADS": "4"})
+    store = RunStore(tmp_path / "runs.sqlite")
+    yield store
+    store.close()
+
+
+def record(store: RunStore, iterations_per_s: float, p99_ms: float, passed: bool) -> str:
+    run_id = store.start_run("workload", settings={"threads": 4})
+    store.add_result(
+        run_id, "values", {"iterations_per_s": iterations_per_s, "p99_ms": p99_ms, "ok": True}
+    )
+    store.add_verification(run_id, "replica-1", "full", passed)
+    store.finish_run(run_id)
+    return run_id
+
+
+def regressions(comparisons: List[Comparison]) -> List[str]:
+    return [comparison.metric for comparison in comparisons if comparison.regression]
+
+
+def test_runs_are_recorded(store: RunStore) -> None:
+    run_id = record(store, 100.0, 10.0, True)
+
+    run = store.get_run(run_id[:17])
+    assert run["status"] == "ok"
+    assert run["terraform_vars"] == {"MAIN_THREADS": "4"}
+    assert run["settings"] == {"threads": 4}
+    assert store.results(run_id) == {"values": {"iterations_per_s": 100.0, "p99_ms": 10.0}}
+    assert [run["run_id"] for run in store.runs("workload")] == [run_id]
+    with pytest.raises(KeyError):
+        store.get_run("missing")
+
+
+def test_runs_in_recorded_order(store: RunStore) -> None:
+    failed = store.start_run("workload", started_at=datetime(2025, 1, 1, 12, 0))
+    store.finish_run(failed, "failed")
+    older = record(store, 100.0, 10.0, True)
+    # Imported later, but started earlier than the other runs
+    imported = store.start_run("workload", started_at=datetime(2024, 1, 1, 12, 0))
+    store.finish_run(imported)
+    running = store.start_run("workload")
+
+    assert [run["run_id"] for run in store.runs()] == [running, imported, older, failed]
+    assert [run["run_id"] for run in store.runs(status="ok")] == [imported, older]
+    assert [run["run_id"] for run in store.runs(status="ok", before=imported)] == [older]
+    assert store.runs(before=failed) == []
+
+
+def test_compare_within_thresholds(store: RunStore) -> None:
+    baseline = record(store, 100.0, 10.0, True)
+    candidate = record(store, 91.0, 11.9, True)
+
+    comparisons = compare_runs(store, baseline, candidate)
+
+    assert [comparison.metric for comparison in comparisons] == [
+        "iterations_per_s",
+        "p99_ms",
+        "verified",
+    ]
+    assert regressions(comparisons) == []
+    assert comparisons[0].change == pytest.approx(-0.09)
+
+
+def test_compare_flags_regressions(store: RunStore) -> None:
+    baseline = record(store, 100.0, 10.0, True)
+    candidate = record(store, 89.0, 12.1, False)
+
+    assert regressions(compare_runs(store, baseline, candidate)) == [
+        "iterations_per_s",
+        "p99_ms",
+        "verified",
+    ]
+    assert regressions(
+        compare_runs(store, baseline, candidate, max_throughput_drop=0.2, max_p99_increase=0.3)
+    ) == ["verified"]
+    # A failure that was fixed is not a regression
+    assert regressions(compare_runs(store, candidate, baseline)) == []
+
+
+def test_compare_skips_runs_that_did_not_complete(
+    store: RunStore, capsys: pytest.CaptureFixture[str]
+) -> None:
+    baseline = record(store, 100.0, 10.0, True)
+    failed = store.start_run("workload")
+    store.finish_run(failed, "failed")
+    candidate = record(store, 100.0, 10.0, True)
+    store.start_run("workload")  # Still running
+    args = argparse.Namespace(
+        tool="workload", baseline=None, candidate=None, throughput_drop=0.1, p99_increase=0.2
+    )
+
+    assert compare_recorded_runs(args, store) == 0
+
+    output = capsys.readouterr().out
+    assert f"Baseline:  {baseline}" in output
+    assert f"Candidate: {candidate}" in output
+
+
+def test_change_from_zero() -> None:
+    assert Comparison("values", "p99_ms", 0.0, 0.0, False).change == 0.0
+    assert Comparison("values", "p99_ms", 0.0, 1.0, False).change == float("inf")
+
+
+def test_import_jmeter_results(store: RunStore, tmp_path: Path) -> None:
+    path = tmp_path / "results.jtl"
+    path.write_text(
+        JTL_HEADER
+        + "1735732800000,100,write,200,true\n"
+        + "1735732801000,300,write,500,false\n"
+        + "1735732801900,50,write,200,true\n"
+        + "1735732800500,20,read,200,true\n"
+    )
+
+    run_id = import_jmeter_results(store, path, label="jmeter baseline")
+
+    results = store.results(run_id)
+    assert set(results) == {"write", "read"}
+    assert results["write"]["iterations"] == 3
+    assert results["write"]["errors"] == 1
+    assert results["write"]["elapsed_s"] == pytest.approx(1.95)
+    assert results["write"]["max_ms"] == pytest.approx(300.0)
+    run = store.get_run(run_id)
+    assert run["command"] == "jmeter"
+    assert run["label"] == "jmeter baseline"
+    assert run["started_at"] < run["finished_at"]
+
+
+def test_read_jmeter_zip(tmp_path: Path) -> None:
+    path = tmp_path / "results.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("engine1.csv", JTL_HEADER + "1735732800000,100,write,200,true\n")
+        archive.writestr("engine2.csv", JTL_HEADER + "1735732800000,120,write,200,true\n")
+        archive.writestr("report.html", "<html></html>")
+
+    assert [sample["elapsed"] for sample in read_jmeter_samples(path)] == ["100", "120"]
+
+
+def test_jmeter_results_need_columns_and_ms_timestamps(store: RunStore, tmp_path: Path) -> None:
+    path = tmp_path / "results.csv"
+    path.write_text("elapsed,label\n100,write\n")
+    with pytest.raises(ValueError, match="lacks the columns success, timeStamp"):
+        read_jmeter_samples(path)
+
+    path.write_text(JTL_HEADER + "2025/01/01 12:00:00,100,write,200,true\n")
+    with pytest.raises(ValueError, match="milliseconds since the epoch"):
+        import_jmeter_results(store, path)
+
+    path.write_text(JTL_HEADER)
+    with pytest.raises(ValueError, match="no samples"):
+        import_jmeter_results(store, path)
+    assert store.runs() == []
@@ -0,0 +1,113 @@
+"""Unit tests for the SLO checks and the capacity search strategies."""
+
+from typing import List, Optional
+
+import pytest
+from sqlalchemy import create_engine
+
+from pgtools.saturation import SLO, SaturationSearch, StepResult, check_slo
+from pgtools.workload import WorkloadResult
+
+
+def workload_result(
+    per_minute: float, latency_s: float = 0.01, errors: int = 0, iterations: int = 100
+) -> WorkloadResult:
+    result = WorkloadResult(iterations=iterations, errors=errors)
+    result.elapsed = iterations / per_minute * 60
+    for _ in range(iterations):
+        result.latency.observe(latency_s)
+    return result
+
+
+class FakeSearch(SaturationSearch):
+    """Passes every step up to `capacity` writes per minute without running a workload."""
+
+    def __init__(self, capacity: float) -> None:
+        super().__init__(create_engine("sqlite://"), lambda conn, rng: 0)
+        self.capacity = capacity
+
+    def measure(self, write_rate: float, catch_up: bool = True) -> StepResult:
+        step = StepResult(write_rate, 0.0, workload_result(write_rate))
+        if write_rate > self.capacity:
+            step.violations.append("over capacity")
+        self.steps.append(step)
+        return step
+
+    @property
+    def rates(self) -> List[float]:
+        return [step.write_rate for step in self.steps]
+
+
+def test_step_within_slo_passes() -> None:
+    step = StepResult(600, 2400, workload_result(600), reads=workload_result(2400))
+    step.lag = {"max_lag_s": 1.0}
+
+    assert check_slo(SLO(), step) == []
+
+
+def test_every_violation_is_reported() -> None:
+    writes = workload_result(400, latency_s=0.8, errors=5)
+    step = StepResult(600, 2400, writes, reads=workload_result(2400), lag={"max_lag_s": 9.0})
+
+    assert check_slo(SLO(), step) == [
+        "writes p99 800 ms > 500 ms",
+        "writes errors 4.8% > 1.0%",
+        "writes 400/min of 600/min",
+        "lag 9.0 s > 5 s",
+    ]
+
+
+def test_lag_limit_can_be_disabled() -> None:
+    step = StepResult(600, 0, workload_result(600), lag={"max_lag_s": 60.0})
+
+    assert check_slo(SLO(max_lag_s=None), step) == []
+
+
+def test_step_search_stops_at_first_failure() -> None:
+    search = FakeSearch(capacity=250)
+
+    best = search.run(100, 1000, strategy="step")
+
+    assert search.rates == [100, 200, 300]
+    assert best is not None and best.write_rate == 200
+
+
+def test_step_search_stops_at_max_rate() -> None:
+    search = FakeSearch(capacity=1000)
+
+    best = search.run(100, 250, strategy="step", increment=100)
+
+    assert search.rates == [100, 200, 250]
+    assert best is not None and best.write_rate == 250
+
+
+def test_binary_search_bisects_to_precision() -> None:
+    search = FakeSearch(capacity=700)
+
+    best = search.run(100, 10000, strategy="binary", precision=0.05)
+
+    assert search.rates[:5] == [100, 200, 400, 800, 600]
+    assert best is not None and 700 * 0.95 <= best.write_rate <= 700
+    assert all(step.passed == (step.write_rate <= 700) for step in search.steps)
+
+
+def test_search_respects_max_steps() -> None:
+    search = FakeSearch(capacity=700)
+
+    search.run(100, 10000, strategy="binary", precision=0.0001, max_steps=6)
+
+    assert len(search.steps) == 6
+
+
+@pytest.mark.parametrize("capacity, expected", [(50, None), (100, 100)])
+def test_search_at_start_rate(capacity: float, expected: Optional[float]) -> None:
+    best = FakeSearch(capacity).run(100, 100, strategy="binary")
+
+    assert (best.write_rate if best else None) == expected
+
+
+def test_search_rejects_bad_arguments() -> None:
+    with pytest.raises(ValueError, match="Unknown search strategy"):
+        FakeSearch(100).run(100, 200, strategy="random")
+    with pytest.raises(ValueError, match="Rates"):
+        FakeSearch(100).run(200, 100)
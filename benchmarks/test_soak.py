@@ -0,0 +1,154 @@
+"""Unit tests for the soak test statistics and window loop."""
+
+import time
+from typing import List, Optional
+
+import pytest
+from sqlalchemy import create_engine
+
+from pgtools.saturation import SaturationSearch, StepResult
+from pgtools.soak import (
+    PAGE_HEADER_BYTES,
+    TUPLE_OVERHEAD_BYTES,
+    SoakWindow,
+    TableHealth,
+    TableHealthSampler,
+    autovacuum_ran,
+    correlation,
+    drift_report,
+    estimate_bloat_percent,
+    linear_fit,
+    run_soak,
+)
+from pgtools.workload import WorkloadResult
+
+
+def step(started: float, p99_s: float = 0.01) -> StepResult:
+    writes = WorkloadResult(iterations=10, elapsed=1.0)
+    for _ in range(10):
+        writes.latency.observe(p99_s)
+    return StepResult(600, 0, writes, started=started)
+
+
+def window(
+    index: int,
+    p99_s: float,
+    dead_tuples: float,
+    last_autovacuum: Optional[float] = None,
+    server_offset: float = 0.0,
+) -> SoakWindow:
+    """A 60 s window ending at `index * 60`; the server clock is ahead by `server_offset`."""
+    end = index * 60.0
+    health = TableHealth(
+        timestamp=end,
+        server="primary",
+        table="products",
+        metrics={"n_dead_tup": dead_tuples, "last_autovacuum": last_autovacuum},
+        server_time=end + server_offset,
+    )
+    return SoakWindow(index, end, step(end - 60, p99_s), [health])
+
+
+class FixedRateSearch(SaturationSearch):
+    """Holds every window for its full duration, until window `stop_after` is cut short."""
+
+    def __init__(self, stop_after: Optional[int] = None) -> None:
+        super().__init__(create_engine("sqlite://"), lambda conn, rng: 0)
+        self.stop_after = stop_after
+
+    def measure(self, write_rate: float, catch_up: bool = True) -> StepResult:
+        assert not catch_up
+        self.steps.append(step(time.time()))
+        elapsed = self.step_duration
+        if self.stop_after is not None and len(self.steps) >= self.stop_after:
+            elapsed /= 2
+        time.sleep(elapsed)
+        self.steps[-1].writes.elapsed = elapsed
+        return self.steps[-1]
+
+
+def test_linear_fit() -> None:
+    assert linear_fit([0, 1, 2, 3], [1, 3, 5, 7]) == pytest.approx((2.0, 1.0))
+    assert linear_fit([1, 1], [2, 4]) == (0.0, 3.0)
+
+
+def test_correlation() -> None:
+    assert correlation([1, 2, 3], [2, 4, 6]) == pytest.approx(1.0)
+    assert correlation([1, 2, 3], [3, 2, 1]) == pytest.approx(-1.0)
+    assert correlation([1, 2, 3], [5, 5, 5]) is None
+    assert correlation([1], [1]) is None
+
+
+def test_estimate_bloat_percent() -> None:
+    block_size, row_width = 8192, 100
+    rows_per_page = (block_size - PAGE_HEADER_BYTES) // (row_width + TUPLE_OVERHEAD_BYTES)
+    reltuples = rows_per_page * 100
+
+    assert estimate_bloat_percent(block_size, reltuples, 100 * block_size, row_width, 100) == (
+        pytest.approx(0.0, abs=2)
+    )
+    assert estimate_bloat_percent(block_size, reltuples, 200 * block_size, row_width, 100) == (
+        pytest.approx(50.0, abs=2)
+    )
+    # A lower fillfactor leaves room on purpose, which is not bloat
+    assert estimate_bloat_percent(block_size, reltuples, 200 * block_size, row_width, 50) == (
+        pytest.approx(0.0, abs=2)
+    )
+    assert estimate_bloat_percent(block_size, -1, 8192, row_width, 100) is None
+
+
+@pytest.mark.parametrize("server_offset", [0.0, 3600.0, -3600.0])
+def test_autovacuum_ran_uses_server_clock(server_offset: float) -> None:
+    during = window(2, 0.01, 0, last_autovacuum=90 + server_offset, server_offset=server_offset)
+    before = window(2, 0.01, 0, last_autovacuum=30 + server_offset, server_offset=server_offset)
+
+    assert autovacuum_ran(during, "primary", "products")
+    assert not autovacuum_ran(before, "primary", "products")
+    assert not autovacuum_ran(during, "replica", "products")
+    assert not autovacuum_ran(window(2, 0.01, 0), "primary", "products")
+
+
+def test_drift_report() -> None:
+    windows = [
+        window(1, 0.004, 100),
+        window(2, 0.04, 1000, last_autovacuum=100),
+        window(3, 0.4, 5000),
+    ]
+
+    report = drift_report(windows)
+
+    assert set(report) == {"writes"}  # The windows had no reads
+    writes = report["writes"]
+    assert writes["p99_first_ms"] == pytest.approx(4.0)
+    assert writes["p99_last_ms"] == pytest.approx(400.0)
+    assert writes["p99_ms_per_hour"] is not None and writes["p99_ms_per_hour"] > 0
+    assert writes["corr_n_dead_tup"] is not None and writes["corr_n_dead_tup"] > 0.9
+    assert writes["corr_bloat_percent"] is None
+    assert writes["p99_autovacuum_ms"] == pytest.approx(40.0)
+    assert writes["p99_no_autovacuum_ms"] == pytest.approx(202.0)
+
+
+def test_run_soak_runs_windows_until_duration() -> None:
+    seen: List[int] = []
+
+    result = run_soak(
+        FixedRateSearch(),
+        TableHealthSampler({}),
+        600,
+        duration=0.25,
+        window=0.1,
+        on_window=lambda soak_window: seen.append(soak_window.index),
+    )
+
+    assert not result.stopped_early
+    assert seen == [soak_window.index for soak_window in result.windows] == [1, 2, 3]
+    assert result.windows[-1].step.writes.elapsed == pytest.approx(0.05, abs=0.02)
+
+
+def test_run_soak_stops_early_when_a_window_does() -> None:
+    result = run_soak(
+        FixedRateSearch(stop_after=2), TableHealthSampler({}), 600, duration=10, window=0.05
+    )
+
+    assert result.stopped_early
+    assert len(result.windows) == 2
@@ -0,0 +1,34 @@
+"""Benchmarks for the uncached data access functions of streamlit_app.py."""
+
+import pytest
+from sqlalchemy import Engine
+
+import streamlit_app
+
+
+@pytest.fixture
+def app_engine(monkeypatch: pytest.MonkeyPatch, primary_engine: Engine) -> Engine:
+    monkeypatch.setattr(streamlit_app, "init_connection", lambda: primary_engine)
+    monkeypatch.setattr(streamlit_app, "init_read_balancer", lambda: None)
+    return primary_engine
+
+
+def test_get_products(benchmark, app_engine: Engine, populated: int) -> None:
+    products = benchmark(streamlit_app.get_products.__wrapped__)
+    assert len(products) == populated
+
+
+def test_get_product_by_id(benchmark, app_engine: Engine, populated: int) -> None:
+    product_id = streamlit_app.get_products.__wrapped__()[-1]["id"]
+    product = benchmark(streamlit_app.get_product_by_id.__wrapped__, product_id)
+    assert product is not None
+
+
+def test_get_orders(benchmark, app_engine: Engine, populated: int) -> None:
+    orders = benchmark(streamlit_app.get_orders.__wrapped__)
+    assert len(orders) == min(populated, streamlit_app.ORDER_HISTORY_LIMIT)
+
+
+def test_get_order_totals(benchmark, app_engine: Engine, populated: int) -> None:
+    totals = benchmark(streamlit_app.get_order_totals.__wrapped__)
+    assert sum(day["order_count"] for day in totals) == populated
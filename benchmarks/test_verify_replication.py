@@ -0,0 +1,18 @@
+"""Benchmarks for the replication checks of verify_replication.py."""
+
+from sqlalchemy import Engine
+
+import verify_replication
+
+
+def test_compare_tables(
+    benchmark, primary_engine: Engine, replica_engine: Engine, populated: int
+) -> None:
+    result = benchmark(verify_replication.compare_tables, primary_engine, replica_engine)
+    assert result
+
+
+def test_check_replication_lag(
+    benchmark, primary_engine: Engine, replica_engine: Engine
+) -> None:
+    benchmark(verify_replication.check_replication_lag, primary_engine, replica_engine)
@@ -0,0 +1,130 @@
+"""Unit tests for the change watermarks of incremental verification."""
+
+import json
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import Engine, create_engine, insert
+from sqlalchemy.dialects import postgresql
+
+import verify_replication
+
+from pgtools.models import Base, Order, Product
+from pgtools.watermarks import (
+    STATE_VERSION,
+    Watermark,
+    WatermarkStore,
+    changed_rows_filter,
+    pair_key,
+)
+
+
+def render(clause: Any) -> str:
+    return str(
+        clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    )
+
+
+def test_store_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "state.json"
+    pair = pair_key("primary", "replica")
+    store = WatermarkStore(path)
+    assert store.get(pair, "products") is None
+
+    store.set(pair, "products", Watermark("xmin", "1234"))
+    store.save()
+
+    assert pair == "primary -> replica"
+    assert WatermarkStore(path).get(pair, "products") == Watermark("xmin", "1234")
+    assert not path.with_name("state.json.tmp").exists()
+
+
+def test_store_ignores_other_versions(tmp_path: Path) -> None:
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"version": STATE_VERSION + 1, "pairs": {"a": {}}}))
+
+    assert WatermarkStore(path).state == {"version": STATE_VERSION, "pairs": {}}
+
+
+def test_append_filter_is_bounded_by_both_watermarks() -> None:
+    table = Order.__table__
+    previous = Watermark("append", "2025-01-01T12:00:00")
+    current = Watermark("append", "2025-01-01T13:00:00")
+    empty = Watermark("append", "")
+
+    clause = changed_rows_filter(table, previous, current, timedelta(minutes=5))
+
+    assert render(clause) == (
+        "orders.order_date > '2025-01-01 11:55:00'"
+        " AND orders.order_date <= '2025-01-01 13:00:00'"
+    )
+    assert render(changed_rows_filter(table, empty, current)) == (
+        "orders.order_date <= '2025-01-01 13:00:00'"
+    )
+    assert render(changed_rows_filter(table, empty, empty)) == "false"
+
+
+def test_xmin_filter_uses_low_32_bits() -> None:
+    table = Product.__table__
+    epoch = 1 << 32
+
+    clause = changed_rows_filter(
+        table, Watermark("xmin", str(epoch + 100)), Watermark("xmin", str(epoch + 200))
+    )
+
+    assert render(clause) == (
+        "CAST(CAST(xmin AS TEXT) AS BIGINT) >= 100 AND CAST(CAST(xmin AS TEXT) AS BIGINT) < 200"
+    )
+
+
+def test_unusable_watermarks_need_full_verification() -> None:
+    table = Product.__table__
+
+    # Strategy changed, xid wrapped into the next epoch, or went backwards
+    assert changed_rows_filter(table, Watermark("append", ""), Watermark("xmin", "1")) is None
+    assert (
+        changed_rows_filter(table, Watermark("xmin", "100"), Watermark("xmin", str(1 << 32)))
+        is None
+    )
+    assert changed_rows_filter(table, Watermark("xmin", "200"), Watermark("xmin", "100")) is None
+
+
+def test_describe() -> None:
+    assert Watermark("xmin", "42").describe() == "transaction 42"
+    assert Watermark("append", "2025-01-01T12:00:00").describe() == "2025-01-01T12:00:00"
+
+
+def orders_engine(*order_dates: datetime) -> Engine:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Order.__table__),
+            [
+                {"id": uuid.UUID(int=index), "quantity": 1, "order_date": order_date}
+                for index, order_date in enumerate(order_dates)
+            ],
+        )
+    return engine
+
+
+def test_compare_changed_rows_in_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(verify_replication, "CHUNK_ROWS", 2)
+    dates = [datetime(2025, 1, 1, 12, minute) for minute in range(5)]
+    primary = orders_engine(*dates)
+    previous = Watermark("append", "")
+    current = Watermark("append", dates[-1].isoformat())
+
+    # A row the replica does not have yet, written after the current watermark
+    late = orders_engine(*dates, datetime(2025, 1, 1, 13))
+    assert verify_replication.compare_changed_rows(
+        primary, late, "orders", previous, current
+    ) == (5, 5, None)
+
+    lagging = orders_engine(*dates[:3])
+    assert verify_replication.compare_changed_rows(
+        primary, lagging, "orders", previous, current
+    ) == (5, 3, 4)
@@ -0,0 +1,261 @@
+"""Unit tests for the key distributions and the workload driver."""
+
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from cli import fillfactor_percent, fraction, positive_float, positive_int, probability
+from pgtools.models import Product
+from pgtools.workload import (
+    FixedKeys,
+    HotSetKeys,
+    KeyChooser,
+    UniformKeys,
+    ZipfianKeys,
+    batched_update_operation,
+    generate_products,
+    make_key_chooser,
+    run_workload,
+    set_based_update,
+)
+
+KEYS = list(range(100))
+
+
+@pytest.mark.parametrize("distribution", ["fixed", "uniform", "zipf", "hotset"])
+def test_choose_returns_distinct_keys(distribution: str) -> None:
+    chooser = make_key_chooser(distribution, KEYS, rows_per_iteration=4)
+    rng = random.Random(1)
+
+    for _ in range(100):
+        keys = chooser.choose(rng, 4)
+        assert len(keys) == len(set(keys)) == 4
+        assert set(keys) <= set(KEYS)
+
+
+def test_choose_is_capped_at_key_count() -> None:
+    assert sorted(UniformKeys([1, 2, 3]).choose(random.Random(1), 10)) == [1, 2, 3]
+
+
+def test_fixed_keys_are_the_first_keys() -> None:
+    assert FixedKeys(KEYS).choose(random.Random(1), 4) == [0, 1, 2, 3]
+
+
+def test_zipf_prefers_low_ranks() -> None:
+    chooser = ZipfianKeys(KEYS, s=1.0)
+    rng = random.Random(1)
+    counts = Counter(key for _ in range(2000) for key in chooser.choose(rng, 1))
+
+    assert counts[0] > counts[1] > counts[10] > counts[90]
+
+
+def test_steep_zipf_still_finds_distinct_keys() -> None:
+    # With s=8 almost every draw is rank 0, so the rest is sampled
+    keys = ZipfianKeys(list(range(10000)), s=8.0).choose(random.Random(1), 4)
+
+    assert keys[0] == 0
+    assert len(set(keys)) == 4
+
+
+def test_hot_set_receives_its_share() -> None:
+    chooser = HotSetKeys(KEYS, hot_fraction=0.1, hot_probability=0.9)
+    rng = random.Random(1)
+    picks = [key for _ in range(2000) for key in chooser.choose(rng, 1)]
+
+    assert chooser.hot_count == 10
+    assert sum(key < 10 for key in picks) / len(picks) == pytest.approx(0.9, abs=0.03)
+
+
+def test_hot_set_smaller_than_a_batch_does_not_hang() -> None:
+    chooser = HotSetKeys(KEYS, hot_fraction=0.01, hot_probability=0.99)
+
+    keys = chooser.choose(random.Random(1), 4)
+
+    assert keys[0] == 0
+    assert len(set(keys)) == 4
+
+
+@pytest.mark.parametrize("hot_probability, expected", [(1.0, {0, 1}), (0.0, set(KEYS[2:]))])
+def test_hot_set_never_falls_back_outside_its_keys(
+    hot_probability: float, expected: Set[int]
+) -> None:
+    chooser = HotSetKeys(KEYS, hot_fraction=0.02, hot_probability=hot_probability)
+    rng = random.Random(1)
+
+    for _ in range(100):
+        keys = chooser.choose(rng, 4)
+        assert set(keys) <= expected
+        assert len(set(keys)) == min(4, len(expected))
+
+
+def test_make_key_chooser_rejects_bad_options() -> None:
+    with pytest.raises(ValueError, match="hot keys"):
+        make_key_chooser(
+            "hotset", KEYS, hot_fraction=0.01, hot_probability=1.0, rows_per_iteration=4
+        )
+    with pytest.raises(ValueError, match="Unknown key distribution"):
+        make_key_chooser("pareto", KEYS)
+    with pytest.raises(ValueError, match="empty"):
+        make_key_chooser("uniform", [])
+    with pytest.raises(ValueError):
+        HotSetKeys(KEYS, hot_fraction=0)
+    with pytest.raises(TypeError):
+        KeyChooser(KEYS)  # type: ignore[abstract]
+
+
+@pytest.mark.parametrize(
+    "parse, valid, invalid",
+    [
+        (positive_int, "1", "0"),
+        (positive_float, "0.5", "0"),
+        (probability, "1", "1.5"),
+        (fraction, "1", "0"),
+        (fillfactor_percent, "70", "5"),
+        (fillfactor_percent, "100", "101"),
+    ],
+)
+def test_argument_types(parse: Any, valid: str, invalid: str) -> None:
+    assert parse(valid) == float(valid)
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse(invalid)
+
+
+def test_generate_products_is_deterministic() -> None:
+    products = generate_products(3, start=5)
+
+    assert products == generate_products(3, start=5)
+    assert [product["name"] for product in products] == [
+        "Product 000005",
+        "Product 000006",
+        "Product 000007",
+    ]
+    assert len({product["id"] for product in generate_products(1000)}) == 1000
+
+
+def test_products_fillfactor_is_rendered_in_create_table() -> None:
+    table = Product.__table__
+    table.info["storage_parameters"] = {"fillfactor": 70}
+    try:
+        statement = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    finally:
+        table.info.pop("storage_parameters")
+
+    assert statement.rstrip().endswith("WITH (fillfactor = 70)")
+    assert "fillfactor" not in str(CreateTable(table).compile(dialect=postgresql.dialect()))
+
+
+class RecordingConnection:
+    """Stands in for a connection and records the statements executed on it."""
+
+    def __init__(self) -> None:
+        self.executed: List[Tuple[str, Dict[str, Any]]] = []
+
+    def execute(self, statement: Any, parameters: Dict[str, Any]) -> None:
+        self.executed.append((str(statement), parameters))
+
+
+def test_set_based_update_binds_every_row() -> None:
+    statement = str(set_based_update(2))
+
+    assert statement.startswith("UPDATE products AS p SET price = v.price FROM (VALUES ")
+    assert ":id_0" in statement and ":price_1" in statement
+    assert ":id_2" not in statement
+
+
+@pytest.mark.parametrize("mode, statements", [("autocommit", 4), ("transaction", 4), ("values", 1)])
+def test_batched_update_modes(mode: str, statements: int) -> None:
+    keys = [f"key-{index}" for index in (3, 1, 2, 0)]
+    conn = RecordingConnection()
+
+    rows = batched_update_operation(FixedKeys(keys), 4, mode)(conn, random.Random(1))
+
+    assert rows == 4
+    assert len(conn.executed) == statements
+    if mode == "transaction":
+        assert [parameters["id"] for _, parameters in conn.executed] == sorted(keys)
+    if mode == "values":
+        _, parameters = conn.executed[0]
+        assert [parameters[f"id_{index}"] for index in range(4)] == sorted(keys)
+
+
+def test_batched_update_rejects_unknown_mode() -> None:
+    with pytest.raises(ValueError, match="Unknown write mode"):
+        batched_update_operation(FixedKeys(KEYS), mode="copy")
+
+
+def test_run_workload_counts_iterations_and_rows() -> None:
+    engine = create_engine("sqlite://")
+
+    def operation(conn: Any, rng: random.Random) -> int:
+        conn.execute(text("SELECT 1"))
+        return 2
+
+    result = run_workload(engine, operation, threads=2, duration=0.2, seed=1)
+
+    assert result.iterations > 0
+    assert result.rows == 2 * result.iterations
+    assert result.errors == 0
+    assert result.latency.count == result.iterations
+
+
+def test_run_workload_paces_to_rate() -> None:
+    result = run_workload(
+        create_engine("sqlite://"),
+        lambda conn, rng: 1,
+        threads=2,
+        duration=1.0,
+        rate_per_minute=600,
+    )
+
+    assert 6 <= result.iterations <= 12
+
+
+def test_run_workload_counts_failures() -> None:
+    calls: List[int] = []
+
+    def operation(conn: Any, rng: random.Random) -> int:
+        calls.append(1)
+        if len(calls) % 2:
+            raise RuntimeError("boom")
+        return 1
+
+    result = run_workload(
+        create_engine("sqlite://"), operation, threads=1, duration=1.0, rate_per_minute=600
+    )
+
+    assert result.errors > 0
+    assert result.last_error == "boom"
+    assert result.iterations + result.errors == len(calls)
+
+
+def test_run_workload_counts_connection_failures() -> None:
+    # SQLite has no set_config(), so applying the session settings fails
+    result = run_workload(
+        create_engine("sqlite://"),
+        lambda conn, rng: 1,
+        threads=3,
+        duration=0.2,
+        session_settings={"synchronous_commit": "off"},
+    )
+
+    assert result.errors == 3
+    assert result.iterations == 0
+    assert result.last_error is not None and result.last_error.startswith("connect:")
+
+
+def test_run_workload_stops_on_event() -> None:
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    started = time.monotonic()
+
+    run_workload(create_engine("sqlite://"), lambda conn, rng: 1, duration=30, stop_event=stop)
+
+    assert time.monotonic() - started < 5
@@ -0,0 +1,186 @@
+"""
+HTTP/JSON API Service for Azure PostgreSQL Product Management
+
+This service exposes the product and order operations of the Streamlit app
+as a headless async API so the application tier can be load tested over HTTP:
+
+- GET  /health                  Check database connectivity
+- GET  /products                List all products
+- GET  /products/{product_id}   Fetch a single product
+- POST /orders                  Create a new order
+- GET  /orders                  List orders with product details
+
+Run it with:
+    uvicorn api_service:app --app-dir create_database --host 0.0.0.0 --port 8000
+"""
+
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# SQLAlchemy imports
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from pgtools.aio import create_order, get_orders, get_product_by_id, get_products
+from pgtools.config import env_flag, get_db_config
+from pgtools.db import create_async_db_engine, warm_async_pool
+
+# Connection pool sizing for the async engine
+POOL_SIZE = int(os.environ.get("API_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.environ.get("API_MAX_OVERFLOW", "10"))
+
+# Open the whole pool at startup so the first requests do not pay for connecting
+WARM_POOL = env_flag("API_WARM_POOL", default=True)
+
+# Same bounds as the quantity input of the Streamlit order form
+MIN_QUANTITY = 1
+MAX_QUANTITY = 100
+
+
+def create_engine_from_config(config: Dict[str, Optional[str]]) -> AsyncEngine:
+    """Create an async SQLAlchemy engine using the asyncpg driver."""
+    return create_async_db_engine(
+        config, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True
+    )
+
+
+def parse_uuid(value: Any) -> Optional[uuid.UUID]:
+    """Parse a UUID from a request value, returning None if it is invalid."""
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def error_response(status_code: int, message: str) -> JSONResponse:
+    """Build a JSON error response."""
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+async def health(request: Request) -> JSONResponse:
+    """Check that the service can reach the database."""
+    engine: AsyncEngine = request.app.state.engine
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return error_response(503, f"Database unavailable: {e}")
+    return JSONResponse({"status": "ok"})
+
+
+async def list_products(request: Request) -> JSONResponse:
+    """Handle GET /products."""
+    async with request.app.state.sessionmaker() as session:
+        products = await get_products(session)
+    return JSONResponse(products)
+
+
+async def read_product(request: Request) -> JSONResponse:
+    """Handle GET /products/{product_id}."""
+    product_id = parse_uuid(request.path_params["product_id"])
+    if product_id is None:
+        return error_response(400, "Invalid product id")
+
+    async with request.app.state.sessionmaker() as session:
+        product = await get_product_by_id(session, product_id)
+
+    if product is None:
+        return error_response(404, "Product not found")
+    return JSONResponse(product)
+
+
+async def place_order(request: Request) -> JSONResponse:
+    """Handle POST /orders with a JSON body of product_id and quantity."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        return error_response(400, "Request body must be valid JSON")
+    if not isinstance(payload, dict):
+        return error_response(400, "Request body must be a JSON object")
+
+    product_id = parse_uuid(payload.get("product_id"))
+    if product_id is None:
+        return error_response(400, "Invalid product id")
+
+    quantity = payload.get("quantity")
+    if (
+        not isinstance(quantity, int)
+        or isinstance(quantity, bool)
+        or not MIN_QUANTITY <= quantity <= MAX_QUANTITY
+    ):
+        return error_response(
+            400, f"Quantity must be an integer between {MIN_QUANTITY} and {MAX_QUANTITY}"
+        )
+
+    async with request.app.state.sessionmaker() as session:
+        product = await get_product_by_id(session, product_id)
+        if product is None:
+            return error_response(404, "Product not found")
+        if not product["in_stock"]:
+            return error_response(409, "This product is out of stock!")
+
+        order = await create_order(session, product_id, quantity)
+
+    return JSONResponse(order, status_code=201)
+
+
+async def list_orders(request: Request) -> JSONResponse:
+    """Handle GET /orders with an optional limit query parameter."""
+    limit: Optional[int] = None
+    if "limit" in request.query_params:
+        try:
+            limit = int(request.query_params["limit"])
+        except ValueError:
+            return error_response(400, "Limit must be an integer")
+        if limit < 1:
+            return error_response(400, "Limit must be positive")
+
+    async with request.app.state.sessionmaker() as session:
+        orders = await get_orders(session, limit)
+    return JSONResponse(orders)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    """Create the engine on startup and dispose of it on shutdown."""
+    engine = create_engine_from_config(get_db_config("primary"))
+    app.state.engine = engine
+    app.state.sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    if WARM_POOL:
+        try:
+            await warm_async_pool(engine, POOL_SIZE)
+        except Exception as e:
+            # Keep serving; /health reports the database as unavailable
+            print(f"Warning: could not open the connection pool: {e}")
+    try:
+        yield
+    finally:
+        await engine.dispose()
+
+
+routes = [
+    Route("/health", health, methods=["GET"]),
+    Route("/products", list_products, methods=["GET"]),
+    Route("/products/{product_id}", read_product, methods=["GET"]),
+    Route("/orders", place_order, methods=["POST"]),
+    Route("/orders", list_orders, methods=["GET"]),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.environ.get("API_HOST", "0.0.0.0"),
+        port=int(os.environ.get("API_PORT", "8000")),
+    )
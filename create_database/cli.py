@@ -0,0 +1,1727 @@
+"""
+Unified Command Line Interface for the Azure PostgreSQL Tooling
+
+Every tool is available as a subcommand:
+
+    python create_database/cli.py setup        # Create and populate the database
+    python create_database/cli.py seed         # Load the sample data only
+    python create_database/cli.py query        # Print the sample queries
+    python create_database/cli.py verify       # Verify primary/replica replication
+    python create_database/cli.py lag          # Print the current replication lag
+    python create_database/cli.py workload     # Run the price update workload
+    python create_database/cli.py reads        # Run the balanced replica read workload
+    python create_database/cli.py saturate     # Find the highest write/read rate within SLOs
+    python create_database/cli.py soak         # Hold the load for hours and track bloat
+    python create_database/cli.py summaries    # Create and refresh the summary views
+    python create_database/cli.py collect      # Record server statistics to Parquet
+    python create_database/cli.py audit        # Track per-change replication latency
+    python create_database/cli.py connect      # Time TCP, TLS, auth and query separately
+    python create_database/cli.py runs         # List the recorded load test runs
+    python create_database/cli.py compare      # Flag regressions between two recorded runs
+    python create_database/cli.py api          # Start the HTTP/JSON API service
+    python create_database/cli.py importtime   # Check import time against a budget
+
+Heavy dependencies (SQLAlchemy, Streamlit, pandas, Starlette) are only
+imported inside the subcommand that needs them, so frequently repeated
+invocations such as `lag` and `verify` start quickly.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from pgtools.runstore import RunStore
+    from pgtools.saturation import SaturationSearch, StepResult
+    from pgtools.soak import SoakWindow
+    from pgtools.workload import WorkloadResult
+
+# Directory containing the scripts, used as working directory for sub-processes
+SCRIPT_DIR = Path(__file__).parent
+
+# Modules whose import time is checked by default, with their budget in ms
+DEFAULT_IMPORT_BUDGETS_MS = {
+    "cli": 50.0,
+    "verify_replication": 500.0,
+}
+
+
+def positive_int(value: str) -> int:
+    """argparse type for integers of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """argparse type for numbers greater than 0."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+def probability(value: str) -> float:
+    """argparse type for probabilities in [0, 1]."""
+    number = float(value)
+    if not 0 <= number <= 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1, got {value}")
+    return number
+
+
+def fraction(value: str) -> float:
+    """argparse type for fractions in (0, 1]."""
+    number = float(value)
+    if not 0 < number <= 1:
+        raise argparse.ArgumentTypeError(f"must be greater than 0 and at most 1, got {value}")
+    return number
+
+
+def fillfactor_percent(value: str) -> int:
+    """argparse type for table fillfactors, which PostgreSQL limits to 10-100."""
+    number = int(value)
+    if not 10 <= number <= 100:
+        raise argparse.ArgumentTypeError(f"must be between 10 and 100, got {value}")
+    return number
+
+
+def cmd_setup(args: argparse.Namespace) -> int:
+    """Run the full database setup."""
+    import database_setup
+
+    database_setup.main(fillfactor=args.fillfactor)
+    return 0
+
+
+def cmd_seed(args: argparse.Namespace) -> int:
+    """Load the sample data into existing tables."""
+    import database_setup
+    from pgtools.config import get_db_config
+    from pgtools.summaries import create_summaries, refresh_summaries
+
+    database_setup.check_env_vars()
+    engine = database_setup.connect_to_database(get_db_config("primary"))
+    database_setup.load_sample_data(engine)
+
+    if args.products:
+        from pgtools.workload import seed_products
+
+        inserted = seed_products(engine, args.products)
+        print(f"Generated {inserted} additional products for the workload.")
+
+    # Bring the summaries up to date, creating them for tables set up before they existed
+    create_summaries(engine)
+    refresh_summaries(engine)
+    return 0
+
+
+def cmd_query(args: argparse.Namespace) -> int:
+    """Print the sample queries against the primary database."""
+    import database_setup
+    from pgtools.config import get_db_config
+
+    database_setup.check_env_vars()
+    engine = database_setup.connect_to_database(get_db_config("primary"))
+    database_setup.query_data(engine)
+    return 0
+
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """Verify replication between primary and replica."""
+    if args.use_async:
+        if args.incremental:
+            print("Error: --incremental is not supported with --async")
+            return 1
+
+        import verify_replication_async
+
+        results = verify_replication_async.main()
+        mode = "async"
+    else:
+        import verify_replication
+
+        results = verify_replication.main(
+            incremental=args.incremental, state_file=args.state_file
+        )
+        mode = "incremental" if args.incremental else "full"
+
+    if args.recording is not None:
+        store, run_id = args.recording
+        for replica, passed in results.items():
+            store.add_verification(run_id, replica, mode, passed)
+    return 0 if all(results.values()) else 1
+
+
+def cmd_summaries(args: argparse.Namespace) -> int:
+    """Create the materialized summary views and refresh them on a schedule."""
+    import database_setup
+    from pgtools.config import get_db_config
+    from pgtools.summaries import create_summaries, refresh_summaries
+
+    database_setup.check_env_vars()
+    engine = database_setup.connect_to_database(get_db_config("primary"))
+    create_summaries(engine)
+
+    deadline = time.monotonic() + args.duration if args.duration else None
+    while True:
+        try:
+            durations = refresh_summaries(engine, concurrently=not args.blocking)
+        except Exception as e:
+            print(f"Error refreshing summaries: {e}")
+            return 1
+        refreshed = ", ".join(
+            f"{name} {seconds * 1000:.1f} ms" for name, seconds in durations.items()
+        )
+        print(f"{time.strftime('%H:%M:%S')} Refreshed {refreshed}", flush=True)
+
+        if args.interval is None or (deadline is not None and time.monotonic() >= deadline):
+            return 0
+        time.sleep(args.interval)
+
+
+def cmd_lag(args: argparse.Namespace) -> int:
+    """Print the replica lag, optionally repeating every few seconds."""
+    from pgtools.config import ConfigError, get_db_config, missing_env_vars
+    from pgtools.lag import fetch_replica_lag
+
+    try:
+        missing_vars = missing_env_vars("replica")
+    except ConfigError as e:
+        print(f"Warning: {e}")
+        return 1
+    if missing_vars:
+        print(f"Error: Missing database environment variables: {', '.join(missing_vars)}")
+        return 1
+
+    config = get_db_config("replica")
+    iteration = 0
+    while True:
+        try:
+            lag_seconds = fetch_replica_lag(config)
+        except Exception as e:
+            print(f"Error checking replication lag: {e}")
+            return 1
+
+        timestamp = time.strftime("%H:%M:%S")
+        print(f"{timestamp} Replication lag: {lag_seconds or 0} seconds", flush=True)
+
+        iteration += 1
+        if args.watch is None or (args.count and iteration >= args.count):
+            return 0
+        time.sleep(args.watch)
+
+
+def cmd_workload(args: argparse.Namespace) -> int:
+    """Run the price update workload against the primary database.
+
+    Every combination of `--mode` and `--synchronous-commit` runs for the
+    full duration. When the replica is configured, its lag is sampled during
+    each run and the replica has to catch up before the next run starts.
+    """
+    import database_setup
+    from pgtools.config import get_db_config, missing_env_vars
+    from pgtools.db import create_db_engine, warm_pool
+    from pgtools.sampler import LagSampler
+    from pgtools.workload import (
+        batched_update_operation,
+        load_product_keys,
+        make_key_chooser,
+        run_workload,
+        table_update_stats,
+    )
+
+    database_setup.check_env_vars()
+    engine = database_setup.connect_to_database(get_db_config("primary"))
+    keys = load_product_keys(engine)
+    try:
+        chooser = make_key_chooser(
+            args.distribution,
+            keys,
+            zipf_s=args.zipf_s,
+            hot_fraction=args.hot_fraction,
+            hot_probability=args.hot_probability,
+            rows_per_iteration=args.rows_per_iteration,
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    sampler = None
+    if not missing_env_vars("replica"):
+        replica_engine = create_db_engine(get_db_config("replica"), pool_size=1)
+        sampler = LagSampler(replica_engine, primary_engine=engine, interval=args.lag_interval)
+
+    if args.synchronous_commit == "both":
+        synchronous_commit = ["on", "off"]
+    else:
+        synchronous_commit = [args.synchronous_commit]
+    workload_engine = create_db_engine(
+        get_db_config("primary"), pool_size=args.threads, max_overflow=0
+    )
+    if not args.cold:
+        print_warm_up(lambda: warm_pool(workload_engine))
+    runs = []
+    for mode in args.mode:
+        for sync in synchronous_commit:
+            label = f"{mode}, synchronous_commit={sync}"
+            if sampler is not None and runs:
+                print("Waiting for the replica to catch up...")
+                sampler.wait_until_caught_up(timeout=args.catch_up_timeout)
+
+            print(
+                f"\nRunning {args.distribution} price updates ({label}) over "
+                f"{len(keys)} products with {args.threads} threads "
+                f"for {args.duration} seconds..."
+            )
+            before = table_update_stats(engine)
+            started = time.time()
+            if sampler is not None:
+                sampler.start()
+            try:
+                result = run_workload(
+                    workload_engine,
+                    batched_update_operation(chooser, args.rows_per_iteration, mode),
+                    threads=args.threads,
+                    duration=args.duration,
+                    rate_per_minute=args.rate,
+                    autocommit=mode == "autocommit",
+                    seed=args.seed,
+                    session_settings={"synchronous_commit": sync},
+                )
+            finally:
+                if sampler is not None:
+                    sampler.stop()
+            after = table_update_stats(engine)
+
+            print_workload_result(result)
+            updates = after["n_tup_upd"] - before["n_tup_upd"]
+            hot_updates = after["n_tup_hot_upd"] - before["n_tup_hot_upd"]
+            if updates > 0:
+                print(f"HOT updates: {hot_updates}/{updates} ({hot_updates / updates:.0%})")
+            print(f"Dead tuples in products: {after['n_dead_tup']}")
+            lag = sampler.summary(since=started) if sampler is not None else None
+            samples = [s for s in sampler.samples if s.timestamp >= started] if sampler else []
+            record_result(args, label, result, lag, samples)
+            runs.append((label, result, lag))
+
+    if len(runs) > 1:
+        print_mode_comparison(runs)
+    return 0 if all(result.errors == 0 for _, result, _ in runs) else 1
+
+
+def record_result(
+    args: argparse.Namespace,
+    name: str,
+    result: "WorkloadResult",
+    extra: Optional[Dict[str, Any]] = None,
+    lag_samples: Sequence[Any] = (),
+) -> None:
+    """Store a workload result in the run store when the run is recorded."""
+    if args.recording is None:
+        return
+    store, run_id = args.recording
+    store.add_result(run_id, name, {**result.summary(), **(extra or {})})
+    store.add_histogram(run_id, name, result.latency)
+    if lag_samples:
+        store.add_lag_samples(run_id, name, lag_samples)
+
+
+def print_warm_up(warm: Callable[[], int]) -> None:
+    """Pre-open connection pools and report how long connecting took."""
+    start = time.perf_counter()
+    connections = warm()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Opened {connections} connections in parallel in {elapsed_ms:.0f} ms")
+
+
+def print_mode_comparison(runs: List[Tuple[str, "WorkloadResult", Optional[Dict]]]) -> None:
+    """Print throughput and replica lag of several workload runs side by side."""
+    print("\n=== Write Mode Comparison ===")
+    print(
+        f"{'rows/s':>9} {'p99 ms':>8} {'errors':>7} {'mean lag s':>11} "
+        f"{'max lag s':>10} {'max lag MB':>11}  mode"
+    )
+    for label, result, lag in runs:
+        stats = result.summary()
+        if lag is None:
+            lag_columns = f"{'-':>11} {'-':>10} {'-':>11}"
+        else:
+            lag_columns = (
+                f"{lag['mean_lag_s']:>11.3f} {lag['max_lag_s']:>10.3f} "
+                f"{lag['max_lag_bytes'] / 1024 / 1024:>11.2f}"
+            )
+        print(
+            f"{stats['rows_per_s']:>9.1f} {stats['p99_ms']:>8.1f} "
+            f"{stats['errors']:>7} {lag_columns}  {label}"
+        )
+
+
+def print_workload_result(result: "WorkloadResult") -> None:
+    """Print throughput, latency and errors of a workload run."""
+    stats = result.summary()
+    print("\n=== Workload Results ===")
+    print(f"Iterations: {stats['iterations']} ({stats['iterations_per_s']:.1f}/s)")
+    print(f"Rows written: {stats['rows']} ({stats['rows_per_s']:.1f}/s)")
+    print(
+        f"Latency: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+        f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms"
+    )
+    print(f"Errors: {stats['errors']} ({stats['error_rate']:.1%})")
+    if result.last_error:
+        print(f"Last error: {result.last_error}")
+
+
+def cmd_reads(args: argparse.Namespace) -> int:
+    """Run the replica read workload over a growing set of replicas.
+
+    Every combination of replica count and balancing policy runs for the full
+    duration, so the table printed at the end shows how read throughput
+    scales with the number of replicas and how much the policy matters.
+    """
+    import verify_replication
+    from pgtools.config import get_replica_configs
+    from pgtools.replicas import LoadBalancer, make_policy
+    from pgtools.workload import product_read_operation, run_workload
+
+    verify_replication.check_env_vars()
+    configs = get_replica_configs()
+    counts = sorted({min(count, len(configs)) for count in args.replicas or [len(configs)]})
+
+    runs = []
+    for count in counts:
+        for policy in args.policy:
+            balancer = LoadBalancer.from_configs(
+                configs[:count],
+                make_policy(policy, args.max_lag_s),
+                pool_size=args.threads,
+                max_overflow=0,
+            )
+            if not args.cold:
+                print_warm_up(balancer.warm)
+            if policy == "lag_aware":
+                balancer.start_lag_monitor(args.lag_interval)
+            print(
+                f"\nReading products from {count} replica(s) with {policy} balancing, "
+                f"{args.threads} threads for {args.duration} seconds..."
+            )
+            try:
+                result = run_workload(
+                    balancer,
+                    product_read_operation(),
+                    threads=args.threads,
+                    duration=args.duration,
+                    rate_per_minute=args.rate,
+                    connection_per_iteration=True,
+                )
+            finally:
+                balancer.stop()
+
+            print_workload_result(result)
+            print(f"{'reads':>7} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'lag s':>7}  replica")
+            for stats in balancer.stats():
+                lag = f"{stats['lag_s']:.3f}" if stats["lag_s"] is not None else "-"
+                print(
+                    f"{stats['requests']:>7} {stats['errors']:>7} {stats['p50_ms']:>8.1f} "
+                    f"{stats['p99_ms']:>8.1f} {lag:>7}  {stats['name']}"
+                )
+            for endpoint in balancer.endpoints:
+                endpoint.engine.dispose()
+            record_result(args, f"{count} replicas, {policy}", result)
+            if args.recording is not None:
+                store, run_id = args.recording
+                for stats in balancer.stats():
+                    store.add_result(
+                        run_id, f"{count} replicas, {policy}, {stats['name']}", stats
+                    )
+            runs.append((count, policy, result))
+
+    if len(runs) > 1:
+        print("\n=== Read Scaling ===")
+        print(f"{'replicas':>8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}  policy")
+        for count, policy, result in runs:
+            stats = result.summary()
+            print(
+                f"{count:>8} {stats['iterations_per_s']:>9.1f} {stats['p50_ms']:>8.1f} "
+                f"{stats['p99_ms']:>8.1f} {stats['errors']:>7}  {policy}"
+            )
+    return 0 if all(result.errors == 0 for _, _, result in runs) else 1
+
+
+def build_mixed_workload(
+    args: argparse.Namespace, step_duration: float, catch_up_timeout: float = 120.0
+) -> Tuple["SaturationSearch", Any]:
+    """Set up the writes on the primary and the reads balanced over the replicas.
+
+    Shared by `saturate` and `soak`. Returns the workload and a separate
+    engine on the primary for statistics queries. Raises ValueError when the
+    key distribution options do not fit the products.
+    """
+    import database_setup
+    from pgtools.config import get_db_config, get_replica_configs, missing_env_vars
+    from pgtools.db import create_db_engine, warm_pool
+    from pgtools.replicas import LoadBalancer, make_policy
+    from pgtools.sampler import LagSampler
+    from pgtools.saturation import SLO, SaturationSearch
+    from pgtools.workload import (
+        batched_update_operation,
+        load_product_keys,
+        make_key_chooser,
+        product_read_operation,
+    )
+
+    database_setup.check_env_vars()
+    engine = database_setup.connect_to_database(get_db_config("primary"))
+    keys = load_product_keys(engine)
+    chooser = make_key_chooser(
+        args.distribution,
+        keys,
+        zipf_s=args.zipf_s,
+        hot_fraction=args.hot_fraction,
+        hot_probability=args.hot_probability,
+        rows_per_iteration=args.rows_per_iteration,
+    )
+
+    sampler = None
+    balancer = None
+    if not missing_env_vars("replica"):
+        replica_engine = create_db_engine(get_db_config("replica"), pool_size=1)
+        sampler = LagSampler(replica_engine, primary_engine=engine, interval=args.lag_interval)
+        if args.read_ratio > 0:
+            balancer = LoadBalancer.from_configs(
+                get_replica_configs(),
+                make_policy(args.policy),
+                pool_size=args.read_threads,
+                max_overflow=0,
+            )
+    else:
+        print("No replica configured: running writes only, without lag or read SLOs")
+
+    workload_engine = create_db_engine(
+        get_db_config("primary"), pool_size=args.write_threads, max_overflow=0
+    )
+    if not args.cold:
+        print_warm_up(lambda: warm_pool(workload_engine))
+        if balancer is not None:
+            print_warm_up(balancer.warm)
+
+    workload = SaturationSearch(
+        workload_engine,
+        batched_update_operation(chooser, args.rows_per_iteration, args.mode),
+        write_threads=args.write_threads,
+        balancer=balancer,
+        read_operation=product_read_operation(),
+        read_threads=args.read_threads,
+        read_ratio=args.read_ratio,
+        sampler=sampler,
+        slo=SLO(
+            p99_ms=args.p99_ms,
+            max_error_rate=args.max_error_rate,
+            max_lag_s=args.max_lag_s,
+            min_achieved=args.min_achieved,
+        ),
+        step_duration=step_duration,
+        autocommit=args.mode == "autocommit",
+        catch_up_timeout=catch_up_timeout,
+        seed=args.seed,
+    )
+    return workload, engine
+
+
+def close_mixed_workload(workload: "SaturationSearch") -> None:
+    """Stop the read balancer and close the pools of a mixed workload."""
+    if workload.balancer is not None:
+        workload.balancer.stop()
+        for endpoint in workload.balancer.endpoints:
+            endpoint.engine.dispose()
+    workload.engine.dispose()
+
+
+def record_step(
+    args: argparse.Namespace, step: "StepResult", writes: str, reads: str, sampler: Any
+) -> None:
+    """Store the writes and reads of a saturation step or soak window under these names."""
+    extra = {"target_per_min": step.write_rate, "passed": float(step.passed)}
+    lag_samples = []
+    if step.lag is not None and sampler is not None:
+        extra.update(step.lag)
+        lag_samples = [s for s in sampler.samples if s.timestamp >= step.started]
+    record_result(args, writes, step.writes, extra, lag_samples)
+    if step.reads is not None:
+        record_result(
+            args,
+            reads,
+            step.reads,
+            {"target_per_min": step.read_rate, "passed": float(step.passed)},
+        )
+
+
+def cmd_saturate(args: argparse.Namespace) -> int:
+    """Ramp the write and read rates until a step violates the SLOs.
+
+    Writes go to the primary and reads are balanced over the configured
+    replicas at `--read-ratio` times the write rate. The highest rate that
+    stayed within the SLOs is what `main_writes_per_minute` and
+    `replica_reads_per_minute` can be set to, for this client.
+    """
+    try:
+        search, _ = build_mixed_workload(args, args.step_duration, args.catch_up_timeout)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    slo = search.slo
+
+    def report_step(step: "StepResult") -> None:
+        print_saturation_step(step)
+        record_step(
+            args,
+            step,
+            f"writes @ {step.write_rate:.0f}/min",
+            f"reads @ {step.read_rate:.0f}/min",
+            search.sampler,
+        )
+
+    search.on_step = report_step
+    print(
+        f"Searching from {args.start_rate:g} to {args.max_rate:g} writes/min ({args.strategy}), "
+        f"{args.step_duration:g} seconds per step, SLO: p99 <= {slo.p99_ms:g} ms, "
+        f"errors <= {slo.max_error_rate:.1%}, lag <= {slo.max_lag_s:g} s"
+    )
+    print(f"\n{SATURATION_HEADER}")
+    try:
+        best = search.run(
+            args.start_rate,
+            args.max_rate,
+            strategy=args.strategy,
+            increment=args.increment,
+            factor=args.factor,
+            precision=args.precision,
+            max_steps=args.max_steps,
+        )
+    finally:
+        close_mixed_workload(search)
+
+    print("\n=== Saturation Search ===")
+    if best is None:
+        print(f"❌ Even {args.start_rate:g} writes/min violates the SLOs; lower --start-rate")
+        return 1
+    saturated = any(not step.passed for step in search.steps)
+    rates = f"{best.write_rate:.0f} writes/min"
+    if best.reads is not None:
+        rates += f" and {best.read_rate:.0f} reads/min"
+    if saturated:
+        print(f"✅ Highest rate within the SLOs: {rates}")
+    else:
+        print(f"✅ All steps up to {rates} stayed within the SLOs; raise --max-rate to go further")
+    print(f"   main_writes_per_minute = {best.write_rate:.0f}")
+    if best.reads is not None:
+        print(f"   replica_reads_per_minute = {best.read_rate:.0f}")
+    if args.recording is not None:
+        record_result(args, "sustainable writes", best.writes, {"target_per_min": best.write_rate})
+        if best.reads is not None:
+            record_result(
+                args, "sustainable reads", best.reads, {"target_per_min": best.read_rate}
+            )
+    return 0
+
+
+SATURATION_HEADER = (
+    f"{'writes/min':>10} {'achieved':>9} {'p99 ms':>8} {'reads/min':>10} {'achieved':>9} "
+    f"{'p99 ms':>8} {'max lag s':>10}  result"
+)
+
+
+def print_saturation_step(step: "StepResult") -> None:
+    """Print one step of a saturation search as a row under `SATURATION_HEADER`."""
+    writes = step.writes.summary()
+    if step.reads is not None:
+        reads = step.reads.summary()
+        read_columns = (
+            f"{step.read_rate:>10.0f} {reads['iterations_per_s'] * 60:>9.0f} "
+            f"{reads['p99_ms']:>8.1f}"
+        )
+    else:
+        read_columns = f"{'-':>10} {'-':>9} {'-':>8}"
+    lag = f"{step.lag['max_lag_s']:.2f}" if step.lag is not None else "-"
+    result = "ok" if step.passed else "; ".join(step.violations)
+    print(
+        f"{step.write_rate:>10.0f} {writes['iterations_per_s'] * 60:>9.0f} "
+        f"{writes['p99_ms']:>8.1f} {read_columns} {lag:>10}  {result}"
+    )
+
+
+def cmd_soak(args: argparse.Namespace) -> int:
+    """Hold the write and read workload for hours and watch for degradation.
+
+    The load runs in `--window`-second windows at a fixed rate. After every
+    window, dead tuples, autovacuum activity, size and bloat of `--tables`
+    are sampled on the primary and the replica, and the report at the end
+    correlates the latency drift with them.
+    """
+    import logging
+
+    from pgtools.soak import TableHealthSampler, drift_report, run_soak
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(message)s")
+    try:
+        workload, engine = build_mixed_workload(args, args.window)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    engines = {"primary": engine}
+    if workload.sampler is not None:
+        engines["replica"] = workload.sampler.replica_engine
+    health = TableHealthSampler(engines, args.tables)
+    table = args.tables[0]
+
+    windows: List["SoakWindow"] = []
+
+    def report_window(window: "SoakWindow") -> None:
+        windows.append(window)
+        print_soak_window(window, table)
+        record_step(
+            args,
+            window.step,
+            f"window {window.index:03d} writes",
+            f"window {window.index:03d} reads",
+            workload.sampler,
+        )
+
+    print(
+        f"Soaking at {args.rate:g} writes/min and {args.rate * workload.read_ratio:g} reads/min "
+        f"for {args.duration / 3600:g} hours in {args.window:g}-second windows"
+    )
+    print(f"\n{SOAK_HEADER}")
+    code = 0
+    try:
+        result = run_soak(workload, health, args.rate, args.duration, args.window, report_window)
+        if result.stopped_early:
+            print("\nStopped early, reporting the completed windows")
+            code = 130
+    except KeyboardInterrupt:
+        print("\nInterrupted, reporting the completed windows")
+        code = 130
+    finally:
+        close_mixed_workload(workload)
+
+    report = drift_report(windows, "primary", table)
+    print_drift_report(report, table)
+    failed = [window.index for window in windows if not window.step.passed]
+    if failed:
+        print(f"❌ {len(failed)}/{len(windows)} windows violated the SLOs: {failed}")
+    elif windows:
+        print(f"✅ All {len(windows)} windows stayed within the SLOs")
+    if args.recording is not None:
+        store, run_id = args.recording
+        store.add_table_health(run_id, health.samples)
+        for name, series in report.items():
+            store.add_result(run_id, f"{name} drift", series)
+    return code or (1 if failed else 0)
+
+
+SOAK_HEADER = (
+    f"{'hours':>6} {'writes/min':>10} {'p99 ms':>8} {'reads/min':>10} {'p99 ms':>8} "
+    f"{'max lag s':>10} {'dead tup':>9} {'bloat %':>11} {'table MB':>9} {'index MB':>9}  result"
+)
+
+
+def print_soak_window(window: "SoakWindow", table: str) -> None:
+    """Print one soak window as a row under `SOAK_HEADER`.
+
+    Bloat is shown for the primary and the replica; the other health
+    columns are the primary's.
+    """
+    from pgtools.soak import autovacuum_ran, table_health
+
+    writes = window.step.writes.summary()
+    if window.step.reads is not None:
+        reads = window.step.reads.summary()
+        read_columns = f"{reads['iterations_per_s'] * 60:>10.0f} {reads['p99_ms']:>8.1f}"
+    else:
+        read_columns = f"{'-':>10} {'-':>8}"
+    lag = f"{window.step.lag['max_lag_s']:.2f}" if window.step.lag is not None else "-"
+    primary = table_health(window, "primary", table)
+    replica = table_health(window, "replica", table)
+
+    def value(metrics: Dict[str, Optional[float]], name: str, spec: str = ".0f") -> str:
+        scale = 2**20 if name.endswith("_bytes") else 1
+        return format(metrics[name] / scale, spec) if metrics.get(name) is not None else "-"
+
+    notes = ["autovacuum"] if autovacuum_ran(window, "primary", table) else []
+    notes.extend(window.step.violations)
+    print(
+        f"{window.elapsed / 3600:>6.2f} {writes['iterations_per_s'] * 60:>10.0f} "
+        f"{writes['p99_ms']:>8.1f} {read_columns} {lag:>10} "
+        f"{value(primary, 'n_dead_tup'):>9} "
+        f"{value(primary, 'bloat_percent') + '/' + value(replica, 'bloat_percent'):>11} "
+        f"{value(primary, 'table_bytes', '.1f'):>9} {value(primary, 'index_bytes', '.1f'):>9}  "
+        f"{'; '.join(notes) or 'ok'}"
+    )
+
+
+def print_drift_report(report: Dict[str, Dict[str, Optional[float]]], table: str) -> None:
+    """Print the latency drift and its correlation with the table health."""
+    from pgtools.soak import CORRELATED_METRICS
+
+    def number(value: Optional[float], spec: str) -> str:
+        return format(value, spec) if value is not None else "-"
+
+    print(f"\n=== Latency Drift ({table} on the primary) ===")
+    print(
+        f"{'series':<7} {'first p99':>10} {'last p99':>9} {'ms/hour':>8} "
+        f"{'autovacuum':>11} {'otherwise':>10}"
+    )
+    for name, series in report.items():
+        print(
+            f"{name:<7} {number(series['p99_first_ms'], '.1f'):>10} "
+            f"{number(series['p99_last_ms'], '.1f'):>9} "
+            f"{number(series['p99_ms_per_hour'], '+.2f'):>8} "
+            f"{number(series['p99_autovacuum_ms'], '.1f'):>11} "
+            f"{number(series['p99_no_autovacuum_ms'], '.1f'):>10}"
+        )
+    print("\nCorrelation of p99 latency with:")
+    print(f"{'series':<7} " + " ".join(f"{metric:>13}" for metric in CORRELATED_METRICS))
+    for name, series in report.items():
+        print(
+            f"{name:<7} "
+            + " ".join(
+                f"{number(series[f'corr_{metric}'], '+.2f'):>13}" for metric in CORRELATED_METRICS
+            )
+        )
+
+
+def cmd_collect(args: argparse.Namespace) -> int:
+    """Snapshot server statistics on primary and replica into a columnar file."""
+    import logging
+
+    import verify_replication
+    from pgtools.collector import ColumnarWriter, MetricsCollector
+    from pgtools.config import get_db_config
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(message)s", level=logging.INFO)
+    verify_replication.check_env_vars()
+    engines = {
+        "primary": verify_replication.connect_to_database(get_db_config("primary"), "PRIMARY"),
+        "replica": verify_replication.connect_to_database(get_db_config("replica"), "REPLICA"),
+    }
+
+    writer = ColumnarWriter(args.output)
+    collector = MetricsCollector(
+        engines, writer, interval=args.interval, top_statements=args.top_statements
+    )
+    print(f"Collecting server metrics every {args.interval} seconds into {args.output}")
+    try:
+        collector.run(duration=args.duration)
+    finally:
+        writer.close()
+    print("Metrics collection completed!")
+    return 0
+
+
+def cmd_audit(args: argparse.Namespace) -> int:
+    """Stream changes from the primary and report when they reach the replica."""
+    import logging
+
+    import verify_replication
+    from pgtools.audit import ReplicationAudit
+    from pgtools.config import get_db_config
+
+    logging.basicConfig(format="%(asctime)s %(name)s %(message)s")
+    verify_replication.check_env_vars()
+    replica_engine = verify_replication.connect_to_database(get_db_config("replica"), "REPLICA")
+    audit = ReplicationAudit(
+        get_db_config("primary"),
+        replica_engine,
+        decoder=args.decoder,
+        tables=args.tables,
+        publication=args.publication,
+        max_tracked=args.max_tracked,
+        late_after=args.late_ms / 1000,
+        missing_after=args.missing_after,
+    )
+    try:
+        audit.start()
+    except Exception as e:
+        print(f"Error starting the replication audit: {e}")
+        return 1
+
+    print(f"Auditing changes to {', '.join(args.tables)} with {args.decoder}...")
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(args.report_interval)
+            stats = audit.summary()
+            print(
+                f"{time.strftime('%H:%M:%S')} decoded {stats['decoded']}, "
+                f"visible {stats['visible']}, late {stats['late']}, "
+                f"missing {stats['missing']}, not replayed {stats['not_replayed']}, "
+                f"pending {stats['pending']}, "
+                f"p99 {stats['p99_ms']:.1f} ms",
+                flush=True,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        audit.stop()
+
+    stats = audit.summary()
+    print("\n=== Replication Audit ===")
+    for name in (
+        "decoded",
+        "visible",
+        "late",
+        "superseded",
+        "missing",
+        "not_replayed",
+        "evicted",
+        "pending",
+    ):
+        print(f"{name.replace('_', ' ').capitalize()}: {stats[name]}")
+    print(
+        f"Visibility latency: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+        f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms"
+    )
+    if audit.problems:
+        print("\nMost recent late, missing or not replayed changes:")
+        for status, change in list(audit.problems)[-args.show:]:
+            print(f"  {status}: {change.describe()}")
+    if audit.last_error:
+        print(f"Last error: {audit.last_error}")
+    lost = stats["missing"] + stats["not_replayed"]
+    return 0 if lost == 0 and audit.last_error is None else 1
+
+
+def cmd_connect(args: argparse.Namespace) -> int:
+    """Measure connection setup split into TCP, TLS, authentication and queries."""
+    from pgtools.config import ConfigError, get_db_config, get_replica_configs, missing_env_vars
+    from pgtools.handshake import ConnectProfiler
+
+    try:
+        missing_vars = missing_env_vars(*args.role)
+    except ConfigError as e:
+        print(f"Warning: {e}")
+        return 1
+    if missing_vars:
+        print(f"Error: Missing database environment variables: {', '.join(missing_vars)}")
+        return 1
+
+    configs = []
+    for role in args.role:
+        if role == "replica":
+            configs.extend(("replica", config) for config in get_replica_configs())
+        else:
+            configs.append((role, get_db_config(role)))
+
+    for role, config in configs:
+        print(f"\n=== {role.capitalize()} {config['host']}: {args.samples} connections ===")
+        try:
+            profiler = ConnectProfiler(config).run(args.samples, args.interval)
+        except Exception as e:
+            print(f"Error connecting to {config['host']}: {e}")
+            return 1
+        print(profiler.report())
+    return 0
+
+
+def cmd_runs(args: argparse.Namespace) -> int:
+    """List recorded runs with their Terraform variables and git revision."""
+    from pgtools.runstore import RunStore
+
+    if not args.run_store.exists():
+        print(f"No runs recorded in {args.run_store}")
+        return 1
+    store = RunStore(args.run_store)
+    runs = store.runs(command=args.tool, limit=args.limit)
+    print(f"{'run id':<22} {'started':<19} {'command':<9} {'status':<11} {'git':<8}  settings")
+    for run in runs:
+        revision = (run["git_revision"] or "-")[:7] + ("+" if run["git_dirty"] else "")
+        variables = " ".join(
+            f"{name.lower()}={value}" for name, value in run["terraform_vars"].items()
+        )
+        label = f"[{run['label']}] " if run["label"] else ""
+        print(
+            f"{run['run_id']:<22} {run['started_at']:<19} {run['command']:<9} "
+            f"{run['status'] or '-':<11} {revision:<8}  {label}{variables}"
+        )
+    store.close()
+    return 0
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    """Compare two recorded runs and flag throughput and p99 regressions.
+
+    Without run ids, the latest run is compared with the one before it of
+    the same command.
+    """
+    from pgtools.runstore import RunStore
+
+    if not args.run_store.exists():
+        print(f"No runs recorded in {args.run_store}")
+        return 1
+    store = RunStore(args.run_store)
+    try:
+        return compare_recorded_runs(args, store)
+    finally:
+        store.close()
+
+
+def compare_recorded_runs(args: argparse.Namespace, store: "RunStore") -> int:
+    """Pick the baseline and candidate runs from `store` and compare them."""
+    from pgtools.runstore import compare_runs
+
+    try:
+        if args.candidate:
+            candidate = store.get_run(args.candidate)
+        else:
+            latest = store.runs(command=args.tool, limit=1, status="ok")
+            if not latest:
+                print("No completed runs recorded")
+                return 1
+            candidate = latest[0]
+        if args.baseline:
+            baseline = store.get_run(args.baseline)
+        else:
+            previous = store.runs(
+                command=candidate["command"], limit=1, status="ok", before=candidate["run_id"]
+            )
+            if not previous:
+                print(
+                    f"No earlier completed {candidate['command']} run"
+                    f" to compare {candidate['run_id']} to"
+                )
+                return 1
+            baseline = previous[0]
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        return 1
+
+    print(f"Baseline:  {baseline['run_id']} ({baseline['command']})")
+    print(f"Candidate: {candidate['run_id']} ({candidate['command']})")
+    for key in ("git_revision", "terraform_vars", "settings"):
+        if baseline[key] != candidate[key]:
+            print_differences(key, baseline[key], candidate[key])
+
+    comparisons = compare_runs(
+        store,
+        baseline["run_id"],
+        candidate["run_id"],
+        max_throughput_drop=args.throughput_drop,
+        max_p99_increase=args.p99_increase,
+    )
+    if not comparisons:
+        print("The runs have no results in common")
+        return 1
+
+    print(f"\n{'metric':<16} {'baseline':>10} {'candidate':>10} {'change':>8}  series")
+    for comparison in comparisons:
+        flag = "  REGRESSION" if comparison.regression else ""
+        print(
+            f"{comparison.metric:<16} {comparison.baseline:>10.1f} "
+            f"{comparison.candidate:>10.1f} {comparison.change:>+8.1%}  "
+            f"{comparison.name}{flag}"
+        )
+    regressions = sum(comparison.regression for comparison in comparisons)
+    print(f"\n{regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+def cmd_import(args: argparse.Namespace) -> int:
+    """Record the results of a JMeter or Azure Load Testing run in the run store."""
+    from pgtools.runstore import RunStore, import_jmeter_results
+
+    if not args.results.exists():
+        print(f"Error: {args.results} does not exist")
+        return 1
+    store = RunStore(args.run_store)
+    try:
+        run_id = import_jmeter_results(store, args.results, label=args.label, command=args.tool)
+        results = store.results(run_id)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        store.close()
+
+    print(f"{'series':<24} {'samples':>8} {'per s':>8} {'errors':>7} {'p99 ms':>8}")
+    for name, metrics in results.items():
+        print(
+            f"{name:<24} {metrics['iterations']:>8.0f} {metrics['iterations_per_s']:>8.1f} "
+            f"{metrics['error_rate']:>7.1%} {metrics['p99_ms']:>8.1f}"
+        )
+    print(f"\nRecorded run {run_id} in {args.run_store}")
+    return 0
+
+
+def print_differences(key: str, baseline: Any, candidate: Any) -> None:
+    """Print what changed between two runs' git revision, variables or settings."""
+    if not isinstance(baseline, dict) or not isinstance(candidate, dict):
+        print(f"{key}: {baseline} -> {candidate}")
+        return
+    for name in sorted(set(baseline) | set(candidate)):
+        if baseline.get(name) != candidate.get(name):
+            print(f"{key} {name}: {baseline.get(name)} -> {candidate.get(name)}")
+
+
+def cmd_api(args: argparse.Namespace) -> int:
+    """Start the HTTP/JSON API service with uvicorn."""
+    import uvicorn
+
+    uvicorn.run(
+        "api_service:app",
+        app_dir=str(SCRIPT_DIR),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+    )
+    return 0
+
+
+def measure_import_time(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """Import a module in a fresh interpreter with `-X importtime`.
+
+    Returns the cumulative import time of the module in milliseconds and the
+    (milliseconds, name) entries of the modules it pulled in, slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    # Nested imports are reported before their parent with deeper indentation,
+    # so the dependencies are the entries since the previous top-level import
+    pending: List[Tuple[float, str]] = []
+    dependencies: List[Tuple[float, str]] = []
+    total_ms = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        cumulative_ms = int(cumulative) / 1000
+        if name[1:].startswith(" "):
+            pending.append((cumulative_ms, name.strip()))
+            continue
+        if name.strip() == module:
+            total_ms = cumulative_ms
+            dependencies.extend(pending)
+        pending = []
+
+    dependencies.sort(reverse=True)
+    return total_ms, dependencies
+
+
+def cmd_importtime(args: argparse.Namespace) -> int:
+    """Check the import time of the tooling modules against a budget."""
+    if args.module:
+        budgets = {module: args.budget_ms for module in args.module}
+    else:
+        budgets = dict(DEFAULT_IMPORT_BUDGETS_MS)
+        if args.budget_ms is not None:
+            budgets = {module: args.budget_ms for module in budgets}
+
+    all_within_budget = True
+    for module, budget_ms in budgets.items():
+        try:
+            total_ms, entries = measure_import_time(module)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            all_within_budget = False
+            continue
+
+        within_budget = budget_ms is None or total_ms <= budget_ms
+        all_within_budget = all_within_budget and within_budget
+        marker = "✅" if within_budget else "❌"
+        budget = f" (budget {budget_ms:.0f} ms)" if budget_ms is not None else ""
+        print(f"{marker} import {module}: {total_ms:.1f} ms{budget}")
+
+        for entry_ms, name in entries[: args.top]:
+            print(f"   {entry_ms:8.1f} ms  {name}")
+
+    return 0 if all_within_budget else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser with one subparser per tool."""
+    parser = argparse.ArgumentParser(
+        description="Azure PostgreSQL load test database tooling"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    commands: Dict[str, Tuple[Callable[[argparse.Namespace], int], str, List[str]]] = {
+        "setup": (cmd_setup, "Create tables and load the sample data", ["database_setup"]),
+        "seed": (cmd_seed, "Load the sample data into existing tables", []),
+        "query": (cmd_query, "Run the sample queries against the primary", []),
+        "verify": (cmd_verify, "Verify replication between primary and replica", []),
+        "summaries": (cmd_summaries, "Create and refresh the materialized summary views", []),
+        "lag": (cmd_lag, "Print the current replication lag of the replica", []),
+        "workload": (cmd_workload, "Run the price update workload on the primary", []),
+        "reads": (cmd_reads, "Run the product read workload balanced over replicas", []),
+        "saturate": (cmd_saturate, "Find the highest write and read rate within SLOs", []),
+        "soak": (cmd_soak, "Hold the load for hours and track dead tuples and bloat", []),
+        "collect": (cmd_collect, "Record server statistics during a load test", []),
+        "audit": (cmd_audit, "Track when each change on the primary reaches the replica", []),
+        "connect": (cmd_connect, "Time connection setup phases separately from queries", []),
+        "runs": (cmd_runs, "List the recorded load test runs", []),
+        "compare": (cmd_compare, "Flag throughput and p99 regressions between two runs", []),
+        "import": (cmd_import, "Record the results of a JMeter run in the run store", []),
+        "api": (cmd_api, "Start the HTTP/JSON API service", []),
+        "importtime": (cmd_importtime, "Check module import time against a budget", []),
+    }
+    # Instrumentation options are shared by the subcommands whose queries go
+    # through SQLAlchemy engines; lag and connect use psycopg2 directly
+    instrumented = [
+        "setup",
+        "seed",
+        "query",
+        "verify",
+        "summaries",
+        "workload",
+        "reads",
+        "saturate",
+        "soak",
+        "collect",
+        "audit",
+        "api",
+    ]
+    parser.set_defaults(instrument=False, slow_query_ms=None, metrics_port=None)
+    instrumentation = argparse.ArgumentParser(add_help=False)
+    instrumentation.add_argument(
+        "--instrument",
+        action="store_true",
+        help="Record per-statement latency and print a report when done",
+    )
+    instrumentation.add_argument(
+        "--slow-query-ms",
+        type=float,
+        help="Log statements slower than this many milliseconds (implies --instrument)",
+    )
+    instrumentation.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port (implies --instrument)",
+    )
+
+    # Key distribution options are shared by the subcommands updating products
+    key_distribution = argparse.ArgumentParser(add_help=False)
+    key_distribution.add_argument(
+        "--distribution",
+        choices=["fixed", "uniform", "zipf", "hotset"],
+        default="uniform",
+        help="How updated rows are chosen; fixed mimics the JMeter script",
+    )
+    key_distribution.add_argument(
+        "--zipf-s", type=positive_float, default=1.0, help="Zipfian exponent"
+    )
+    key_distribution.add_argument(
+        "--hot-fraction", type=fraction, default=0.01, help="Fraction of products in the hot set"
+    )
+    key_distribution.add_argument(
+        "--hot-probability",
+        type=probability,
+        default=0.9,
+        help="Probability that a write goes to the hot set",
+    )
+
+    subcommands = {}
+    for name, (handler, help_text, aliases) in commands.items():
+        parents = [instrumentation] if name in instrumented else []
+        if name in ("workload", "saturate", "soak"):
+            parents.append(key_distribution)
+        subparser = subparsers.add_parser(name, help=help_text, aliases=aliases, parents=parents)
+        subparser.set_defaults(handler=handler)
+        subcommands[name] = subparser
+
+    # Runs of these subcommands are recorded in the run store
+    for name in ("verify", "workload", "reads", "saturate", "soak"):
+        subcommands[name].add_argument(
+            "--run-store",
+            type=Path,
+            default=Path("load_test_runs.sqlite"),
+            help="SQLite file recording runs and their results (default: %(default)s)",
+        )
+        subcommands[name].add_argument(
+            "--no-record", action="store_true", help="Do not record this run"
+        )
+        subcommands[name].add_argument("--label", help="Free-text label stored with the run")
+    for name in ("runs", "compare"):
+        subcommands[name].add_argument(
+            "--run-store",
+            type=Path,
+            default=Path("load_test_runs.sqlite"),
+            help="SQLite file with the recorded runs (default: %(default)s)",
+        )
+        subcommands[name].add_argument(
+            "--tool", help="Only consider runs of this subcommand, e.g. workload"
+        )
+    subcommands["import"].add_argument(
+        "results",
+        type=Path,
+        help="JMeter results file (CSV/JTL) or the results zip of Azure Load Testing",
+    )
+    subcommands["import"].add_argument(
+        "--run-store",
+        type=Path,
+        default=Path("load_test_runs.sqlite"),
+        help="SQLite file recording runs and their results (default: %(default)s)",
+    )
+    subcommands["import"].add_argument("--label", help="Free-text label stored with the run")
+    subcommands["import"].add_argument(
+        "--tool",
+        default="jmeter",
+        help="Command the run is recorded under, e.g. to keep setups apart (default: %(default)s)",
+    )
+    subcommands["runs"].add_argument(
+        "--limit", type=int, default=20, help="Number of runs to list (default: %(default)s)"
+    )
+    subcommands["compare"].add_argument(
+        "baseline",
+        nargs="?",
+        help="Run id (or prefix) to compare against (default: the completed run before it)",
+    )
+    subcommands["compare"].add_argument(
+        "candidate",
+        nargs="?",
+        help="Run id (or prefix) to check (default: the latest completed run)",
+    )
+    subcommands["compare"].add_argument(
+        "--throughput-drop",
+        type=float,
+        default=0.10,
+        help="Relative throughput drop flagged as regression (default: %(default)s)",
+    )
+    subcommands["compare"].add_argument(
+        "--p99-increase",
+        type=float,
+        default=0.20,
+        help="Relative p99 latency increase flagged as regression (default: %(default)s)",
+    )
+
+    subcommands["lag"].add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="Repeat the check every SECONDS seconds",
+    )
+    subcommands["lag"].add_argument(
+        "--count",
+        type=int,
+        default=0,
+        help="Stop after COUNT checks when watching (default: run until interrupted)",
+    )
+
+    subcommands["setup"].add_argument(
+        "--fillfactor",
+        type=fillfactor_percent,
+        help="Fillfactor for the products table so price updates stay HOT (10-100)",
+    )
+    subcommands["verify"].add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only compare rows changed since the previous incremental run",
+    )
+    subcommands["verify"].add_argument(
+        "--state-file",
+        type=Path,
+        help="Watermark state file (default: .verify_replication_state.json)",
+    )
+    subcommands["verify"].add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Query the primary and all replicas concurrently on the asyncpg driver",
+    )
+    subcommands["summaries"].add_argument(
+        "--interval", type=float, help="Keep refreshing every this many seconds"
+    )
+    subcommands["summaries"].add_argument(
+        "--duration", type=float, help="Stop refreshing after this many seconds"
+    )
+    subcommands["summaries"].add_argument(
+        "--blocking",
+        action="store_true",
+        help="Refresh without CONCURRENTLY, which is faster but blocks readers",
+    )
+    subcommands["seed"].add_argument(
+        "--products",
+        type=int,
+        default=0,
+        help="Also generate this many products to spread the write workload over",
+    )
+
+    workload = subcommands["workload"]
+    workload.add_argument("--threads", type=int, default=10)
+    workload.add_argument("--duration", type=float, default=60.0, help="Seconds to run")
+    workload.add_argument(
+        "--rate", type=float, help="Target iterations per minute across all threads"
+    )
+    workload.add_argument(
+        "--rows-per-iteration",
+        type=positive_int,
+        default=4,
+        help="Rows updated per iteration (default: %(default)s, like the JMeter sampler)",
+    )
+    workload.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    workload.add_argument(
+        "--mode",
+        nargs="+",
+        choices=["autocommit", "transaction", "values"],
+        default=["autocommit"],
+        help="Write modes to run one after another: a commit per row, "
+        "a transaction per iteration or one UPDATE ... FROM (VALUES ...) per iteration",
+    )
+    workload.add_argument(
+        "--synchronous-commit",
+        choices=["on", "off", "both"],
+        default="on",
+        help="synchronous_commit for the workload sessions; both runs every mode twice",
+    )
+    workload.add_argument(
+        "--lag-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between replica lag samples (default: %(default)s)",
+    )
+    workload.add_argument(
+        "--catch-up-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for the replica between runs (default: %(default)s)",
+    )
+    workload.add_argument(
+        "--cold",
+        action="store_true",
+        help="Do not open the connection pool before the run, so it includes connecting",
+    )
+
+    reads = subcommands["reads"]
+    reads.add_argument(
+        "--policy",
+        nargs="+",
+        choices=["round_robin", "least_outstanding", "lag_aware"],
+        default=["round_robin"],
+        help="Balancing policies to run one after another",
+    )
+    reads.add_argument(
+        "--replicas",
+        type=int,
+        nargs="+",
+        help="Numbers of replicas to balance over, e.g. 1 2 3 (default: all configured)",
+    )
+    reads.add_argument("--threads", type=int, default=40)
+    reads.add_argument("--duration", type=float, default=60.0, help="Seconds to run")
+    reads.add_argument("--rate", type=float, help="Target reads per minute across all threads")
+    reads.add_argument(
+        "--max-lag-s",
+        type=float,
+        default=1.0,
+        help="Replay delay above which lag_aware avoids a replica (default: %(default)s)",
+    )
+    reads.add_argument(
+        "--lag-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between replica lag checks for lag_aware (default: %(default)s)",
+    )
+    reads.add_argument(
+        "--cold",
+        action="store_true",
+        help="Do not open the connection pools before each run, so it includes connecting",
+    )
+
+    saturate = subcommands["saturate"]
+    saturate.add_argument(
+        "--strategy",
+        choices=["step", "binary"],
+        default="binary",
+        help="Raise the rate by --increment, or by --factor and then bisect (default: %(default)s)",
+    )
+    saturate.add_argument(
+        "--start-rate", type=float, default=60.0, help="First write rate in iterations per minute"
+    )
+    saturate.add_argument(
+        "--max-rate", type=float, default=7680.0, help="Highest write rate to try per minute"
+    )
+    saturate.add_argument(
+        "--increment", type=float, help="Rate increase per step for step (default: --start-rate)"
+    )
+    saturate.add_argument(
+        "--factor", type=float, default=2.0, help="Rate multiplier per step for binary"
+    )
+    saturate.add_argument(
+        "--precision",
+        type=float,
+        default=0.05,
+        help="Relative width at which binary stops bisecting (default: %(default)s)",
+    )
+    saturate.add_argument(
+        "--max-steps", type=int, default=20, help="Upper bound on the number of steps"
+    )
+    saturate.add_argument(
+        "--step-duration", type=float, default=60.0, help="Seconds to run each step"
+    )
+    saturate.add_argument(
+        "--catch-up-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds to wait for the replica between steps (default: %(default)s)",
+    )
+
+    # saturate and soak run the same mixed write and read workload
+    for name in ("saturate", "soak"):
+        mixed = subcommands[name]
+        mixed.add_argument(
+            "--read-ratio",
+            type=float,
+            default=4.0,
+            help="Reads per write, like 480 reads to 120 writes per minute in the JMeter "
+            "defaults; 0 disables reads (default: %(default)s)",
+        )
+        mixed.add_argument("--write-threads", type=int, default=20)
+        mixed.add_argument("--read-threads", type=int, default=40)
+        mixed.add_argument(
+            "--policy",
+            choices=["round_robin", "least_outstanding", "lag_aware"],
+            default="round_robin",
+            help="How reads are balanced over the replicas (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--mode",
+            choices=["autocommit", "transaction", "values"],
+            default="autocommit",
+            help="Write mode, see workload (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--rows-per-iteration",
+            type=positive_int,
+            default=4,
+            help="Rows updated per iteration (default: %(default)s, like the JMeter sampler)",
+        )
+        mixed.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+        mixed.add_argument(
+            "--p99-ms", type=float, default=500.0, help="SLO on p99 latency (default: %(default)s)"
+        )
+        mixed.add_argument(
+            "--max-error-rate",
+            type=float,
+            default=0.01,
+            help="SLO on the fraction of failed iterations (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--max-lag-s",
+            type=float,
+            default=5.0,
+            help="SLO on the maximum replication lag per step or window (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--min-achieved",
+            type=float,
+            default=0.9,
+            help="Fraction of the target rate a step has to achieve (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--lag-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between replica lag samples (default: %(default)s)",
+        )
+        mixed.add_argument(
+            "--cold",
+            action="store_true",
+            help="Do not open the connection pools before starting",
+        )
+
+    soak = subcommands["soak"]
+    soak.set_defaults(distribution="fixed")
+    soak.add_argument(
+        "--rate",
+        type=float,
+        default=120.0,
+        help="Write iterations per minute, like main_writes_per_minute (default: %(default)s)",
+    )
+    soak.add_argument(
+        "--duration",
+        type=float,
+        default=8 * 3600.0,
+        help="Seconds to run (default: %(default)s, a business day)",
+    )
+    soak.add_argument(
+        "--window",
+        type=float,
+        default=300.0,
+        help="Seconds per measurement window and table health sample (default: %(default)s)",
+    )
+    soak.add_argument(
+        "--tables",
+        nargs="+",
+        default=["products"],
+        help="Tables whose health is sampled; the first one is reported (default: products)",
+    )
+
+    connect = subcommands["connect"]
+    connect.add_argument(
+        "--role",
+        nargs="+",
+        choices=["primary", "replica"],
+        default=["primary", "replica"],
+        help="Servers to measure; replica covers every configured replica",
+    )
+    connect.add_argument(
+        "--samples", type=int, default=20, help="Connections per server (default: %(default)s)"
+    )
+    connect.add_argument(
+        "--interval", type=float, default=0.0, help="Seconds between connections"
+    )
+
+    subcommands["collect"].add_argument(
+        "--output",
+        type=Path,
+        default=Path("server_metrics.parquet"),
+        help="Parquet file, or Arrow IPC stream for .arrow/.arrows/.ipc (default: %(default)s)",
+    )
+    subcommands["collect"].add_argument(
+        "--interval", type=float, default=5.0, help="Seconds between snapshots"
+    )
+    subcommands["collect"].add_argument(
+        "--duration", type=float, help="Stop after this many seconds (default: until Ctrl+C)"
+    )
+    subcommands["collect"].add_argument(
+        "--top-statements",
+        type=int,
+        default=50,
+        help="Number of pg_stat_statements entries to track",
+    )
+
+    audit = subcommands["audit"]
+    audit.add_argument(
+        "--decoder",
+        choices=["pgoutput", "wal2json"],
+        default="pgoutput",
+        help="Logical decoding plugin (default: %(default)s)",
+    )
+    audit.add_argument(
+        "--tables", nargs="+", default=["products", "orders"], help="Tables to audit"
+    )
+    audit.add_argument(
+        "--publication",
+        default="replication_audit",
+        help="Publication for pgoutput, created if missing (default: %(default)s)",
+    )
+    audit.add_argument(
+        "--duration", type=float, help="Stop after this many seconds (default: until Ctrl+C)"
+    )
+    audit.add_argument(
+        "--late-ms",
+        type=float,
+        default=1000.0,
+        help="Changes visible later than this count as late (default: %(default)s)",
+    )
+    audit.add_argument(
+        "--missing-after",
+        type=float,
+        default=30.0,
+        help="Seconds after which an invisible change counts as missing or not replayed"
+        " (default: %(default)s)",
+    )
+    audit.add_argument(
+        "--max-tracked",
+        type=int,
+        default=100_000,
+        help="Maximum number of pending changes kept in memory (default: %(default)s)",
+    )
+    audit.add_argument(
+        "--report-interval", type=float, default=5.0, help="Seconds between status lines"
+    )
+    audit.add_argument(
+        "--show", type=int, default=20, help="Number of late or missing changes to list"
+    )
+
+    subcommands["api"].add_argument("--host", default=os.environ.get("API_HOST", "0.0.0.0"))
+    subcommands["api"].add_argument(
+        "--port", type=int, default=int(os.environ.get("API_PORT", "8000"))
+    )
+    subcommands["api"].add_argument("--workers", type=int, default=1)
+
+    subcommands["importtime"].add_argument(
+        "--module",
+        action="append",
+        help="Module to measure (repeatable, default: cli and verify_replication)",
+    )
+    subcommands["importtime"].add_argument(
+        "--budget-ms",
+        type=float,
+        help="Maximum allowed cumulative import time in milliseconds",
+    )
+    subcommands["importtime"].add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="Number of slowest imported modules to list",
+    )
+
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Parse the command line and dispatch to the selected subcommand."""
+    args = build_parser().parse_args(argv)
+
+    instrumentation = None
+    if args.instrument or args.slow_query_ms is not None or args.metrics_port is not None:
+        import logging
+
+        from pgtools import instrumentation as query_instrumentation
+
+        logging.basicConfig(format="%(asctime)s %(name)s %(message)s")
+        instrumentation = query_instrumentation.enable(
+            slow_query_ms=args.slow_query_ms, prometheus_port=args.metrics_port
+        )
+
+    args.recording = None
+    if getattr(args, "run_store", None) is not None and hasattr(args, "no_record"):
+        if not args.no_record:
+            args.recording = start_recording(args)
+
+    status = "error"
+    try:
+        code = args.handler(args)
+        status = "ok" if code == 0 else "failed"
+        return code
+    except KeyboardInterrupt:
+        status = "interrupted"
+        return 130
+    finally:
+        if instrumentation is not None:
+            print("\n=== Query Instrumentation ===")
+            print(instrumentation.report())
+        if args.recording is not None:
+            store, run_id = args.recording
+            store.finish_run(run_id, status)
+            store.close()
+            print(f"\nRecorded run {run_id} in {args.run_store}")
+
+
+def start_recording(args: argparse.Namespace) -> Tuple["RunStore", str]:
+    """Open the run store and record the start of this run."""
+    from pgtools.runstore import RunStore
+
+    settings = {
+        name: value
+        for name, value in vars(args).items()
+        if name not in ("handler", "command", "run_store", "no_record", "label", "recording")
+        and value is not None
+    }
+    store = RunStore(args.run_store)
+    return store, store.start_run(args.command, args.label, settings)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
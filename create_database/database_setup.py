@@ -6,104 +6,37 @@ It creates tables, loads sample data, and demonstrates basic database operations
 """
 
 import json
-import os
 import sys
 import uuid
 from pathlib import Path
-from typing import Dict, Optional, Type, TypeVar
-from dotenv import load_dotenv
+from typing import Dict, Optional
 
 # SQLAlchemy imports
-from sqlalchemy import (
-    Engine,
-    create_engine,
-    inspect,
-    Column,
-    Integer,
-    String,
-    Float,
-    Boolean,
-    DateTime,
-    ForeignKey,
-    func,
-    text,
+from sqlalchemy import Engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from pgtools.config import ConfigError, get_db_config, missing_env_vars
+from pgtools.db import create_db_engine
+from pgtools.models import Base, Product
+from pgtools.summaries import (
+    create_summaries,
+    drop_summaries,
+    read_category_summary,
+    refresh_summaries,
 )
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-
-
-# Load environment variables from .env file if it exists
-env_path = Path(__file__).parent.parent / "terraform"
-env_file = env_path / "load_test_variables.env"
-if env_file.exists():
-    load_dotenv(env_file)
-else:
-    print(f"Warning: {env_file} not found.")
-    sys.exit(1)
-
-# Define database configuration
-DB_CONFIG = {
-    "host": os.environ.get("PRIMARY_SERVER_FQDN"),
-    "user": os.environ.get("POSTGRES_ADMIN_USERNAME"),
-    "password": os.environ.get("POSTGRES_ADMIN_PASSWORD"),
-    "database": os.environ.get("DATABASE_NAME"),
-    "sslmode": "require",
-}
-
-# Define SQLAlchemy Base and Models
-Base = declarative_base()
-
-# Add type alias for mypy
-T = TypeVar("T", bound=Base)
-ModelType = Type[T]
-
-
-class Product(Base):
-    __tablename__ = "products"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    category = Column(String(50), nullable=False)
-    price = Column(Float(precision=10, decimal_return_scale=2), nullable=False)
-    in_stock = Column(Boolean, nullable=False, default=True)
-    created_at = Column(DateTime, server_default=func.now())
-
-    # Relationship with Order model
-    orders = relationship("Order", back_populates="product")
-
-    def __repr__(self) -> str:
-        return (
-            f"<Product(id={self.id}, name='{self.name}', "
-            f"category='{self.category}', price={self.price})>"
-        )
-
-
-class Order(Base):
-    __tablename__ = "orders"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
-    quantity = Column(Integer, nullable=False)
-    order_date = Column(DateTime, server_default=func.now())
-
-    # Relationship with Product model
-    product = relationship("Product", back_populates="orders")
-
-    def __repr__(self) -> str:
-        return f"<Order(id={self.id}, product_id={self.product_id}, quantity={self.quantity})>"
+# Default sample data shipped with the repository
+SAMPLE_DATA_PATH = Path(__file__).parent / "data" / "sample_data.json"
 
 
 def check_env_vars() -> bool:
     """Verify all required environment variables are set."""
-    required_vars = [
-        "PRIMARY_SERVER_FQDN",
-        "POSTGRES_ADMIN_USERNAME",
-        "POSTGRES_ADMIN_PASSWORD",
-        "DATABASE_NAME",
-    ]
-
-    missing_vars = [var for var in required_vars if not os.environ.get(var)]
+    try:
+        missing_vars = missing_env_vars("primary")
+    except ConfigError as e:
+        print(f"Warning: {e}")
+        sys.exit(1)
+
     if missing_vars:
         print(
             f"Error: Missing database environment variables: "
@@ -121,25 +54,10 @@ def check_env_vars() -> bool:
 def connect_to_database(config: Dict[str, Optional[str]]) -> Engine:
     """Connect to the Azure PostgreSQL database using SQLAlchemy."""
     try:
-        # Make sure all required values are present
-        user = config.get("user")
-        password = config.get("password")
-        host = config.get("host")
-        database = config.get("database")
-        sslmode = config.get("sslmode", "require")
-        if not all([user, password, host, database]):
-            raise ValueError("Missing required database connection parameters")
-
-        # Create the connection string
-        connection_string = (
-            f"postgresql+psycopg2://{user}:{password}@"
-            f"{host}/{database}?sslmode={sslmode}"
-        )
-
-        print(f"Connecting to database at {host}...")
+        print(f"Connecting to database at {config.get('host')}...")
 
         # Create engine with echo=False to avoid logging SQL statements
-        engine = create_engine(connection_string, echo=False)
+        engine = create_db_engine(config)
 
         # Test connection by making a simple query
         with engine.connect() as conn:
@@ -168,6 +86,9 @@ def check_tables_exist(engine: Engine) -> bool:
 def drop_tables(engine: Engine) -> None:
     """Drop existing tables from the database using SQLAlchemy."""
     try:
+        # The summary views depend on the tables, so drop them first
+        drop_summaries(engine)
+
         # Drop tables using the metadata
         # Order matters due to foreign key constraints
         Base.metadata.drop_all(engine)
@@ -177,7 +98,46 @@ def drop_tables(engine: Engine) -> None:
         sys.exit(1)
 
 
-def create_tables(engine: Engine) -> None:
+def create_missing_indexes(engine: Engine) -> None:
+    """Create the indexes of the models that existing tables lack.
+
+    `create_all` skips tables that already exist, so indexes added to the
+    models later (e.g. on `orders.order_date`) are created here.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn, checkfirst=True)
+                    print(f"Created missing index {index.name}.")
+
+
+def check_fillfactor(fillfactor: int) -> None:
+    """Reject fillfactors PostgreSQL does not accept for tables (10-100)."""
+    if not 10 <= fillfactor <= 100:
+        raise ValueError("fillfactor must be between 10 and 100")
+
+
+def set_products_fillfactor(engine: Engine, fillfactor: int) -> None:
+    """Set the fillfactor of the existing products table.
+
+    Leaving free space in every page lets price updates stay HOT (heap-only
+    tuple) updates. Only pages written afterwards are affected; existing
+    pages keep their layout until the table is rewritten (e.g. VACUUM FULL).
+    New tables get their fillfactor in `create_tables` instead.
+    """
+    check_fillfactor(fillfactor)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE products SET (fillfactor = {int(fillfactor)})"))
+    print(
+        f"Set fillfactor of products table to {fillfactor}. Existing pages keep their "
+        "fillfactor until the table is rewritten (VACUUM FULL or CLUSTER)."
+    )
+
+
+def create_tables(engine: Engine, fillfactor: Optional[int] = None) -> None:
     """Create necessary tables in the database using SQLAlchemy."""
     try:
         # Check if tables already exist
@@ -195,17 +155,30 @@ def create_tables(engine: Engine) -> None:
                 drop_tables(engine)
             else:
                 print("Using existing tables.")
+                create_missing_indexes(engine)
+                if fillfactor is not None:
+                    set_products_fillfactor(engine, fillfactor)
+                create_summaries(engine)
                 return
 
-        # Create all tables defined in Base metadata
-        Base.metadata.create_all(engine)
+        # Create all tables defined in Base metadata, products with its fillfactor
+        if fillfactor is not None:
+            check_fillfactor(fillfactor)
+            Product.__table__.info["storage_parameters"] = {"fillfactor": fillfactor}
+        try:
+            Base.metadata.create_all(engine)
+        finally:
+            Product.__table__.info.pop("storage_parameters", None)
+        create_summaries(engine)
         print("Tables created successfully!")
+        if fillfactor is not None:
+            print(f"Created products table with fillfactor {fillfactor}.")
     except Exception as e:
         print(f"Error creating tables: {e}")
         sys.exit(1)
 
 
-def load_sample_data(engine: Engine) -> None:
+def load_sample_data(engine: Engine, data_path: Optional[Path] = None) -> None:
     """Load sample data from JSON file into the database using SQLAlchemy."""
     try:
         # Create a session to interact with the database
@@ -224,7 +197,8 @@ def load_sample_data(engine: Engine) -> None:
             return
 
         # Load sample data from JSON file
-        data_path = Path(__file__).parent / "data" / "sample_data.json"
+        if data_path is None:
+            data_path = SAMPLE_DATA_PATH
         with open(data_path, "r") as file:
             products_data = json.load(file)
 
@@ -244,7 +218,7 @@ def load_sample_data(engine: Engine) -> None:
         print(f"Imported {len(products_data)} products successfully!")
         session.close()
     except FileNotFoundError:
-        print("Error: Sample data file not found at data/sample_data.json")
+        print(f"Error: Sample data file not found at {data_path}")
         sys.exit(1)
     except Exception as e:
         print(f"Error loading sample data: {e}")
@@ -277,28 +251,18 @@ def query_data(engine: Engine) -> None:
                 f"In Stock: {product.in_stock}"
             )
 
-        # Query 2: Group by category
+        # Query 2: Group by category, from the materialized summary
         print("\nProducts by Category:")
-        # Use a simpler query to avoid potential database function differences
-        categories = session.query(Product.category).distinct().all()
-        for (category,) in categories:
-            count = (
-                session.query(func.count(Product.id))
-                .filter(Product.category == category)
-                .scalar()
-            )
-            avg_price = (
-                session.query(func.avg(Product.price))
-                .filter(Product.category == category)
-                .scalar()
+        summary = read_category_summary(session.connection())
+        for row in summary:
+            print(
+                f"Category: {row['category']}, Count: {row['product_count']}, "
+                f"Avg Price: ${row['avg_price']:.2f}"
             )
-            print(f"Category: {category}, Count: {count}, Avg Price: ${avg_price:.2f}")
 
         # Query 3: In-stock products
         print("\nIn-Stock Products:")
-        in_stock_count = (
-            session.query(Product).filter(Product.in_stock.is_(True)).count()
-        )
+        in_stock_count = sum(row["in_stock_count"] for row in summary)
         print(f"Total in-stock products: {in_stock_count}")
 
         session.close()
@@ -307,7 +271,7 @@ def query_data(engine: Engine) -> None:
         sys.exit(1)
 
 
-def main() -> None:
+def main(fillfactor: Optional[int] = None) -> None:
     """Main function to run the application."""
     print("Azure PostgreSQL Database Setup")
     print("===============================")
@@ -316,13 +280,14 @@ def main() -> None:
     check_env_vars()
 
     # Connect to PostgreSQL with SQLAlchemy
-    engine = connect_to_database(DB_CONFIG)
+    engine = connect_to_database(get_db_config("primary"))
 
     # Create database schema
-    create_tables(engine)
+    create_tables(engine, fillfactor=fillfactor)
 
-    # Load sample data
+    # Load sample data and bring the summaries up to date
     load_sample_data(engine)
+    refresh_summaries(engine)
 
     # Query and display data
     query_data(engine)
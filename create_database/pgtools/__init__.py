@@ -0,0 +1,8 @@
+"""
+Shared building blocks for the Azure PostgreSQL database tooling.
+
+The scripts in `create_database` import their models, configuration and
+engine helpers from this package so that every tool sees the same schema.
+Submodules are imported explicitly (e.g. `from pgtools.models import Product`)
+to keep importing the package itself cheap.
+"""
@@ -0,0 +1,109 @@
+"""
+Async data accessors on the asyncpg driver.
+
+These are the asyncio counterparts of the Streamlit data accessors, shared
+by the HTTP API service and the async verification tooling. They take an
+`AsyncSession` or `AsyncConnection`, so a single event loop can keep many
+queries in flight while each one only holds a pooled connection for the
+duration of its round-trip.
+"""
+
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from pgtools.models import Order, Product
+from pgtools.summaries import read_category_summary, read_daily_order_totals
+
+
+def product_to_dict(product: Product) -> Dict[str, Any]:
+    """Convert a Product to the same dictionary shape used by the Streamlit app."""
+    return {
+        "id": str(product.id),
+        "name": product.name,
+        "category": product.category,
+        "price": product.price,
+        "in_stock": product.in_stock,
+    }
+
+
+async def get_products(session: AsyncSession) -> List[Dict[str, Any]]:
+    """Fetch all products from the database."""
+    result = await session.execute(select(Product).order_by(Product.created_at))
+    return [product_to_dict(product) for product in result.scalars()]
+
+
+async def get_product_by_id(
+    session: AsyncSession, product_id: uuid.UUID
+) -> Optional[Dict[str, Any]]:
+    """Fetch a specific product by ID."""
+    product = await session.get(Product, product_id)
+    if product is None:
+        return None
+    return product_to_dict(product)
+
+
+async def create_order(
+    session: AsyncSession, product_id: uuid.UUID, quantity: int
+) -> Dict[str, Any]:
+    """Create a new order in the database."""
+    new_order = Order(product_id=product_id, quantity=quantity)
+    session.add(new_order)
+    await session.commit()
+
+    # Refresh the order to get the generated ID and default values
+    await session.refresh(new_order)
+
+    return {
+        "id": str(new_order.id),
+        "product_id": str(new_order.product_id),
+        "quantity": new_order.quantity,
+        "order_date": new_order.order_date.isoformat(),
+    }
+
+
+async def get_orders(
+    session: AsyncSession, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Fetch orders with product details, newest first."""
+    query = (
+        select(
+            Order.id,
+            Order.quantity,
+            Order.order_date,
+            Product.id.label("product_id"),
+            Product.name.label("product_name"),
+            Product.price,
+            (Product.price * Order.quantity).label("total_price"),
+        )
+        .join(Product)
+        .order_by(desc(Order.order_date))
+    )
+    if limit is not None:
+        query = query.limit(limit)
+
+    result = await session.execute(query)
+    return [
+        {
+            "id": str(order.id),
+            "quantity": order.quantity,
+            "order_date": order.order_date.isoformat(),
+            "product_id": str(order.product_id),
+            "product_name": order.product_name,
+            "price": order.price,
+            "total_price": order.total_price,
+        }
+        for order in result
+    ]
+
+
+async def get_category_summary(conn: AsyncConnection) -> List[Dict[str, Any]]:
+    """Fetch the per-category product statistics."""
+    return await conn.run_sync(read_category_summary)
+
+
+async def get_order_totals(conn: AsyncConnection) -> List[Dict[str, Any]]:
+    """Fetch the per-day order totals."""
+    return await conn.run_sync(read_daily_order_totals)
@@ -0,0 +1,533 @@
+"""
+Per-change replication audit based on logical decoding.
+
+`compare_tables` can tell that primary and replica diverged, but not which
+writes were missing or late. `ReplicationAudit` streams the changes to the
+audited tables from a temporary logical replication slot on the primary,
+keeps the most recent change per primary key in a bounded index, and checks
+in the background when each change becomes visible on the replica:
+
+- `visible`: the replica returned the new row (or no row for a delete);
+  the latency is the replica clock at that point minus the commit time
+- `late`: visible, but later than `late_after` seconds
+- `superseded`: a newer change to the same key arrived before this one was
+  seen; only the newest change per key is tracked
+- `missing`: replayed, but still not visible `missing_after` seconds after
+  decoding
+- `not_replayed`: the replica had not replayed the change's commit
+  `missing_after` seconds after decoding, e.g. because replay stalled
+- `evicted`: dropped from the index because more than `max_tracked`
+  changes were pending
+
+Changes are decoded with the built-in `pgoutput` plugin (which needs a
+publication for the audited tables) or with `wal2json`. The primary must run
+with `wal_level = logical`. The slot is temporary, so it disappears with the
+connection and never retains WAL after the audit stops.
+"""
+
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Boolean, Column, Engine, Text, case, cast, select as sql_select, text, tuple_
+
+from pgtools.db import reflect_table
+from pgtools.instrumentation import Histogram
+
+logger = logging.getLogger(__name__)
+
+DECODERS = ["pgoutput", "wal2json"]
+
+DEFAULT_TABLES = ("products", "orders")
+DEFAULT_PUBLICATION = "replication_audit"
+
+# Commit timestamps in pgoutput are microseconds since the PostgreSQL epoch
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+# Marker for TOASTed values that an update left unchanged
+UNCHANGED = object()
+
+REPLAY_POSITION_QUERY = text("SELECT pg_last_wal_replay_lsn()::text, clock_timestamp()")
+
+
+def parse_lsn(value: str) -> int:
+    """Convert an LSN like `16/B374D848` to an integer."""
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(value: int) -> str:
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+@dataclass
+class Change:
+    """One decoded row change with the position and time of its commit."""
+
+    table: str
+    operation: str
+    key_columns: Tuple[str, ...]
+    key: Tuple[Optional[str], ...]
+    values: Dict[str, Optional[str]]
+    lsn: int = 0
+    committed_at: Optional[datetime] = None
+    decoded_at: float = field(default_factory=time.monotonic)
+
+    def describe(self) -> str:
+        key = ", ".join(f"{name}={value}" for name, value in zip(self.key_columns, self.key))
+        return f"{self.operation} {self.table} ({key}) at {format_lsn(self.lsn)}"
+
+
+@dataclass
+class Relation:
+    name: str
+    columns: List[str]
+    key_indexes: List[int]
+
+
+class PgOutputDecoder:
+    """Decode messages of the pgoutput plugin, protocol version 1."""
+
+    plugin = "pgoutput"
+
+    def __init__(self, publication: str, tables: Sequence[str]) -> None:
+        self.publication = publication
+        self.tables = set(tables)
+        self.relations: Dict[int, Relation] = {}
+        self.transaction: List[Change] = []
+
+    def options(self) -> Dict[str, str]:
+        return {"proto_version": "1", "publication_names": self.publication}
+
+    def decode(self, payload: bytes, data_start: int) -> List[Change]:
+        """Decode one message; returns the changes of a transaction on commit."""
+        kind = payload[:1]
+        if kind == b"B":
+            self.transaction = []
+        elif kind == b"C":
+            _, _, end_lsn, commit_ts = struct.unpack_from("!bqqq", payload, 1)
+            committed_at = PG_EPOCH + timedelta(microseconds=commit_ts)
+            changes, self.transaction = self.transaction, []
+            for change in changes:
+                change.lsn = end_lsn
+                change.committed_at = committed_at
+            return changes
+        elif kind == b"R":
+            self._decode_relation(payload)
+        elif kind in (b"I", b"U", b"D"):
+            change = self._decode_change(kind, payload)
+            if change is not None:
+                self.transaction.append(change)
+        return []
+
+    def _decode_relation(self, payload: bytes) -> None:
+        (relation_id,) = struct.unpack_from("!I", payload, 1)
+        _, offset = _read_string(payload, 5)
+        name, offset = _read_string(payload, offset)
+        (column_count,) = struct.unpack_from("!h", payload, offset + 1)
+        offset += 3
+
+        columns: List[str] = []
+        key_indexes: List[int] = []
+        for index in range(column_count):
+            flags = payload[offset]
+            column, offset = _read_string(payload, offset + 1)
+            offset += 8  # type oid and type modifier
+            columns.append(column)
+            if flags & 1:
+                key_indexes.append(index)
+        self.relations[relation_id] = Relation(name, columns, key_indexes)
+
+    def _decode_change(self, kind: bytes, payload: bytes) -> Optional[Change]:
+        (relation_id,) = struct.unpack_from("!I", payload, 1)
+        relation = self.relations.get(relation_id)
+        offset = 5
+        old_tuple = None
+        if payload[offset : offset + 1] in (b"K", b"O"):
+            old_tuple, offset = _read_tuple(payload, offset + 1)
+        new_tuple = None
+        if payload[offset : offset + 1] == b"N":
+            new_tuple, offset = _read_tuple(payload, offset + 1)
+        if relation is None or relation.name not in self.tables:
+            return None
+
+        operation = {b"I": "insert", b"U": "update", b"D": "delete"}[kind]
+        key_source = new_tuple if new_tuple is not None else old_tuple
+        values: Dict[str, Optional[str]] = {}
+        if new_tuple is not None:
+            values = {
+                column: value
+                for column, value in zip(relation.columns, new_tuple)
+                if value is not UNCHANGED
+            }
+        return Change(
+            table=relation.name,
+            operation=operation,
+            key_columns=tuple(relation.columns[index] for index in relation.key_indexes),
+            key=tuple(key_source[index] for index in relation.key_indexes),  # type: ignore
+            values=values,
+        )
+
+
+def _read_string(payload: bytes, offset: int) -> Tuple[str, int]:
+    end = payload.index(b"\0", offset)
+    return payload[offset:end].decode(), end + 1
+
+
+def _read_tuple(payload: bytes, offset: int) -> Tuple[List[Any], int]:
+    (column_count,) = struct.unpack_from("!h", payload, offset)
+    offset += 2
+    values: List[Any] = []
+    for _ in range(column_count):
+        kind = payload[offset : offset + 1]
+        offset += 1
+        if kind == b"n":
+            values.append(None)
+        elif kind == b"u":
+            values.append(UNCHANGED)
+        else:
+            (length,) = struct.unpack_from("!i", payload, offset)
+            offset += 4
+            values.append(payload[offset : offset + length].decode())
+            offset += length
+    return values, offset
+
+
+class Wal2JsonDecoder:
+    """Decode messages of the wal2json plugin, format version 2."""
+
+    plugin = "wal2json"
+
+    def __init__(self, tables: Sequence[str]) -> None:
+        self.tables = list(tables)
+        self.transaction: List[Change] = []
+
+    def options(self) -> Dict[str, str]:
+        return {
+            "format-version": "2",
+            "include-pk": "1",
+            "include-lsn": "1",
+            "include-timestamp": "1",
+            "numeric-data-types-as-string": "1",
+            "add-tables": ",".join(f"*.{table}" for table in self.tables),
+        }
+
+    def decode(self, payload: bytes, data_start: int) -> List[Change]:
+        message = json.loads(payload)
+        action = message.get("action")
+        if action == "B":
+            self.transaction = []
+        elif action == "C":
+            position = message.get("nextlsn") or message.get("lsn")
+            lsn = parse_lsn(position) if position else data_start
+            committed_at = _parse_timestamp(message.get("timestamp"))
+            changes, self.transaction = self.transaction, []
+            for change in changes:
+                change.lsn = lsn
+                change.committed_at = committed_at
+            return changes
+        elif action in ("I", "U", "D"):
+            self.transaction.append(self._decode_change(action, message))
+        return []
+
+    def _decode_change(self, action: str, message: Dict[str, Any]) -> Change:
+        key_columns = tuple(column["name"] for column in message.get("pk", []))
+        values = {
+            column["name"]: _json_value_to_text(column.get("value"))
+            for column in message.get("columns", [])
+        }
+        identity = {
+            column["name"]: _json_value_to_text(column.get("value"))
+            for column in message.get("identity", [])
+        }
+        key_source = values if action != "D" else identity
+        return Change(
+            table=message["table"],
+            operation={"I": "insert", "U": "update", "D": "delete"}[action],
+            key_columns=key_columns,
+            key=tuple(key_source.get(name) for name in key_columns),
+            values=values if action != "D" else {},
+        )
+
+
+def _json_value_to_text(value: Any) -> Optional[str]:
+    # Match the text output of PostgreSQL for the values compared on the replica
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value)
+
+
+def _output_text(column: Column) -> Any:
+    """Render a column like its type output function, as logical decoding does."""
+    # The boolean cast to text gives 'true'/'false' instead of 't'/'f'
+    if isinstance(column.type, Boolean):
+        return case((column.is_(True), "t"), (column.is_(False), "f")).label(column.name)
+    return cast(column, Text).label(column.name)
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    # PostgreSQL prints offsets as +00, fromisoformat before 3.11 needs +00:00
+    if len(value) > 3 and value[-3] in "+-":
+        value += ":00"
+    return datetime.fromisoformat(value)
+
+
+class ReplicationAudit:
+    """Streams changes from the primary and checks their visibility on the replica."""
+
+    def __init__(
+        self,
+        primary_config: Dict[str, Optional[str]],
+        replica_engine: Engine,
+        decoder: str = "pgoutput",
+        tables: Sequence[str] = DEFAULT_TABLES,
+        publication: str = DEFAULT_PUBLICATION,
+        max_tracked: int = 100_000,
+        check_interval: float = 0.1,
+        late_after: float = 1.0,
+        missing_after: float = 30.0,
+    ) -> None:
+        if decoder == "pgoutput":
+            self.decoder: Any = PgOutputDecoder(publication, tables)
+        elif decoder == "wal2json":
+            self.decoder = Wal2JsonDecoder(tables)
+        else:
+            raise ValueError(f"Unknown decoder: {decoder}")
+
+        self.primary_config = primary_config
+        self.replica_engine = replica_engine
+        self.tables = list(tables)
+        self.publication = publication
+        self.slot_name = f"replication_audit_{os.getpid()}"
+        self.max_tracked = max_tracked
+        self.check_interval = check_interval
+        self.late_after = late_after
+        self.missing_after = missing_after
+
+        self.latency = Histogram()
+        self.counts = {
+            "decoded": 0,
+            "visible": 0,
+            "late": 0,
+            "superseded": 0,
+            "missing": 0,
+            "not_replayed": 0,
+            "evicted": 0,
+        }
+        self.problems: Deque[Tuple[str, Change]] = deque(maxlen=100)
+        self.last_error: Optional[str] = None
+        self._tracked: "OrderedDict[Tuple[str, Tuple], Change]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _connect(self, **kwargs) -> Any:
+        import psycopg2
+
+        return psycopg2.connect(
+            host=self.primary_config.get("host"),
+            port=self.primary_config.get("port") or 5432,
+            user=self.primary_config.get("user"),
+            password=self.primary_config.get("password"),
+            dbname=self.primary_config.get("database"),
+            sslmode=self.primary_config.get("sslmode") or "require",
+            **kwargs,
+        )
+
+    def prepare(self) -> None:
+        """Check `wal_level` and create the publication pgoutput needs."""
+        conn = self._connect()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW wal_level")
+                (wal_level,) = cursor.fetchone()
+                if wal_level != "logical":
+                    raise RuntimeError(
+                        f"wal_level is '{wal_level}' on the primary; set the server "
+                        "parameter wal_level to 'logical' and restart the server"
+                    )
+                if self.decoder.plugin == "pgoutput":
+                    cursor.execute(
+                        "SELECT 1 FROM pg_publication WHERE pubname = %s", (self.publication,)
+                    )
+                    if cursor.fetchone() is None:
+                        tables = ", ".join(f'"{table}"' for table in self.tables)
+                        cursor.execute(
+                            f'CREATE PUBLICATION "{self.publication}" FOR TABLE {tables}'
+                        )
+        finally:
+            conn.close()
+
+    def start(self) -> "ReplicationAudit":
+        """Start decoding and checking; returns once the slot exists."""
+        from psycopg2.extras import LogicalReplicationConnection
+
+        self.prepare()
+        conn = self._connect(connection_factory=LogicalReplicationConnection)
+        cursor = conn.cursor()
+        cursor.execute(
+            f"CREATE_REPLICATION_SLOT {self.slot_name} TEMPORARY LOGICAL {self.decoder.plugin}"
+        )
+        cursor.start_replication(
+            slot_name=self.slot_name, decode=False, options=self.decoder.options()
+        )
+
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._consume, args=(conn, cursor), name="audit-decode", daemon=True
+            ),
+            threading.Thread(target=self._check, name="audit-check", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _consume(self, conn: Any, cursor: Any) -> None:
+        try:
+            while not self._stop.is_set():
+                message = cursor.read_message()
+                if message is None:
+                    select.select([cursor], [], [], 0.5)
+                    continue
+                changes = self.decoder.decode(message.payload, message.data_start)
+                if changes:
+                    self.track(changes)
+                cursor.send_feedback(flush_lsn=message.data_start)
+        except Exception as e:
+            self.last_error = f"Decoding failed: {e}"
+            logger.error(self.last_error)
+        finally:
+            conn.close()
+
+    def _check(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                self.last_error = f"Replica check failed: {e}"
+                logger.warning(self.last_error)
+
+    def track(self, changes: Sequence[Change]) -> None:
+        """Add decoded changes, replacing older pending changes to the same key."""
+        with self._lock:
+            for change in changes:
+                self.counts["decoded"] += 1
+                index_key = (change.table, change.key)
+                if self._tracked.pop(index_key, None) is not None:
+                    self.counts["superseded"] += 1
+                self._tracked[index_key] = change
+                if len(self._tracked) > self.max_tracked:
+                    self._tracked.popitem(last=False)
+                    self.counts["evicted"] += 1
+
+    def check_once(self) -> None:
+        """Check every change the replica should have replayed by now.
+
+        Changes whose commit the replica has not replayed within
+        `missing_after` seconds are given up as `not_replayed`.
+        """
+        with self.replica_engine.connect() as conn:
+            replay_lsn, replica_now = conn.execute(REPLAY_POSITION_QUERY).one()
+        # Not a standby: everything committed is visible
+        replayed = parse_lsn(replay_lsn) if replay_lsn else None
+
+        ready = []
+        now = time.monotonic()
+        with self._lock:
+            for index_key, change in list(self._tracked.items()):
+                if replayed is None or change.lsn <= replayed:
+                    ready.append(change)
+                elif now - change.decoded_at > self.missing_after:
+                    del self._tracked[index_key]
+                    self.counts["not_replayed"] += 1
+                    self.problems.append(("not replayed", change))
+        if not ready:
+            return
+
+        rows = self._fetch_rows(ready)
+        now = time.monotonic()
+        with self._lock:
+            for change in ready:
+                index_key = (change.table, change.key)
+                if self._tracked.get(index_key) is not change:
+                    continue
+
+                row = rows.get(index_key)
+                if change.operation == "delete":
+                    visible = row is None
+                else:
+                    visible = row is not None and all(
+                        row.get(column) == value for column, value in change.values.items()
+                    )
+
+                if visible:
+                    del self._tracked[index_key]
+                    self.counts["visible"] += 1
+                    if change.committed_at is not None:
+                        latency = max((replica_now - change.committed_at).total_seconds(), 0.0)
+                        self.latency.observe(latency)
+                        if latency > self.late_after:
+                            self.counts["late"] += 1
+                            self.problems.append(("late", change))
+                elif now - change.decoded_at > self.missing_after:
+                    del self._tracked[index_key]
+                    self.counts["missing"] += 1
+                    self.problems.append(("missing", change))
+
+    def _fetch_rows(
+        self, changes: Sequence[Change]
+    ) -> Dict[Tuple[str, Tuple], Dict[str, Optional[str]]]:
+        """Read the current rows of the changed keys on the replica as text."""
+        by_table: Dict[Tuple[str, Tuple[str, ...]], List[Tuple]] = {}
+        for change in changes:
+            by_table.setdefault((change.table, change.key_columns), []).append(change.key)
+
+        rows: Dict[Tuple[str, Tuple], Dict[str, Optional[str]]] = {}
+        with self.replica_engine.connect() as conn:
+            for (table_name, key_columns), keys in by_table.items():
+                table = reflect_table(self.replica_engine, table_name)
+                key_clause = tuple_(*[table.c[name] for name in key_columns])
+                query = sql_select(*[_output_text(column) for column in table.columns]).where(
+                    key_clause.in_(keys)
+                )
+                for row in conn.execute(query):
+                    values = dict(row._mapping)
+                    key = tuple(values[name] for name in key_columns)
+                    rows[(table_name, key)] = values
+        return rows
+
+    @property
+    def pending(self) -> int:
+        return len(self._tracked)
+
+    def summary(self) -> Dict[str, float]:
+        """Change counts and visibility latency in milliseconds."""
+        stats = self.latency.summary()
+        return {
+            **self.counts,
+            "pending": self.pending,
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+            "max_ms": stats["max_ms"],
+        }
@@ -0,0 +1,429 @@
+"""
+Server-side metrics collector for load test runs.
+
+Periodically snapshots PostgreSQL statistics views on the primary and the
+replica, turns cumulative counters into per-interval deltas and appends
+the samples to a columnar time series file (Parquet, or the Arrow IPC
+stream format for `.arrow`/`.arrows`/`.ipc` paths, read back with
+`pyarrow.ipc.open_stream`). Writing requires `pyarrow`.
+
+Each sample is one row of the long-format table described by
+`SAMPLE_COLUMNS`: when it was taken, on which server, from which source
+view, for which key (statement id, database, standby, lock type, ...),
+the metric name, whether it is a per-interval `delta` or a point-in-time
+`gauge`, its value and the length of the interval in seconds.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_COLUMNS = [
+    "ts",
+    "server",
+    "source",
+    "key",
+    "label",
+    "metric",
+    "kind",
+    "value",
+    "interval_s",
+]
+
+# Errors after which a source is not queried again on that server: the view
+# or a column does not exist in this version, or pg_stat_statements is not
+# in shared_preload_libraries. Other errors are retried on the next snapshot.
+DISABLING_SQLSTATES = {"42P01", "42703", "55000"}
+
+# Roles a source applies to, based on pg_is_in_recovery()
+PRIMARY = "primary"
+REPLICA = "replica"
+ANY = "any"
+
+
+@dataclass(frozen=True)
+class Source:
+    """A statistics query whose rows are turned into samples."""
+
+    name: str
+    sql: str
+    counters: Sequence[str] = ()
+    gauges: Sequence[str] = ()
+    role: str = ANY
+
+
+SOURCES = [
+    Source(
+        "pg_stat_statements",
+        """
+        SELECT concat_ws('/', queryid, userid, dbid, toplevel) AS key,
+               left(query, 200) AS label,
+               calls, total_exec_time, rows, shared_blks_hit, shared_blks_read,
+               temp_blks_written, wal_bytes
+        FROM pg_stat_statements
+        WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+        ORDER BY total_exec_time DESC
+        LIMIT :top_statements
+        """,
+        counters=(
+            "calls",
+            "total_exec_time",
+            "rows",
+            "shared_blks_hit",
+            "shared_blks_read",
+            "temp_blks_written",
+            "wal_bytes",
+        ),
+    ),
+    Source(
+        "pg_stat_database",
+        """
+        SELECT datname AS key, numbackends, xact_commit, xact_rollback,
+               blks_read, blks_hit, tup_returned, tup_fetched, tup_inserted,
+               tup_updated, tup_deleted, conflicts, temp_bytes, deadlocks
+        FROM pg_stat_database
+        WHERE datname = current_database()
+        """,
+        counters=(
+            "xact_commit",
+            "xact_rollback",
+            "blks_read",
+            "blks_hit",
+            "tup_returned",
+            "tup_fetched",
+            "tup_inserted",
+            "tup_updated",
+            "tup_deleted",
+            "conflicts",
+            "temp_bytes",
+            "deadlocks",
+        ),
+        gauges=("numbackends",),
+    ),
+    # pg_stat_bgwriter lost its checkpoint columns in PostgreSQL 17, where
+    # they moved to pg_stat_checkpointer; whichever query fails is disabled
+    # (see `DISABLING_SQLSTATES`)
+    Source(
+        "pg_stat_bgwriter",
+        """
+        SELECT 'bgwriter' AS key, checkpoints_timed, checkpoints_req,
+               checkpoint_write_time, checkpoint_sync_time,
+               buffers_checkpoint, buffers_clean, buffers_backend
+        FROM pg_stat_bgwriter
+        """,
+        counters=(
+            "checkpoints_timed",
+            "checkpoints_req",
+            "checkpoint_write_time",
+            "checkpoint_sync_time",
+            "buffers_checkpoint",
+            "buffers_clean",
+            "buffers_backend",
+        ),
+    ),
+    Source(
+        "pg_stat_checkpointer",
+        """
+        SELECT 'checkpointer' AS key, num_timed, num_requested,
+               write_time, sync_time, buffers_written
+        FROM pg_stat_checkpointer
+        """,
+        counters=("num_timed", "num_requested", "write_time", "sync_time", "buffers_written"),
+    ),
+    Source(
+        "pg_stat_wal",
+        """
+        SELECT 'wal' AS key, wal_records, wal_fpi, wal_bytes, wal_buffers_full
+        FROM pg_stat_wal
+        """,
+        counters=("wal_records", "wal_fpi", "wal_bytes", "wal_buffers_full"),
+    ),
+    Source(
+        "pg_stat_replication",
+        """
+        SELECT coalesce(application_name, '') || '@'
+                   || coalesce(client_addr::text, 'local') AS key,
+               pg_wal_lsn_diff(pg_current_wal_lsn(), sent_lsn) AS sent_lag_bytes,
+               pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn) AS replay_lag_bytes,
+               EXTRACT(EPOCH FROM write_lag) AS write_lag_seconds,
+               EXTRACT(EPOCH FROM flush_lag) AS flush_lag_seconds,
+               EXTRACT(EPOCH FROM replay_lag) AS replay_lag_seconds
+        FROM pg_stat_replication
+        """,
+        gauges=(
+            "sent_lag_bytes",
+            "replay_lag_bytes",
+            "write_lag_seconds",
+            "flush_lag_seconds",
+            "replay_lag_seconds",
+        ),
+        role=PRIMARY,
+    ),
+    Source(
+        "replay",
+        """
+        SELECT 'replay' AS key,
+               EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                   AS replay_delay_seconds,
+               pg_wal_lsn_diff(pg_last_wal_receive_lsn(), pg_last_wal_replay_lsn())
+                   AS replay_pending_bytes
+        """,
+        gauges=("replay_delay_seconds", "replay_pending_bytes"),
+        role=REPLICA,
+    ),
+    Source(
+        "pg_locks",
+        """
+        SELECT locktype AS key,
+               count(*) FILTER (WHERE NOT granted) AS waiting,
+               count(*) AS held_or_waiting
+        FROM pg_locks
+        GROUP BY locktype
+        """,
+        gauges=("waiting", "held_or_waiting"),
+    ),
+    Source(
+        "pg_stat_activity",
+        """
+        SELECT coalesce(wait_event_type, 'CPU') AS key, count(*) AS active_backends
+        FROM pg_stat_activity
+        WHERE state = 'active' AND pid <> pg_backend_pid()
+        GROUP BY 1
+        """,
+        gauges=("active_backends",),
+    ),
+]
+
+
+class ColumnarWriter:
+    """Append samples to a Parquet or Arrow IPC file (requires pyarrow)."""
+
+    IPC_SUFFIXES = (".arrow", ".arrows", ".ipc")
+
+    def __init__(self, path: Path) -> None:
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("Writing metrics requires the pyarrow package") from e
+
+        self.path = Path(path)
+        self._pa = pa
+        category = pa.dictionary(pa.int32(), pa.string())
+        self.schema = pa.schema(
+            [
+                ("ts", pa.timestamp("ms", tz="UTC")),
+                ("server", category),
+                ("source", category),
+                ("key", pa.string()),
+                ("label", category),
+                ("metric", category),
+                ("kind", category),
+                ("value", pa.float64()),
+                ("interval_s", pa.float64()),
+            ]
+        )
+        self._writer: Any = None
+
+    def write(self, samples: List[Dict[str, Any]]) -> None:
+        """Write a batch of samples as one row group / record batch."""
+        if not samples:
+            return
+        table = self._pa.Table.from_pylist(samples, schema=self.schema)
+
+        if self._writer is None:
+            if self.path.suffix in self.IPC_SUFFIXES:
+                import pyarrow.ipc
+
+                # The stream format allows each batch to carry its own
+                # dictionaries, which the IPC file format does not
+                self._writer = pyarrow.ipc.new_stream(str(self.path), self.schema)
+            else:
+                import pyarrow.parquet
+
+                self._writer = pyarrow.parquet.ParquetWriter(
+                    str(self.path), self.schema, compression="zstd"
+                )
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class MetricsCollector:
+    """Snapshot statistics views on several servers and emit interval deltas."""
+
+    def __init__(
+        self,
+        engines: Dict[str, Engine],
+        writer: Optional[ColumnarWriter] = None,
+        interval: float = 5.0,
+        top_statements: int = 50,
+        flush_every: int = 12,
+    ) -> None:
+        self.engines = engines
+        self.writer = writer
+        self.interval = interval
+        self.top_statements = top_statements
+        self.flush_every = flush_every
+
+        # Last value of every counter and the number of the snapshot it is from
+        self._previous: Dict[Tuple[str, str, str, str], Tuple[int, float]] = {}
+        self._last_snapshot: Dict[str, float] = {}
+        self._snapshots: Dict[str, int] = {}
+        self._disabled: Dict[str, set] = {server: set() for server in engines}
+        self._roles: Dict[str, str] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_intervals = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _role(self, server: str, conn: Any) -> str:
+        if server not in self._roles:
+            in_recovery = conn.execute(text("SELECT pg_is_in_recovery()")).scalar()
+            self._roles[server] = REPLICA if in_recovery else PRIMARY
+        return self._roles[server]
+
+    def snapshot(self, server: str) -> List[Dict[str, Any]]:
+        """Query every applicable source on one server and return its samples."""
+        engine = self.engines[server]
+        now = time.monotonic()
+        previous_snapshot = self._last_snapshot.get(server)
+        interval_s = now - previous_snapshot if previous_snapshot is not None else None
+        self._last_snapshot[server] = now
+        number = self._snapshots.get(server, 0) + 1
+        self._snapshots[server] = number
+        ts = datetime.now(timezone.utc)
+
+        samples: List[Dict[str, Any]] = []
+        # Autocommit so that a failing source does not abort the others and
+        # every query sees fresh statistics rather than a transaction snapshot
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            role = self._role(server, conn)
+            for source in SOURCES:
+                if source.name in self._disabled[server]:
+                    continue
+                if source.role not in (ANY, role):
+                    continue
+                try:
+                    rows = conn.execute(
+                        text(source.sql), {"top_statements": self.top_statements}
+                    ).mappings().all()
+                except DBAPIError as e:
+                    if e.connection_invalidated:
+                        raise
+                    if getattr(e.orig, "pgcode", None) in DISABLING_SQLSTATES:
+                        logger.warning("Disabling %s on %s: %s", source.name, server, e)
+                        self._disabled[server].add(source.name)
+                    else:
+                        logger.warning("Querying %s on %s failed: %s", source.name, server, e)
+                    continue
+
+                for row in rows:
+                    samples.extend(
+                        self._row_samples(server, source, row, ts, interval_s, number)
+                    )
+        return samples
+
+    def _row_samples(
+        self,
+        server: str,
+        source: Source,
+        row: Any,
+        ts: datetime,
+        interval_s: Optional[float],
+        snapshot: int,
+    ) -> List[Dict[str, Any]]:
+        key = str(row["key"])
+        label = row.get("label")
+        base = {
+            "ts": ts,
+            "server": server,
+            "source": source.name,
+            "key": key,
+            "label": label,
+            "interval_s": interval_s,
+        }
+        samples = []
+        for metric in source.counters:
+            value = row[metric]
+            if value is None:
+                continue
+            value = float(value)
+            previous = self._previous.get((server, source.name, key, metric))
+            self._previous[(server, source.name, key, metric)] = (snapshot, value)
+            if previous is None or interval_s is None or previous[0] != snapshot - 1:
+                # A first sighting only establishes the baseline, as does a row
+                # missing from the previous snapshot (e.g. a statement back in
+                # the top N), whose delta would span several intervals
+                continue
+            # A counter that went backwards was reset; count from zero
+            delta = value - previous[1] if value >= previous[1] else value
+            samples.append(dict(base, metric=metric, kind="delta", value=delta))
+        for metric in source.gauges:
+            value = row[metric]
+            if value is None:
+                continue
+            samples.append(dict(base, metric=metric, kind="gauge", value=float(value)))
+        return samples
+
+    def collect_once(self) -> List[Dict[str, Any]]:
+        """Snapshot every server once and buffer the samples for writing."""
+        samples: List[Dict[str, Any]] = []
+        for server in self.engines:
+            try:
+                samples.extend(self.snapshot(server))
+            except Exception as e:
+                logger.warning("Snapshot of %s failed: %s", server, e)
+
+        self._pending.extend(samples)
+        self._pending_intervals += 1
+        if self._pending_intervals >= self.flush_every:
+            self.flush()
+        return samples
+
+    def flush(self) -> None:
+        """Write buffered samples to the output file."""
+        if self.writer is not None:
+            self.writer.write(self._pending)
+        self._pending = []
+        self._pending_intervals = 0
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """Collect every `interval` seconds until stopped or `duration` elapses."""
+        deadline = time.monotonic() + duration if duration is not None else None
+        next_run = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                self.collect_once()
+                next_run += self.interval
+                if deadline is not None and next_run > deadline:
+                    break
+                self._stop.wait(max(0.0, next_run - time.monotonic()))
+        finally:
+            self.flush()
+
+    def start(self, duration: Optional[float] = None) -> None:
+        """Run the collector in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(duration,), name="metrics-collector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop a background collector and wait for its final flush."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,110 @@
+"""
+Lazily loaded configuration for the database tooling.
+
+The environment file generated by Terraform is only read the first time a
+tool actually asks for configuration, so importing a module never touches
+the filesystem or exits the process.
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Location of the variables file generated by terraform/load_test.tf
+ENV_FILE = Path(__file__).parent.parent.parent / "terraform" / "load_test_variables.env"
+
+# Environment variables holding the server FQDN for each database role
+SERVER_FQDN_VARS = {
+    "primary": "PRIMARY_SERVER_FQDN",
+    "replica": "REPLICA_SERVER_FQDN",
+}
+
+# Comma separated FQDNs of all read replicas, REPLICA_SERVER_FQDN being the first
+REPLICA_SET_VAR = "REPLICA_SERVER_FQDNS"
+
+CREDENTIAL_VARS = [
+    "POSTGRES_ADMIN_USERNAME",
+    "POSTGRES_ADMIN_PASSWORD",
+    "DATABASE_NAME",
+]
+
+# Values of boolean settings such as DB_INSTRUMENT that switch them on
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class ConfigError(Exception):
+    """Raised when the database configuration cannot be loaded."""
+
+
+@lru_cache(maxsize=None)
+def load_environment(env_file: Path = ENV_FILE) -> Path:
+    """Load the Terraform generated environment file once per process."""
+    if not env_file.exists():
+        raise ConfigError(f"{env_file} not found.")
+
+    # Deferred so that importing the config module stays cheap
+    from dotenv import load_dotenv
+
+    load_dotenv(env_file)
+    return env_file
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean setting from the environment, case-insensitively."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in TRUE_VALUES
+
+
+def required_env_vars(*roles: str) -> List[str]:
+    """Return the environment variables needed to connect to the given roles."""
+    return [SERVER_FQDN_VARS[role] for role in roles] + CREDENTIAL_VARS
+
+
+def missing_env_vars(*roles: str) -> List[str]:
+    """Return the required environment variables that are not set."""
+    load_environment()
+    missing = [var for var in required_env_vars(*roles) if not os.environ.get(var)]
+    if os.environ.get(REPLICA_SET_VAR) and SERVER_FQDN_VARS["replica"] in missing:
+        missing.remove(SERVER_FQDN_VARS["replica"])
+    return missing
+
+
+def get_db_config(role: str = "primary") -> Dict[str, Optional[str]]:
+    """Build the connection settings for the primary or replica database."""
+    if role not in SERVER_FQDN_VARS:
+        raise ConfigError(f"Unknown database role: {role}")
+
+    load_environment()
+    host = os.environ.get(SERVER_FQDN_VARS[role])
+    if role == "replica" and not host:
+        hosts = replica_hosts()
+        host = hosts[0] if hosts else None
+    return _server_config(host)
+
+
+def replica_hosts() -> List[str]:
+    """Return the FQDNs of all configured read replicas."""
+    load_environment()
+    hosts = os.environ.get(REPLICA_SET_VAR, "")
+    names = [host.strip() for host in hosts.split(",") if host.strip()]
+    if not names and os.environ.get(SERVER_FQDN_VARS["replica"]):
+        names = [os.environ[SERVER_FQDN_VARS["replica"]]]
+    return names
+
+
+def get_replica_configs() -> List[Dict[str, Optional[str]]]:
+    """Build the connection settings for every replica of the replica set."""
+    return [_server_config(host) for host in replica_hosts()]
+
+
+def _server_config(host: Optional[str]) -> Dict[str, Optional[str]]:
+    return {
+        "host": host,
+        "user": os.environ.get("POSTGRES_ADMIN_USERNAME"),
+        "password": os.environ.get("POSTGRES_ADMIN_PASSWORD"),
+        "database": os.environ.get("DATABASE_NAME"),
+        "sslmode": "require",
+    }
@@ -0,0 +1,153 @@
+"""
+Engine construction and cached schema reflection.
+
+`create_async_db_engine` builds the asyncio counterpart on the asyncpg
+driver; its reflection goes through the same cache, keyed by the engine's
+`sync_engine`.
+
+`warm_pool` and `warm_async_pool` open a pool's connections in parallel
+before a run, so connection setup, which dominates short runs against a
+remote region, is paid once up front instead of by the first queries.
+
+Reflected `Table` objects are cached per engine so repeated verification
+calls do not pay a catalog round-trip for every table on every call.
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from sqlalchemy import URL, Connection, Engine, MetaData, Table, create_engine
+
+from pgtools.instrumentation import get_default as get_default_instrumentation
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Reflected metadata per engine, dropped automatically with the engine
+_reflected: "weakref.WeakKeyDictionary[Engine, MetaData]" = weakref.WeakKeyDictionary()
+
+
+def build_url(config: Dict[str, Optional[str]], driver: str = "psycopg2") -> URL:
+    """Build a PostgreSQL connection URL from a database config dictionary."""
+    user = config.get("user")
+    password = config.get("password")
+    host = config.get("host")
+    database = config.get("database")
+    if not all([user, password, host, database]):
+        raise ValueError("Missing required database connection parameters")
+
+    # psycopg2 takes sslmode in the URL, asyncpg takes it as a connect argument
+    query = {}
+    if driver == "psycopg2":
+        query["sslmode"] = config.get("sslmode") or "require"
+
+    port = config.get("port")
+    return URL.create(
+        f"postgresql+{driver}",
+        username=user,
+        password=password,
+        host=host,
+        port=int(port) if port else None,
+        database=database,
+        query=query,
+    )
+
+
+def create_db_engine(config: Dict[str, Optional[str]], **kwargs) -> Engine:
+    """Create a synchronous engine with SQL echo disabled.
+
+    The engine is instrumented when query instrumentation is enabled.
+    """
+    kwargs.setdefault("echo", False)
+    engine = create_engine(build_url(config), **kwargs)
+
+    instrumentation = get_default_instrumentation()
+    if instrumentation is not None:
+        instrumentation.attach(engine)
+    return engine
+
+
+def create_async_db_engine(config: Dict[str, Optional[str]], **kwargs: Any) -> "AsyncEngine":
+    """Create an asyncio engine on the asyncpg driver with SQL echo disabled.
+
+    The engine is instrumented when query instrumentation is enabled.
+    """
+    # Imported here so the sync tools do not load greenlet and asyncpg
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    kwargs.setdefault("echo", False)
+    # asyncpg takes the SSL mode as a connect argument, not a URL parameter
+    connect_args = kwargs.pop("connect_args", {})
+    connect_args.setdefault("ssl", config.get("sslmode") or "require")
+    engine = create_async_engine(
+        build_url(config, driver="asyncpg"), connect_args=connect_args, **kwargs
+    )
+
+    instrumentation = get_default_instrumentation()
+    if instrumentation is not None:
+        instrumentation.attach(engine.sync_engine)
+    return engine
+
+
+def warm_pool(engine: Engine, size: Optional[int] = None) -> int:
+    """Open `size` connections (default: the pool size) in parallel.
+
+    The connections are returned to the pool afterwards and stay open, so
+    the first `size` concurrent checkouts do not have to connect. Returns
+    the number of connections opened; the first connection error is raised
+    after the others have been returned.
+    """
+    size = size or engine.pool.size()
+    with ThreadPoolExecutor(max_workers=size, thread_name_prefix="warm-pool") as executor:
+        futures = [executor.submit(engine.connect) for _ in range(size)]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    for future in futures:
+        if future.exception() is None:
+            future.result().close()
+    if errors:
+        raise errors[0]
+    return size
+
+
+async def warm_async_pool(engine: "AsyncEngine", size: Optional[int] = None) -> int:
+    """Open `size` connections of an async engine concurrently, see `warm_pool`."""
+    size = size or engine.sync_engine.pool.size()
+    results = await asyncio.gather(
+        *[engine.connect().start() for _ in range(size)], return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    await asyncio.gather(
+        *[result.close() for result in results if not isinstance(result, BaseException)]
+    )
+    if errors:
+        raise errors[0]
+    return size
+
+
+def reflect_table(
+    engine: Engine, table_name: str, bind: Optional[Connection] = None
+) -> Table:
+    """Reflect a table once per engine and return the cached `Table`.
+
+    `bind` reflects over an existing connection of `engine`, which is how
+    async engines reflect from inside `AsyncConnection.run_sync`.
+    """
+    metadata = _reflected.get(engine)
+    if metadata is None:
+        metadata = MetaData()
+        _reflected[engine] = metadata
+
+    table = metadata.tables.get(table_name)
+    if table is None:
+        table = Table(table_name, metadata, autoload_with=bind if bind is not None else engine)
+    return table
+
+
+def clear_reflection_cache(engine: Optional[Engine] = None) -> None:
+    """Forget reflected tables, e.g. after the schema has been changed."""
+    if engine is None:
+        _reflected.clear()
+    else:
+        _reflected.pop(engine, None)
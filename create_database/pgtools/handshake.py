@@ -0,0 +1,200 @@
+"""
+Connection setup timing split into TCP, TLS, authentication and query time.
+
+libpq does not report how long the phases of a connection attempt take, so
+every sample opens two connections: a probe that performs the TCP connect
+and the TLS handshake itself and then hangs up, and a real psycopg2
+connection whose total setup time, minus the probe's TCP and TLS time, is
+reported as authentication (startup packet, SCRAM exchange and backend
+start). Two `SELECT 1` round-trips follow on the real connection; the first
+includes backend warm-up such as catalog cache loading.
+
+The probe also offers the previous sample's TLS session for resumption.
+PostgreSQL disables session caching and tickets on the server, and neither
+libpq nor asyncpg can offer a session, so `resumed` documents whether a
+server would accept one rather than something the drivers can use. What
+the drivers do support is direct TLS negotiation (`PGSSLNEGOTIATION=direct`,
+PostgreSQL 17 or later on both ends), which saves the SSLRequest round-trip
+and which the probe honours as well.
+"""
+
+import os
+import socket
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from pgtools.instrumentation import Histogram
+
+# Protocol code of the SSLRequest message sent before a TLS handshake
+SSL_REQUEST_CODE = 80877103
+
+# ALPN protocol required for direct TLS negotiation
+ALPN_PROTOCOL = "postgresql"
+
+# Seconds to wait for TLS 1.3 session tickets after a handshake
+TICKET_WAIT = 0.05
+
+PHASES = ["tcp", "tls", "auth", "first_query", "query"]
+
+
+@dataclass
+class ConnectTiming:
+    tcp: float
+    tls: float
+    auth: float
+    first_query: float
+    query: float
+    tls_version: Optional[str] = None
+    resumed: bool = False
+
+    @property
+    def connect(self) -> float:
+        return self.tcp + self.tls + self.auth
+
+
+def _tls_context() -> ssl.SSLContext:
+    # Same checks as sslmode=require: encrypted, but the certificate is not verified
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.set_alpn_protocols([ALPN_PROTOCOL])
+    return context
+
+
+def probe_handshake(
+    config: Dict[str, Optional[str]],
+    timeout: float = 10.0,
+    session: Optional[ssl.SSLSession] = None,
+    context: Optional[ssl.SSLContext] = None,
+) -> Tuple[float, float, Optional[ssl.SSLSocket]]:
+    """Time the TCP connect and TLS handshake to a server.
+
+    Returns the TCP and TLS seconds and the TLS socket, which the caller has
+    to close. No TLS is negotiated with `sslmode=disable`.
+    """
+    host = config.get("host")
+    port = int(config.get("port") or 5432)
+
+    start = time.perf_counter()
+    sock = socket.create_connection((host, port), timeout=timeout)
+    tcp = time.perf_counter() - start
+    if (config.get("sslmode") or "require") == "disable":
+        sock.close()
+        return tcp, 0.0, None
+
+    start = time.perf_counter()
+    try:
+        if os.environ.get("PGSSLNEGOTIATION") != "direct":
+            sock.sendall(struct.pack("!ii", 8, SSL_REQUEST_CODE))
+            if sock.recv(1) != b"S":
+                raise ConnectionError(f"{host} does not accept SSL connections")
+        tls_sock = (context or _tls_context()).wrap_socket(
+            sock, server_hostname=host, session=session
+        )
+    except Exception:
+        sock.close()
+        raise
+    return tcp, time.perf_counter() - start, tls_sock
+
+
+class ConnectProfiler:
+    """Collect connection setup timings per phase over repeated samples."""
+
+    def __init__(self, config: Dict[str, Optional[str]], connect_timeout: int = 10) -> None:
+        self.config = config
+        self.connect_timeout = connect_timeout
+        self.phases: Dict[str, Histogram] = {phase: Histogram() for phase in PHASES}
+        self.samples: List[ConnectTiming] = []
+        self._context = _tls_context()
+        self._session: Optional[ssl.SSLSession] = None
+
+    def sample(self) -> ConnectTiming:
+        """Measure one connection setup and two queries on it."""
+        import psycopg2
+
+        tcp, tls, tls_sock = probe_handshake(
+            self.config, self.connect_timeout, self._session, self._context
+        )
+        tls_version = None
+        resumed = False
+        if tls_sock is not None:
+            tls_version = tls_sock.version()
+            resumed = tls_sock.session_reused
+            # TLS 1.3 session tickets arrive after the handshake and are only
+            # processed by a read; the server sends nothing else until it
+            # gets a startup packet, so the read just waits briefly for them
+            tls_sock.settimeout(TICKET_WAIT)
+            try:
+                tls_sock.recv(1)
+            except (socket.timeout, ssl.SSLError):
+                pass
+            self._session = tls_sock.session
+            tls_sock.close()
+
+        start = time.perf_counter()
+        conn = psycopg2.connect(
+            host=self.config.get("host"),
+            port=self.config.get("port") or 5432,
+            user=self.config.get("user"),
+            password=self.config.get("password"),
+            dbname=self.config.get("database"),
+            sslmode=self.config.get("sslmode") or "require",
+            connect_timeout=self.connect_timeout,
+        )
+        connect = time.perf_counter() - start
+        try:
+            queries = []
+            with conn.cursor() as cursor:
+                for _ in range(2):
+                    start = time.perf_counter()
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                    queries.append(time.perf_counter() - start)
+        finally:
+            conn.close()
+
+        timing = ConnectTiming(
+            tcp=tcp,
+            tls=tls,
+            # The probe and the real connection are separate attempts, so
+            # clamp the estimate when the real one happened to be faster
+            auth=max(connect - tcp - tls, 0.0),
+            first_query=queries[0],
+            query=queries[1],
+            tls_version=tls_version,
+            resumed=resumed,
+        )
+        for phase in PHASES:
+            self.phases[phase].observe(getattr(timing, phase))
+        self.samples.append(timing)
+        return timing
+
+    def run(self, samples: int, interval: float = 0.0) -> "ConnectProfiler":
+        for index in range(samples):
+            if index and interval:
+                time.sleep(interval)
+            self.sample()
+        return self
+
+    def report(self) -> str:
+        """Format the per-phase percentiles as a text table."""
+        lines = [f"{'phase':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'share':>6}"]
+        total = sum(self.phases[phase].total for phase in PHASES) or 1.0
+        for phase in PHASES:
+            stats = self.phases[phase].summary()
+            lines.append(
+                f"{phase:<12} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+                f"{stats['max_ms']:>8.1f} {self.phases[phase].total / total:>6.0%}"
+            )
+        versions = sorted({s.tls_version for s in self.samples if s.tls_version})
+        if versions:
+            resumed = sum(s.resumed for s in self.samples[1:])
+            lines.append(
+                f"TLS: {', '.join(versions)}, "
+                f"{'direct' if os.environ.get('PGSSLNEGOTIATION') == 'direct' else 'SSLRequest'}"
+                f" negotiation, {resumed}/{max(len(self.samples) - 1, 0)} sessions resumed"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,330 @@
+"""
+Query-level instrumentation for SQLAlchemy engines.
+
+Attaching a `QueryInstrumentation` to an engine records, per statement,
+the execution latency and row counts, plus the time spent waiting for a
+connection from the pool and establishing new connections. Statements
+slower than a threshold are written to the `pgtools.slow_query` logger.
+
+Recorded values can additionally be exported to Prometheus or OpenTelemetry
+when the respective client libraries are installed.
+
+Instrumentation is enabled for every engine created with
+`pgtools.db.create_db_engine` when `DB_INSTRUMENT=1` is set, or explicitly
+via `enable()`. Related settings:
+
+- `DB_SLOW_QUERY_MS`: slow query log threshold in milliseconds
+- `DB_METRICS_PORT`: port for a Prometheus metrics endpoint
+- `DB_OTEL_METRICS=1`: export through the global OpenTelemetry meter provider
+"""
+
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+from sqlalchemy import Engine, event
+
+from pgtools.config import env_flag
+
+slow_query_logger = logging.getLogger("pgtools.slow_query")
+
+# Upper bounds of the histogram buckets in seconds: 0.1 ms growing by a factor
+# of 2^(1/4) (about 19%) up to ~210 s, fine enough for p95/p99 estimates
+DEFAULT_BUCKETS = tuple(0.0001 * 2 ** (step / 4) for step in range(85))
+
+# Coarser doubling buckets for Prometheus to keep the series count low
+PROMETHEUS_BUCKETS = tuple(0.0001 * 2**exponent for exponent in range(21))
+
+# Maximum length of a statement used as histogram key
+MAX_STATEMENT_LENGTH = 200
+
+# Histogram names for the non-statement measurements
+CHECKOUT_WAIT = "pool checkout wait"
+CONNECT = "connect"
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, rows: int = 0) -> None:
+        """Record a single duration and the number of rows it touched."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.rows += max(rows, 0)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """Estimate a percentile (0..1) as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.max
+                return min(self.buckets[index], self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Return count, totals and latency percentiles in milliseconds."""
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.mean * 1000,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Exporter(Protocol):
+    """Receives every recorded measurement, e.g. to forward it to a backend."""
+
+    def observe(self, kind: str, name: str, seconds: float, rows: int) -> None:
+        """Record one measurement."""
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse whitespace and truncate a statement for use as a key."""
+    statement = re.sub(r"\s+", " ", statement).strip()
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        statement = statement[: MAX_STATEMENT_LENGTH - 3] + "..."
+    return statement
+
+
+class QueryInstrumentation:
+    """Collects statement, connect and checkout timings from SQLAlchemy events."""
+
+    def __init__(
+        self,
+        slow_query_ms: Optional[float] = None,
+        exporters: Sequence[Exporter] = (),
+    ) -> None:
+        self.slow_query_ms = slow_query_ms
+        self.exporters = list(exporters)
+        self.statements: Dict[str, Histogram] = {}
+        self.pool: Dict[str, Histogram] = {
+            CHECKOUT_WAIT: Histogram(),
+            CONNECT: Histogram(),
+        }
+        self._lock = threading.Lock()
+        # Weak, so attaching does not keep disposed engines alive
+        self._engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+    def attach(self, engine: Engine) -> Engine:
+        """Start recording for an engine; attaching twice is a no-op."""
+        if engine in self._engines:
+            return engine
+        self._engines.add(engine)
+
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        event.listen(engine, "do_connect", self._before_connect)
+        event.listen(engine.pool, "connect", self._after_connect)
+        self._wrap_pool_checkout(engine)
+        return engine
+
+    def _wrap_pool_checkout(self, engine: Engine) -> None:
+        # SQLAlchemy has no event that fires before a checkout starts waiting,
+        # so time the pool's internal `_do_get` which blocks until a
+        # connection is available (or a new one has been opened)
+        pool = engine.pool
+        do_get = pool._do_get
+
+        def timed_do_get() -> Any:
+            start = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                self.record("pool", CHECKOUT_WAIT, time.perf_counter() - start)
+
+        pool._do_get = timed_do_get  # type: ignore[method-assign]
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        conn.info.setdefault("pgtools_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        starts = conn.info.get("pgtools_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        rows = cursor.rowcount if cursor.rowcount is not None else 0
+        self.record("statement", normalize_statement(statement), elapsed, rows)
+
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            slow_query_logger.warning(
+                "Slow query (%.1f ms, %d rows): %s",
+                elapsed * 1000,
+                rows,
+                normalize_statement(statement),
+            )
+
+    def _handle_error(self, exception_context) -> None:
+        # Failed statements never reach after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("pgtools_query_start"):
+            conn.info["pgtools_query_start"].pop()
+
+    def _before_connect(self, dialect, conn_rec, cargs, cparams) -> None:
+        conn_rec.info["pgtools_connect_start"] = time.perf_counter()
+
+    def _after_connect(self, dbapi_connection, connection_record) -> None:
+        start = connection_record.info.pop("pgtools_connect_start", None)
+        if start is not None:
+            self.record("pool", CONNECT, time.perf_counter() - start)
+
+    def record(self, kind: str, name: str, seconds: float, rows: int = 0) -> None:
+        """Record a measurement in the histograms and forward it to exporters."""
+        if kind == "statement":
+            histogram = self.statements.get(name)
+            if histogram is None:
+                with self._lock:
+                    histogram = self.statements.setdefault(name, Histogram())
+        else:
+            histogram = self.pool.setdefault(name, Histogram())
+        histogram.observe(seconds, rows)
+
+        for exporter in self.exporters:
+            exporter.observe(kind, name, seconds, rows)
+
+    def report(self, limit: int = 20) -> str:
+        """Format the slowest statements and pool timings as a text table."""
+        lines = [
+            f"{'count':>7} {'rows':>9} {'total ms':>10} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statement"
+        ]
+        histograms = sorted(
+            self.statements.items(), key=lambda item: item[1].total, reverse=True
+        )
+        for name, histogram in list(self.pool.items()) + histograms[:limit]:
+            if not histogram.count:
+                continue
+            stats = histogram.summary()
+            lines.append(
+                f"{stats['count']:>7} {stats['rows']:>9} {stats['total_ms']:>10.1f} "
+                f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+                f"{stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}  {name}"
+            )
+        return "\n".join(lines)
+
+
+class PrometheusExporter:
+    """Export measurements as Prometheus histograms (requires prometheus_client)."""
+
+    def __init__(self, port: Optional[int] = None) -> None:
+        try:
+            from prometheus_client import Histogram as PromHistogram
+            from prometheus_client import start_http_server
+        except ImportError as e:
+            raise ImportError(
+                "Prometheus export requires the prometheus-client package"
+            ) from e
+
+        self.latency = PromHistogram(
+            "pgtools_db_duration_seconds",
+            "Database statement, connect and pool checkout latency",
+            ["kind", "name"],
+            buckets=PROMETHEUS_BUCKETS,
+        )
+        if port is not None:
+            start_http_server(port)
+
+    def observe(self, kind: str, name: str, seconds: float, rows: int) -> None:
+        self.latency.labels(kind=kind, name=name).observe(seconds)
+
+
+class OpenTelemetryExporter:
+    """Export measurements through the global OpenTelemetry meter provider."""
+
+    def __init__(self) -> None:
+        try:
+            from opentelemetry import metrics
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetry export requires the opentelemetry-api package"
+            ) from e
+
+        meter = metrics.get_meter("pgtools")
+        self.latency = meter.create_histogram(
+            "pgtools.db.duration",
+            unit="s",
+            description="Database statement, connect and pool checkout latency",
+        )
+        self.rows = meter.create_counter(
+            "pgtools.db.rows", description="Rows returned or affected by statements"
+        )
+
+    def observe(self, kind: str, name: str, seconds: float, rows: int) -> None:
+        attributes = {"kind": kind, "name": name}
+        self.latency.record(seconds, attributes)
+        if rows > 0:
+            self.rows.add(rows, attributes)
+
+
+_default: Optional[QueryInstrumentation] = None
+_env_checked = False
+
+
+def enable(
+    slow_query_ms: Optional[float] = None,
+    prometheus_port: Optional[int] = None,
+    opentelemetry: bool = False,
+) -> QueryInstrumentation:
+    """Enable instrumentation for all engines created afterwards."""
+    global _default
+
+    exporters: List[Exporter] = []
+    if prometheus_port is not None:
+        exporters.append(PrometheusExporter(prometheus_port))
+    if opentelemetry:
+        exporters.append(OpenTelemetryExporter())
+
+    _default = QueryInstrumentation(slow_query_ms=slow_query_ms, exporters=exporters)
+    return _default
+
+
+def get_default() -> Optional[QueryInstrumentation]:
+    """Return the process-wide instrumentation, enabling it from the environment."""
+    global _env_checked
+
+    if _default is None and not _env_checked:
+        _env_checked = True
+        if env_flag("DB_INSTRUMENT"):
+            slow_query_ms = os.environ.get("DB_SLOW_QUERY_MS")
+            metrics_port = os.environ.get("DB_METRICS_PORT")
+            enable(
+                slow_query_ms=float(slow_query_ms) if slow_query_ms else None,
+                prometheus_port=int(metrics_port) if metrics_port else None,
+                opentelemetry=env_flag("DB_OTEL_METRICS"),
+            )
+    return _default
@@ -0,0 +1,44 @@
+"""
+Lightweight replication lag probe.
+
+Uses psycopg2 directly instead of SQLAlchemy so that a lag check started
+every few seconds during a load test pays as little startup cost as possible.
+"""
+
+from typing import Dict, Optional
+
+# This query works specifically for Azure PostgreSQL Flexible Server
+REPLICA_LAG_QUERY = """
+SELECT
+    CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::INTEGER
+    END AS lag_seconds;
+"""
+
+
+def fetch_replica_lag(
+    config: Dict[str, Optional[str]], connect_timeout: int = 10
+) -> Optional[int]:
+    """Return the replica lag in seconds, or None if the server reports none."""
+    import psycopg2
+
+    conn = psycopg2.connect(
+        host=config.get("host"),
+        port=config.get("port") or 5432,
+        user=config.get("user"),
+        password=config.get("password"),
+        dbname=config.get("database"),
+        sslmode=config.get("sslmode") or "require",
+        connect_timeout=connect_timeout,
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_QUERY)
+            row = cursor.fetchone()
+    finally:
+        conn.close()
+
+    if row is None or row[0] is None:
+        return None
+    return int(row[0])
@@ -0,0 +1,91 @@
+"""
+Shared SQLAlchemy models for the Azure PostgreSQL application.
+
+Defines the `products` and `orders` tables used by every tool. Schema
+changes such as indexes or storage options belong here so that they apply
+consistently everywhere.
+"""
+
+import uuid
+from typing import Any, Type, TypeVar
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    func,
+)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql.compiler import DDLCompiler
+
+# Define SQLAlchemy Base and Models
+Base = declarative_base()
+
+# Single metadata object shared by all tools
+metadata = Base.metadata
+
+# Add type alias for mypy
+T = TypeVar("T", bound=Base)
+ModelType = Type[T]
+
+
+@compiles(CreateTable, "postgresql")
+def create_table_with_storage_parameters(
+    create: CreateTable, compiler: DDLCompiler, **kw: Any
+) -> str:
+    """Add the table's `info["storage_parameters"]` as `WITH (...)`.
+
+    SQLAlchemy has a `postgresql_with` option for indexes but not for
+    tables, e.g. to create `products` with a fillfactor.
+    """
+    statement = compiler.visit_create_table(create, **kw)
+    parameters = create.element.info.get("storage_parameters")
+    if not parameters:
+        return statement
+    options = ", ".join(f"{name} = {int(value)}" for name, value in parameters.items())
+    return f"{statement.rstrip()}\n WITH ({options})\n\n"
+
+
+class Product(Base):
+    __tablename__ = "products"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(100), nullable=False)
+    category = Column(String(50), nullable=False)
+    price = Column(Float(precision=10, decimal_return_scale=2), nullable=False)
+    in_stock = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    # Relationship with Order model
+    orders = relationship("Order", back_populates="product")
+
+    def __repr__(self) -> str:
+        return (
+            f"<Product(id={self.id}, name='{self.name}', "
+            f"category='{self.category}', price={self.price})>"
+        )
+
+
+class Order(Base):
+    __tablename__ = "orders"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
+    quantity = Column(Integer, nullable=False)
+    order_date = Column(DateTime, server_default=func.now(), index=True)
+
+    # Relationship with Product model
+    product = relationship("Product", back_populates="orders")
+
+    def __repr__(self) -> str:
+        return (
+            f"<Order(id={self.id}, product_id={self.product_id}, "
+            f"quantity={self.quantity})>"
+        )
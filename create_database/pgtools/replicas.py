@@ -0,0 +1,219 @@
+"""
+Client-side load balancing of reads over a set of replicas.
+
+Azure read replicas have no shared read endpoint, so read traffic has to be
+spread over them by the client. `LoadBalancer` checks out a connection from
+the replica chosen by one of the `POLICIES` for every read:
+
+- `round_robin`: replicas take turns regardless of their load
+- `least_outstanding`: the replica with the fewest reads in flight
+- `lag_aware`: the least loaded replica among those whose replay delay is
+  below `max_lag_s`, falling back to the least lagging replica
+
+Replay delay for `lag_aware` is refreshed by a background monitor thread.
+The monitor has its own connection to every replica, so a saturated read
+pool neither delays it nor makes a healthy replica look unreachable.
+"""
+
+import itertools
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import Connection, Engine, create_engine
+from sqlalchemy.pool import NullPool
+
+from pgtools.db import create_db_engine, warm_pool
+from pgtools.instrumentation import Histogram
+from pgtools.sampler import REPLAY_DELAY_QUERY
+
+POLICIES = ["round_robin", "least_outstanding", "lag_aware"]
+
+
+@dataclass
+class ReplicaEndpoint:
+    """A replica engine with its in-flight count, lag and read statistics."""
+
+    name: str
+    engine: Engine
+    outstanding: int = 0
+    requests: int = 0
+    errors: int = 0
+    lag_seconds: Optional[float] = None
+    latency: Histogram = field(default_factory=Histogram)
+    # Engine the lag monitor queries, separate from the read pool
+    monitor_engine: Optional[Engine] = None
+
+
+class BalancingPolicy(ABC):
+    """Chooses the endpoint that serves the next read."""
+
+    @abstractmethod
+    def choose(self, endpoints: Sequence[ReplicaEndpoint]) -> ReplicaEndpoint:
+        """Return one of `endpoints`, which is never empty."""
+
+
+class RoundRobinPolicy(BalancingPolicy):
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, endpoints: Sequence[ReplicaEndpoint]) -> ReplicaEndpoint:
+        return endpoints[next(self._counter) % len(endpoints)]
+
+
+class LeastOutstandingPolicy(BalancingPolicy):
+    def __init__(self) -> None:
+        self._counter = itertools.count()
+
+    def choose(self, endpoints: Sequence[ReplicaEndpoint]) -> ReplicaEndpoint:
+        # Rotate the starting point so ties do not always go to the first replica
+        offset = next(self._counter) % len(endpoints)
+        rotated = list(endpoints[offset:]) + list(endpoints[:offset])
+        return min(rotated, key=lambda endpoint: endpoint.outstanding)
+
+
+class LagAwarePolicy(LeastOutstandingPolicy):
+    def __init__(self, max_lag_s: float = 1.0) -> None:
+        super().__init__()
+        self.max_lag_s = max_lag_s
+
+    def choose(self, endpoints: Sequence[ReplicaEndpoint]) -> ReplicaEndpoint:
+        # Replicas whose lag is unknown yet are treated as fresh
+        fresh = [
+            endpoint
+            for endpoint in endpoints
+            if endpoint.lag_seconds is None or endpoint.lag_seconds <= self.max_lag_s
+        ]
+        if fresh:
+            return super().choose(fresh)
+        return min(endpoints, key=lambda endpoint: endpoint.lag_seconds or 0.0)
+
+
+def make_policy(name: str, max_lag_s: float = 1.0) -> BalancingPolicy:
+    """Create a balancing policy by name."""
+    if name == "round_robin":
+        return RoundRobinPolicy()
+    if name == "least_outstanding":
+        return LeastOutstandingPolicy()
+    if name == "lag_aware":
+        return LagAwarePolicy(max_lag_s)
+    raise ValueError(f"Unknown balancing policy: {name}")
+
+
+class LoadBalancer:
+    """Spreads read connections over replica endpoints."""
+
+    def __init__(
+        self,
+        endpoints: Sequence[ReplicaEndpoint],
+        policy: Optional[BalancingPolicy] = None,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("A load balancer needs at least one replica")
+        self.endpoints = list(endpoints)
+        for endpoint in self.endpoints:
+            if endpoint.monitor_engine is None:
+                endpoint.monitor_engine = create_engine(endpoint.engine.url, poolclass=NullPool)
+        self.policy = policy or RoundRobinPolicy()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_configs(
+        cls,
+        configs: Sequence[Dict[str, Optional[str]]],
+        policy: Optional[BalancingPolicy] = None,
+        **engine_kwargs,
+    ) -> "LoadBalancer":
+        """Create one engine per replica config, plus a single connection for the lag monitor."""
+        endpoints = [
+            ReplicaEndpoint(
+                str(config.get("host")),
+                create_db_engine(config, **engine_kwargs),
+                monitor_engine=create_db_engine(config, pool_size=1, max_overflow=0),
+            )
+            for config in configs
+        ]
+        return cls(endpoints, policy)
+
+    def warm(self) -> int:
+        """Open the connection pool of every replica in parallel, see `warm_pool`."""
+        return sum(warm_pool(endpoint.engine) for endpoint in self.endpoints)
+
+    def choose(self) -> ReplicaEndpoint:
+        """Pick the endpoint for the next read and count it as in flight."""
+        with self._lock:
+            endpoint = self.policy.choose(self.endpoints)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        return endpoint
+
+    @contextmanager
+    def connect(self) -> Iterator[Connection]:
+        """Check out a connection from the chosen replica for one read."""
+        endpoint = self.choose()
+        start = time.perf_counter()
+        try:
+            with endpoint.engine.connect() as conn:
+                yield conn
+        except Exception:
+            with self._lock:
+                endpoint.errors += 1
+            raise
+        finally:
+            endpoint.latency.observe(time.perf_counter() - start)
+            with self._lock:
+                endpoint.outstanding -= 1
+
+    def refresh_lag(self) -> Dict[str, Optional[float]]:
+        """Query the replay delay of every replica."""
+        for endpoint in self.endpoints:
+            try:
+                with endpoint.monitor_engine.connect() as conn:  # type: ignore[union-attr]
+                    value = conn.execute(REPLAY_DELAY_QUERY).scalar()
+                endpoint.lag_seconds = float(value) if value is not None else None
+            except Exception:
+                # Unreachable replicas are never considered fresh
+                endpoint.lag_seconds = float("inf")
+        return {endpoint.name: endpoint.lag_seconds for endpoint in self.endpoints}
+
+    def _run_monitor(self, interval: float) -> None:
+        while not self._stop.is_set():
+            self.refresh_lag()
+            self._stop.wait(interval)
+
+    def start_lag_monitor(self, interval: float = 1.0) -> "LoadBalancer":
+        """Refresh replica lag every `interval` seconds in the background."""
+        if self._monitor is None:
+            self._stop.clear()
+            self._monitor = threading.Thread(
+                target=self._run_monitor, args=(interval,), name="replica-lag", daemon=True
+            )
+            self._monitor.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        for endpoint in self.endpoints:
+            if endpoint.monitor_engine is not None:
+                endpoint.monitor_engine.dispose()
+
+    def stats(self) -> List[Dict[str, object]]:
+        """Reads, errors, latency and last known lag per replica."""
+        return [
+            {
+                "name": endpoint.name,
+                "requests": endpoint.requests,
+                "errors": endpoint.errors,
+                "lag_s": endpoint.lag_seconds,
+                **endpoint.latency.summary(),
+            }
+            for endpoint in self.endpoints
+        ]
@@ -0,0 +1,465 @@
+"""
+Local history of load test runs in a SQLite database.
+
+Every recorded run is keyed by a run id and stores the command that ran,
+the Terraform variable set from `load_test_variables.env` (thread counts,
+rates, SKU, ...), the git revision of the tooling and the run's settings.
+Results are kept in long format so runs with different tools can share one
+file and be queried with plain SQL:
+
+- `results`: one row per measured series and metric, e.g. throughput and
+  latency percentiles of a workload mode or of one replica
+- `histograms`: the latency histogram buckets behind those percentiles
+- `lag_samples`: replication lag samples taken during a run
+- `verifications`: the outcome of replication verification per replica
+- `table_health`: dead tuples, autovacuum activity, size and bloat of the
+  written tables sampled during soak tests
+
+`compare_runs` matches the series of two runs and flags throughput drops
+and p99 latency increases beyond a threshold. `import_jmeter_results` adds
+the sample results of a JMeter run (a JTL/CSV file, or the results zip
+exported by Azure Load Testing), so JMeter runs can be compared the same way.
+"""
+
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+import subprocess
+import uuid
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pgtools.config import ConfigError, load_environment
+from pgtools.instrumentation import Histogram
+
+# Default location of the run store, relative to the working directory
+RUN_STORE = Path("load_test_runs.sqlite")
+
+# Variables of load_test_variables.env describing the tested setup
+TERRAFORM_VARS = [
+    "POSTGRES_SKU_NAME",
+    "ADDITIONAL_REPLICAS",
+    "ENGINE_INSTANCES",
+    "MAIN_THREADS",
+    "MAIN_LOOPS",
+    "MAIN_WRITES_PER_MINUTE",
+    "REPLICA_THREADS",
+    "REPLICA_LOOPS",
+    "REPLICA_READS_PER_MINUTE",
+]
+
+# Metrics compared between runs: higher is better for throughput
+THROUGHPUT_METRICS = ["iterations_per_s", "rows_per_s"]
+LATENCY_METRICS = ["p99_ms"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    command TEXT NOT NULL,
+    label TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT,
+    git_revision TEXT,
+    git_dirty INTEGER,
+    terraform_vars TEXT,
+    settings TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_command_started ON runs (command, started_at);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name, metric)
+);
+CREATE TABLE IF NOT EXISTS histograms (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    upper_ms REAL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS histograms_run ON histograms (run_id, name);
+CREATE TABLE IF NOT EXISTS lag_samples (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    ts REAL NOT NULL,
+    lag_s REAL,
+    lag_bytes REAL
+);
+CREATE INDEX IF NOT EXISTS lag_samples_run ON lag_samples (run_id, name);
+CREATE TABLE IF NOT EXISTS verifications (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    replica TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    passed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_health (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    ts REAL NOT NULL,
+    server TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS table_health_run ON table_health (run_id, table_name);
+"""
+
+
+def git_revision(path: Path = Path(__file__).parent) -> Tuple[Optional[str], Optional[bool]]:
+    """Return the checked out commit and whether tracked files were modified."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return revision, bool(status.strip())
+
+
+def terraform_vars() -> Dict[str, str]:
+    """Return the Terraform variable set of the deployment under test."""
+    try:
+        load_environment()
+    except ConfigError:
+        pass
+    return {name: os.environ[name] for name in TERRAFORM_VARS if os.environ.get(name)}
+
+
+@dataclass
+class Comparison:
+    name: str
+    metric: str
+    baseline: float
+    candidate: float
+    regression: bool
+
+    @property
+    def change(self) -> float:
+        """Relative change from baseline to candidate."""
+        if self.baseline == 0:
+            return 0.0 if self.candidate == 0 else math.inf
+        return (self.candidate - self.baseline) / self.baseline
+
+
+class RunStore:
+    """Records runs and their results in a SQLite file."""
+
+    def __init__(self, path: Path = RUN_STORE) -> None:
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def start_run(
+        self,
+        command: str,
+        label: Optional[str] = None,
+        settings: Optional[Dict[str, Any]] = None,
+        started_at: Optional[datetime] = None,
+    ) -> str:
+        """Record the start of a run (default: now) and return its id."""
+        started_at = started_at or datetime.now()
+        run_id = f"{started_at:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        revision, dirty = git_revision()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, command, label, started_at, status, git_revision,"
+                " git_dirty, terraform_vars, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    command,
+                    label,
+                    started_at.isoformat(timespec="seconds"),
+                    "running",
+                    revision,
+                    None if dirty is None else int(dirty),
+                    json.dumps(terraform_vars(), sort_keys=True),
+                    json.dumps(settings or {}, sort_keys=True, default=str),
+                ),
+            )
+        return run_id
+
+    def finish_run(
+        self, run_id: str, status: str = "ok", finished_at: Optional[datetime] = None
+    ) -> None:
+        finished_at = finished_at or datetime.now()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?",
+                (finished_at.isoformat(timespec="seconds"), status, run_id),
+            )
+
+    def add_result(self, run_id: str, name: str, metrics: Dict[str, Any]) -> None:
+        """Store the numeric metrics of one series, e.g. a `WorkloadResult.summary()`."""
+        rows = [
+            (run_id, name, metric, float(value))
+            for metric, value in metrics.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results (run_id, name, metric, value) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def add_histogram(self, run_id: str, name: str, histogram: Histogram) -> None:
+        """Store the non-empty buckets of a histogram; the overflow bucket has no bound."""
+        bounds: List[Optional[float]] = [bound * 1000 for bound in histogram.buckets]
+        bounds.append(None)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO histograms (run_id, name, upper_ms, count) VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, name, bound, count)
+                    for bound, count in zip(bounds, histogram.counts)
+                    if count
+                ],
+            )
+
+    def add_lag_samples(self, run_id: str, name: str, samples: Iterable[Any]) -> None:
+        """Store `LagSample`s taken during the run."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO lag_samples (run_id, name, ts, lag_s, lag_bytes)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(run_id, name, s.timestamp, s.seconds, s.bytes) for s in samples],
+            )
+
+    def add_verification(self, run_id: str, replica: str, mode: str, passed: bool) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO verifications (run_id, replica, mode, passed) VALUES (?, ?, ?, ?)",
+                (run_id, replica, mode, int(passed)),
+            )
+
+    def add_table_health(self, run_id: str, samples: Iterable[Any]) -> None:
+        """Store `TableHealth` samples taken during the run."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO table_health (run_id, ts, server, table_name, metric, value)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, s.timestamp, s.server, s.table, metric, value)
+                    for s in samples
+                    for metric, value in s.metrics.items()
+                ],
+            )
+
+    def runs(
+        self,
+        command: Optional[str] = None,
+        limit: int = 20,
+        status: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Most recently recorded runs first, optionally filtered.
+
+        `before` only returns runs recorded before the run with that id.
+        """
+        conditions: List[str] = []
+        params: Tuple[Any, ...] = ()
+        if command:
+            conditions.append("command = ?")
+            params += (command,)
+        if status:
+            conditions.append("status = ?")
+            params += (status,)
+        if before:
+            conditions.append("rowid < (SELECT rowid FROM runs WHERE run_id = ?)")
+            params += (before,)
+        query = "SELECT * FROM runs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Imported runs keep the start time of their samples, so the order
+        # in which runs were recorded is the one to compare them in
+        query += " ORDER BY rowid DESC LIMIT ?"
+        rows = self.conn.execute(query, params + (limit,)).fetchall()
+        return [self._run_dict(row) for row in rows]
+
+    def get_run(self, ref: str) -> Dict[str, Any]:
+        """Look up a run by id or unique id prefix."""
+        rows = self.conn.execute(
+            "SELECT * FROM runs WHERE run_id LIKE ? ORDER BY rowid", (ref + "%",)
+        ).fetchall()
+        if not rows:
+            raise KeyError(f"No run matches {ref!r}")
+        if len(rows) > 1:
+            raise KeyError(f"{ref!r} matches {len(rows)} runs")
+        return self._run_dict(rows[0])
+
+    def results(self, run_id: str) -> Dict[str, Dict[str, float]]:
+        """Metrics per series of a run."""
+        results: Dict[str, Dict[str, float]] = {}
+        for row in self.conn.execute(
+            "SELECT name, metric, value FROM results WHERE run_id = ? ORDER BY rowid", (run_id,)
+        ):
+            results.setdefault(row["name"], {})[row["metric"]] = row["value"]
+        return results
+
+    def verifications(self, run_id: str) -> Dict[str, bool]:
+        return {
+            row["replica"]: bool(row["passed"])
+            for row in self.conn.execute(
+                "SELECT replica, passed FROM verifications WHERE run_id = ?", (run_id,)
+            )
+        }
+
+    @staticmethod
+    def _run_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        run = dict(row)
+        run["terraform_vars"] = json.loads(run["terraform_vars"] or "{}")
+        run["settings"] = json.loads(run["settings"] or "{}")
+        return run
+
+
+def compare_runs(
+    store: RunStore,
+    baseline_id: str,
+    candidate_id: str,
+    max_throughput_drop: float = 0.10,
+    max_p99_increase: float = 0.20,
+) -> List[Comparison]:
+    """Compare the series both runs have in common.
+
+    Throughput that dropped by more than `max_throughput_drop`, or p99
+    latency that grew by more than `max_p99_increase` (both relative), is
+    flagged as a regression, as is a replica that passed verification in
+    the baseline and failed in the candidate.
+    """
+    baseline = store.results(baseline_id)
+    candidate = store.results(candidate_id)
+    comparisons = []
+    for name, metrics in baseline.items():
+        if name not in candidate:
+            continue
+        for metric in THROUGHPUT_METRICS + LATENCY_METRICS:
+            if metric not in metrics or metric not in candidate[name]:
+                continue
+            comparison = Comparison(name, metric, metrics[metric], candidate[name][metric], False)
+            if metric in THROUGHPUT_METRICS:
+                comparison.regression = comparison.change < -max_throughput_drop
+            else:
+                comparison.regression = comparison.change > max_p99_increase
+            comparisons.append(comparison)
+
+    baseline_verified = store.verifications(baseline_id)
+    for replica, passed in store.verifications(candidate_id).items():
+        if replica in baseline_verified:
+            comparisons.append(
+                Comparison(
+                    replica,
+                    "verified",
+                    float(baseline_verified[replica]),
+                    float(passed),
+                    baseline_verified[replica] and not passed,
+                )
+            )
+    return comparisons
+
+
+def read_jmeter_samples(path: Path) -> List[Dict[str, str]]:
+    """Read the samples of a JMeter CSV results file (JTL).
+
+    A zip file, as exported by Azure Load Testing, is read as the
+    concatenation of the CSV files it contains. The results need the
+    `timeStamp` (milliseconds since the epoch), `elapsed`, `label` and
+    `success` columns of JMeter's default CSV output.
+    """
+    path = Path(path)
+    if zipfile.is_zipfile(path):
+        samples: List[Dict[str, str]] = []
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith((".csv", ".jtl")):
+                    with archive.open(name) as member:
+                        text = io.TextIOWrapper(member, encoding="utf-8", newline="")
+                        samples.extend(csv.DictReader(text))
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            samples = list(csv.DictReader(f))
+    if samples:
+        missing = {"timeStamp", "elapsed", "label", "success"} - set(samples[0])
+        if missing:
+            raise ValueError(f"{path} lacks the columns {', '.join(sorted(missing))}")
+    return samples
+
+
+def import_jmeter_results(
+    store: RunStore,
+    path: Path,
+    label: Optional[str] = None,
+    command: str = "jmeter",
+) -> str:
+    """Record the samples of a JMeter run as a run and return its id.
+
+    Every sampler label becomes a series with the metrics of a workload
+    run (throughput, error rate and latency percentiles) and a latency
+    histogram, so `compare_runs` works on imported runs too. The run
+    starts and finishes at the first and last sample. The Terraform
+    variables are those of the current environment, so import the results
+    before changing `load_test_variables.env`.
+    """
+    samples = read_jmeter_samples(path)
+    if not samples:
+        raise ValueError(f"{path} has no samples")
+    try:
+        starts = [int(sample["timeStamp"]) for sample in samples]
+        ends = [start + int(sample["elapsed"]) for start, sample in zip(starts, samples)]
+    except ValueError:
+        raise ValueError(
+            f"{path}: timeStamp must be milliseconds since the epoch"
+            " (jmeter.save.saveservice.timestamp_format=ms)"
+        ) from None
+
+    run_id = store.start_run(
+        command,
+        label,
+        {"source": str(path)},
+        started_at=datetime.fromtimestamp(min(starts) / 1000),
+    )
+    series: Dict[str, List[int]] = {}
+    for index, sample in enumerate(samples):
+        series.setdefault(sample["label"], []).append(index)
+    for name, indices in series.items():
+        histogram = Histogram()
+        errors = 0
+        for index in indices:
+            histogram.observe(int(samples[index]["elapsed"]) / 1000)
+            errors += samples[index]["success"].strip().lower() != "true"
+        elapsed = (max(ends[i] for i in indices) - min(starts[i] for i in indices)) / 1000
+        stats = histogram.summary()
+        store.add_result(
+            run_id,
+            name,
+            {
+                "iterations": len(indices),
+                "errors": errors,
+                "elapsed_s": elapsed,
+                "iterations_per_s": len(indices) / elapsed if elapsed else 0.0,
+                "error_rate": errors / len(indices),
+                "p50_ms": stats["p50_ms"],
+                "p95_ms": stats["p95_ms"],
+                "p99_ms": stats["p99_ms"],
+                "max_ms": stats["max_ms"],
+            },
+        )
+        store.add_histogram(run_id, name, histogram)
+    store.finish_run(run_id, finished_at=datetime.fromtimestamp(max(ends) / 1000))
+    return run_id
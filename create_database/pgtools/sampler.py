@@ -0,0 +1,122 @@
+"""
+Background replication lag sampler.
+
+Samples the replay delay on the replica and, when the primary is given,
+the number of WAL bytes the replica still has to replay, at a fixed
+interval while a workload runs.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import Engine, text
+
+from pgtools.instrumentation import Histogram
+
+# Seconds since the last replayed transaction, or 0 when everything received
+# has been replayed; fractional unlike the integer lag of verify_replication and
+# clamped at 0 because the replay timestamp can be slightly ahead of now()
+REPLAY_DELAY_QUERY = text(
+    """
+    SELECT
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE GREATEST(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END AS lag_seconds
+    """
+)
+
+REPLAY_LAG_BYTES_QUERY = text(
+    "SELECT max(pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn)) FROM pg_stat_replication"
+)
+
+
+@dataclass
+class LagSample:
+    timestamp: float
+    seconds: Optional[float]
+    bytes: Optional[float]
+
+
+class LagSampler:
+    """Sample replication lag in a background thread."""
+
+    def __init__(
+        self,
+        replica_engine: Engine,
+        primary_engine: Optional[Engine] = None,
+        interval: float = 1.0,
+    ) -> None:
+        self.replica_engine = replica_engine
+        self.primary_engine = primary_engine
+        self.interval = interval
+        self.samples: List[LagSample] = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> LagSample:
+        """Take a single lag sample and store it."""
+        seconds: Optional[float] = None
+        lag_bytes: Optional[float] = None
+        try:
+            with self.replica_engine.connect() as conn:
+                value = conn.execute(REPLAY_DELAY_QUERY).scalar()
+                seconds = float(value) if value is not None else None
+            if self.primary_engine is not None:
+                with self.primary_engine.connect() as conn:
+                    value = conn.execute(REPLAY_LAG_BYTES_QUERY).scalar()
+                    lag_bytes = float(value) if value is not None else None
+        except Exception:
+            self.errors += 1
+
+        lag_sample = LagSample(time.time(), seconds, lag_bytes)
+        self.samples.append(lag_sample)
+        return lag_sample
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self) -> "LagSampler":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="lag-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait_until_caught_up(self, timeout: float = 60.0, threshold: float = 0.0) -> bool:
+        """Block until the replay delay drops to `threshold` seconds or less."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            lag_sample = self.sample()
+            if lag_sample.seconds is not None and lag_sample.seconds <= threshold:
+                return True
+            time.sleep(self.interval)
+        return False
+
+    def summary(self, since: Optional[float] = None) -> Dict[str, float]:
+        """Mean, p95 and maximum lag over the samples taken since `since`."""
+        samples = [s for s in self.samples if since is None or s.timestamp >= since]
+        seconds = Histogram()
+        max_bytes = 0.0
+        for lag_sample in samples:
+            if lag_sample.seconds is not None:
+                seconds.observe(lag_sample.seconds)
+            if lag_sample.bytes is not None:
+                max_bytes = max(max_bytes, lag_sample.bytes)
+        return {
+            "samples": len(samples),
+            "mean_lag_s": seconds.mean,
+            "p95_lag_s": seconds.percentile(0.95),
+            "max_lag_s": seconds.max,
+            "max_lag_bytes": max_bytes,
+        }
@@ -0,0 +1,253 @@
+"""
+Closed-loop search for the highest load that stays within SLOs.
+
+Instead of picking `main_writes_per_minute` and `replica_reads_per_minute`
+by hand and rerunning the load test, `SaturationSearch` runs the Python
+workload at increasing target rates and checks every step against an `SLO`:
+
+- p99 latency and error rate of the writes and reads
+- the achieved rate, which falls short of the target once the servers (or
+  the client threads) cannot keep up
+- the maximum replication lag seen by the lag sampler during the step
+
+Reads run concurrently with the writes at a fixed ratio to the write rate,
+like the two JMeter thread groups. Two strategies are available
+(`STRATEGIES`):
+
+- `step`: raise the rate by a fixed increment until a step violates the SLO
+- `binary`: multiply the rate by a factor until a step violates the SLO,
+  then bisect between the last passing and the first failing rate
+
+The replica has to catch up before every step, so lag left over from a
+failed step does not count against the next one.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from sqlalchemy import Engine
+
+from pgtools.sampler import LagSampler
+from pgtools.workload import Operation, WorkloadResult, run_workload
+
+if TYPE_CHECKING:
+    from pgtools.replicas import LoadBalancer
+
+STRATEGIES = ["step", "binary"]
+
+
+@dataclass
+class SLO:
+    """Limits a step has to stay within to count as sustainable."""
+
+    p99_ms: float = 500.0
+    max_error_rate: float = 0.01
+    max_lag_s: Optional[float] = 5.0
+    # Fraction of the target rate that has to be achieved
+    min_achieved: float = 0.9
+
+
+@dataclass
+class StepResult:
+    """Outcome of running the workload at one target rate."""
+
+    write_rate: float
+    read_rate: float
+    writes: WorkloadResult
+    reads: Optional[WorkloadResult] = None
+    lag: Optional[Dict[str, float]] = None
+    started: float = 0.0
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.violations
+
+
+def check_slo(slo: SLO, step: StepResult) -> List[str]:
+    """Describe every way in which `step` violates `slo`."""
+    violations = []
+    series = [("writes", step.writes, step.write_rate)]
+    if step.reads is not None:
+        series.append(("reads", step.reads, step.read_rate))
+    for name, result, target in series:
+        stats = result.summary()
+        if stats["p99_ms"] > slo.p99_ms:
+            violations.append(f"{name} p99 {stats['p99_ms']:.0f} ms > {slo.p99_ms:g} ms")
+        if stats["error_rate"] > slo.max_error_rate:
+            violations.append(
+                f"{name} errors {stats['error_rate']:.1%} > {slo.max_error_rate:.1%}"
+            )
+        achieved = stats["iterations_per_s"] * 60
+        if achieved < target * slo.min_achieved:
+            violations.append(f"{name} {achieved:.0f}/min of {target:.0f}/min")
+    if slo.max_lag_s is not None and step.lag is not None:
+        if step.lag["max_lag_s"] > slo.max_lag_s:
+            violations.append(f"lag {step.lag['max_lag_s']:.1f} s > {slo.max_lag_s:g} s")
+    return violations
+
+
+class SaturationSearch:
+    """Ramp the write and read rates and find the highest one within the SLO.
+
+    Rates are iterations per minute across all threads, as in `run_workload`;
+    the read rate is `read_ratio` times the write rate. Each thread can run
+    at most one iteration at a time, so enough threads are needed for the
+    highest rate the search may reach. `on_step` is called after every step,
+    e.g. to print or record it.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        write_operation: Operation,
+        write_threads: int = 10,
+        balancer: Optional["LoadBalancer"] = None,
+        read_operation: Optional[Operation] = None,
+        read_threads: int = 40,
+        read_ratio: float = 4.0,
+        sampler: Optional[LagSampler] = None,
+        slo: Optional[SLO] = None,
+        step_duration: float = 60.0,
+        autocommit: bool = True,
+        session_settings: Optional[Dict[str, str]] = None,
+        catch_up_timeout: float = 120.0,
+        seed: Optional[int] = None,
+        on_step: Optional[Callable[[StepResult], None]] = None,
+    ) -> None:
+        self.engine = engine
+        self.write_operation = write_operation
+        self.write_threads = write_threads
+        self.balancer = balancer
+        self.read_operation = read_operation
+        self.read_threads = read_threads
+        self.read_ratio = read_ratio if balancer is not None else 0.0
+        self.sampler = sampler
+        self.slo = slo or SLO()
+        self.step_duration = step_duration
+        self.autocommit = autocommit
+        self.session_settings = session_settings
+        self.catch_up_timeout = catch_up_timeout
+        self.seed = seed
+        self.on_step = on_step
+        self.steps: List[StepResult] = []
+
+    def measure(self, write_rate: float, catch_up: bool = True) -> StepResult:
+        """Run writes and reads at `write_rate` for one step and check the SLO.
+
+        Unless `catch_up` is false, the replica has to catch up with the
+        previous step first.
+        """
+        if catch_up and self.sampler is not None and self.steps:
+            self.sampler.wait_until_caught_up(timeout=self.catch_up_timeout)
+
+        read_rate = write_rate * self.read_ratio
+        stop = threading.Event()
+        reads: List[WorkloadResult] = []
+        reader = None
+        if self.balancer is not None and self.read_operation is not None and read_rate:
+            balancer, read_operation = self.balancer, self.read_operation
+            reader = threading.Thread(
+                target=lambda: reads.append(
+                    run_workload(
+                        balancer,
+                        read_operation,
+                        threads=self.read_threads,
+                        duration=self.step_duration,
+                        rate_per_minute=read_rate,
+                        seed=self.seed,
+                        stop_event=stop,
+                        connection_per_iteration=True,
+                    )
+                ),
+                name="saturation-reads",
+            )
+
+        started = time.time()
+        if self.sampler is not None:
+            self.sampler.start()
+        if reader is not None:
+            reader.start()
+        try:
+            writes = run_workload(
+                self.engine,
+                self.write_operation,
+                threads=self.write_threads,
+                duration=self.step_duration,
+                rate_per_minute=write_rate,
+                autocommit=self.autocommit,
+                seed=self.seed,
+                stop_event=stop,
+                session_settings=self.session_settings,
+            )
+        finally:
+            stop.set()
+            if reader is not None:
+                reader.join()
+            if self.sampler is not None:
+                self.sampler.stop()
+
+        step = StepResult(
+            write_rate=write_rate,
+            read_rate=read_rate,
+            writes=writes,
+            reads=reads[0] if reads else None,
+            lag=self.sampler.summary(since=started) if self.sampler is not None else None,
+            started=started,
+        )
+        step.violations = check_slo(self.slo, step)
+        self.steps.append(step)
+        if self.on_step is not None:
+            self.on_step(step)
+        return step
+
+    def run(
+        self,
+        start_rate: float,
+        max_rate: float,
+        strategy: str = "step",
+        increment: Optional[float] = None,
+        factor: float = 2.0,
+        precision: float = 0.05,
+        max_steps: int = 20,
+    ) -> Optional[StepResult]:
+        """Search for the highest write rate up to `max_rate` within the SLO.
+
+        `step` raises the rate by `increment` (default: `start_rate`),
+        `binary` multiplies it by `factor` and then bisects until the
+        passing and failing rates are within `precision` of each other.
+        Returns the passing step with the highest rate, or None if even
+        `start_rate` violates the SLO.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown search strategy: {strategy}")
+        if start_rate <= 0 or max_rate < start_rate:
+            raise ValueError("Rates must satisfy 0 < start_rate <= max_rate")
+
+        best: Optional[StepResult] = None
+        failed_rate: Optional[float] = None
+        rate = start_rate
+        while len(self.steps) < max_steps:
+            step = self.measure(rate)
+            if not step.passed:
+                failed_rate = rate
+                break
+            best = step
+            if rate >= max_rate:
+                break
+            if strategy == "step":
+                rate = min(rate + (increment or start_rate), max_rate)
+            else:
+                rate = min(rate * factor, max_rate)
+
+        if strategy == "binary" and best is not None and failed_rate is not None:
+            low, high = best.write_rate, failed_rate
+            while (high - low) > precision * high and len(self.steps) < max_steps:
+                step = self.measure((low + high) / 2)
+                if step.passed:
+                    low, best = step.write_rate, step
+                else:
+                    high = step.write_rate
+        return best
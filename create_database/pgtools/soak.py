@@ -0,0 +1,373 @@
+"""
+Soak testing: hours of steady load with table health sampling.
+
+The JMeter write group updates the same `products` rows over and over.
+Every update leaves a dead tuple behind, and until autovacuum reclaims
+them the table and its indexes grow, which slows down the
+`ORDER BY price DESC` replica reads and replay on the replica. A
+60-second run never shows this, so `run_soak` keeps the write and read
+workload at a fixed rate for hours, measured in consecutive windows, and
+samples the health of the written tables on every server after each
+window with `TableHealthSampler`:
+
+- `n_live_tup`, `n_dead_tup` and autovacuum/autoanalyze counts and times
+  from `pg_stat_user_tables` (primary only, a standby does not maintain them)
+- heap and index size
+- bloat from the `pgstattuple` extension when it is installed (dead tuples
+  and free space of the heap, leaf density of the B-tree indexes), or else
+  an estimate from `pg_class.reltuples`, the average row width in `pg_stats`
+  and the table's fillfactor
+
+`drift_report` then fits the p99 latency of every window against time and
+correlates it with the sampled health metrics.
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Connection, Engine, text
+
+from pgtools.saturation import SaturationSearch, StepResult
+
+logger = logging.getLogger(__name__)
+
+TABLE_STATS_QUERY = text(
+    """
+    SELECT c.relname, pg_is_in_recovery() AS in_recovery,
+           EXTRACT(EPOCH FROM now()) AS server_time,
+           s.n_live_tup, s.n_dead_tup, s.autovacuum_count, s.autoanalyze_count,
+           EXTRACT(EPOCH FROM s.last_autovacuum) AS last_autovacuum,
+           EXTRACT(EPOCH FROM s.last_autoanalyze) AS last_autoanalyze,
+           pg_table_size(c.oid) AS table_bytes, pg_indexes_size(c.oid) AS index_bytes
+    FROM pg_class c
+    JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relname = ANY(:tables)
+    """
+)
+
+# Inputs of the statistics-based bloat estimate
+BLOAT_ESTIMATE_QUERY = text(
+    """
+    SELECT current_setting('block_size')::int AS block_size,
+           c.reltuples,
+           pg_relation_size(c.oid) AS heap_bytes,
+           coalesce((SELECT sum(st.avg_width) FROM pg_stats st
+                     WHERE st.schemaname = n.nspname AND st.tablename = c.relname), 0)
+               AS row_width,
+           coalesce((SELECT option_value::int FROM pg_options_to_table(c.reloptions)
+                     WHERE option_name = 'fillfactor'), 100) AS fillfactor
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = CAST(:table AS regclass)
+    """
+)
+
+PGSTATTUPLE_QUERY = text(
+    "SELECT dead_tuple_percent, approx_free_percent "
+    "FROM pgstattuple_approx(CAST(:table AS regclass))"
+)
+
+INDEX_DENSITY_QUERY = text(
+    """
+    SELECT avg(stats.avg_leaf_density)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_am am ON am.oid = i.relam,
+    LATERAL pgstatindex(x.indexrelid::regclass) stats
+    WHERE x.indrelid = CAST(:table AS regclass) AND am.amname = 'btree'
+    """
+)
+
+# Per-tuple overhead in a heap page: tuple header and line pointer
+TUPLE_OVERHEAD_BYTES = 24 + 4
+PAGE_HEADER_BYTES = 24
+
+# Leaf density of a freshly built B-tree index (default fillfactor 90)
+BTREE_LEAF_DENSITY = 90.0
+
+# Health metrics correlated with window latency by `drift_report`
+CORRELATED_METRICS = ["n_dead_tup", "bloat_percent", "table_bytes", "index_bytes"]
+
+
+@dataclass
+class TableHealth:
+    """Health metrics of one table on one server at one point in time."""
+
+    timestamp: float
+    server: str
+    table: str
+    metrics: Dict[str, Optional[float]]
+    # now() on the server, to compare with the server's timestamps
+    server_time: Optional[float] = None
+
+
+@dataclass
+class SoakWindow:
+    """One measurement window of a soak test and the table health after it."""
+
+    index: int
+    elapsed: float
+    step: StepResult
+    health: List[TableHealth]
+
+
+@dataclass
+class SoakResult:
+    """The windows of a soak test and whether it ended before its duration."""
+
+    windows: List[SoakWindow]
+    stopped_early: bool = False
+
+
+def estimate_bloat_percent(
+    block_size: int, reltuples: float, heap_bytes: float, row_width: float, fillfactor: int
+) -> Optional[float]:
+    """Share of the heap not needed for the live rows at the table's fillfactor."""
+    if reltuples < 0 or heap_bytes <= 0 or row_width <= 0:
+        # Never analyzed, so there is nothing to compare with
+        return None
+    usable = (block_size - PAGE_HEADER_BYTES) * fillfactor / 100
+    expected_pages = math.ceil(reltuples * (row_width + TUPLE_OVERHEAD_BYTES) / usable)
+    actual_pages = heap_bytes / block_size
+    return max(0.0, 1 - expected_pages / actual_pages) * 100
+
+
+class TableHealthSampler:
+    """Sample dead tuples, autovacuum activity, size and bloat of tables."""
+
+    def __init__(self, engines: Dict[str, Engine], tables: Sequence[str] = ("products",)) -> None:
+        self.engines = engines
+        self.tables = list(tables)
+        self.samples: List[TableHealth] = []
+        # Whether pgstattuple can be used, per server; decided on first use
+        self._pgstattuple: Dict[str, bool] = {}
+
+    def sample(self) -> List[TableHealth]:
+        """Take one sample of every table on every server and store it."""
+        samples = []
+        for server, engine in self.engines.items():
+            try:
+                samples.extend(self._sample_server(server, engine))
+            except Exception as e:
+                logger.warning("Sampling table health on %s failed: %s", server, e)
+        self.samples.extend(samples)
+        return samples
+
+    def _sample_server(self, server: str, engine: Engine) -> List[TableHealth]:
+        now = time.time()
+        samples = []
+        with engine.connect() as conn:
+            rows = conn.execute(TABLE_STATS_QUERY, {"tables": self.tables}).mappings().all()
+            for row in rows:
+                metrics: Dict[str, Any] = {
+                    "table_bytes": row["table_bytes"],
+                    "index_bytes": row["index_bytes"],
+                }
+                if not row["in_recovery"]:
+                    for name in (
+                        "n_live_tup",
+                        "n_dead_tup",
+                        "autovacuum_count",
+                        "autoanalyze_count",
+                        "last_autovacuum",
+                        "last_autoanalyze",
+                    ):
+                        metrics[name] = row[name]
+                metrics.update(self._bloat(server, conn, row["relname"]))
+                samples.append(
+                    TableHealth(
+                        now,
+                        server,
+                        row["relname"],
+                        # EXTRACT returns numeric, the sizes bigint
+                        {
+                            name: float(value) if value is not None else None
+                            for name, value in metrics.items()
+                        },
+                        float(row["server_time"]),
+                    )
+                )
+        return samples
+
+    def _bloat(self, server: str, conn: Connection, table: str) -> Dict[str, Optional[float]]:
+        estimate = conn.execute(BLOAT_ESTIMATE_QUERY, {"table": table}).mappings().one()
+        if self._pgstattuple.get(server) is None:
+            self._pgstattuple[server] = bool(
+                conn.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'pgstattuple'")
+                ).scalar()
+            )
+            if not self._pgstattuple[server]:
+                logger.warning("pgstattuple is not installed on %s, estimating bloat", server)
+
+        if self._pgstattuple[server]:
+            try:
+                dead, free = conn.execute(PGSTATTUPLE_QUERY, {"table": table}).one()
+                density = conn.execute(INDEX_DENSITY_QUERY, {"table": table}).scalar()
+            except Exception as e:
+                # Typically missing privileges (pg_stat_scan_tables)
+                logger.warning("pgstattuple failed on %s, estimating bloat: %s", server, e)
+                self._pgstattuple[server] = False
+                conn.rollback()
+            else:
+                # Free space kept by the fillfactor on purpose does not count
+                reserved = 100 - estimate["fillfactor"]
+                return {
+                    "dead_tuple_percent": dead,
+                    "free_percent": free,
+                    "bloat_percent": max(0.0, dead + free - reserved),
+                    "index_bloat_percent": (
+                        max(0.0, (1 - float(density) / BTREE_LEAF_DENSITY) * 100)
+                        if density is not None
+                        else None
+                    ),
+                }
+
+        return {
+            "bloat_percent": estimate_bloat_percent(
+                estimate["block_size"],
+                float(estimate["reltuples"]),
+                float(estimate["heap_bytes"]),
+                float(estimate["row_width"]),
+                estimate["fillfactor"],
+            )
+        }
+
+
+def run_soak(
+    workload: SaturationSearch,
+    health: TableHealthSampler,
+    write_rate: float,
+    duration: float,
+    window: float = 300.0,
+    on_window: Optional[Callable[[SoakWindow], None]] = None,
+) -> SoakResult:
+    """Hold `write_rate` for `duration` seconds, measured in `window`-second windows.
+
+    Each window runs like a saturation step at a fixed rate, except that
+    the replica does not get to catch up in between. Table health is
+    sampled once before the first window and after every window. The
+    soak ends early, flagged `stopped_early`, when a window does (e.g.
+    because `run_workload` absorbed Ctrl+C).
+    """
+    health.sample()
+    windows: List[SoakWindow] = []
+    started = time.monotonic()
+    while time.monotonic() - started < duration:
+        workload.step_duration = min(window, duration - (time.monotonic() - started))
+        step = workload.measure(write_rate, catch_up=False)
+        soak_window = SoakWindow(
+            index=len(windows) + 1,
+            elapsed=time.monotonic() - started,
+            step=step,
+            health=health.sample(),
+        )
+        windows.append(soak_window)
+        if on_window is not None:
+            on_window(soak_window)
+        if step.writes.elapsed < workload.step_duration:
+            return SoakResult(windows, stopped_early=True)
+    return SoakResult(windows)
+
+
+def linear_fit(xs: Sequence[float], ys: Sequence[float]) -> Tuple[float, float]:
+    """Least squares slope and intercept of `ys` over `xs`."""
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        return 0.0, mean_y
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+    return slope, mean_y - slope * mean_x
+
+
+def correlation(xs: Sequence[float], ys: Sequence[float]) -> Optional[float]:
+    """Pearson correlation, or None when either series is constant."""
+    if len(xs) < 2:
+        return None
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    sx = math.sqrt(sum((x - mean_x) ** 2 for x in xs))
+    sy = math.sqrt(sum((y - mean_y) ** 2 for y in ys))
+    if sx == 0 or sy == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / (sx * sy)
+
+
+def health_sample(window: SoakWindow, server: str, table: str) -> Optional[TableHealth]:
+    for sample in window.health:
+        if sample.server == server and sample.table == table:
+            return sample
+    return None
+
+
+def table_health(window: SoakWindow, server: str, table: str) -> Dict[str, Optional[float]]:
+    sample = health_sample(window, server, table)
+    return sample.metrics if sample is not None else {}
+
+
+def autovacuum_ran(window: SoakWindow, server: str, table: str) -> bool:
+    """Whether autovacuum finished on `table` during the window.
+
+    The time since the last autovacuum is taken on the server's clock, so
+    clock skew between the client and the server does not matter.
+    """
+    sample = health_sample(window, server, table)
+    if sample is None or sample.server_time is None:
+        return False
+    last_autovacuum = sample.metrics.get("last_autovacuum")
+    if last_autovacuum is None:
+        return False
+    return sample.server_time - last_autovacuum <= sample.timestamp - window.step.started
+
+
+def drift_report(
+    windows: Sequence[SoakWindow], server: str = "primary", table: str = "products"
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """Latency drift per series and its correlation with the table health.
+
+    For the p99 latency of the writes and reads, returns the first and last
+    window's value, the fitted change per hour, the correlation with every
+    metric in `CORRELATED_METRICS` of `table` on `server`, and the mean p99
+    of windows in which autovacuum did and did not run on that table.
+    """
+    report: Dict[str, Dict[str, Optional[float]]] = {}
+    hours = [window.elapsed / 3600 for window in windows]
+    vacuumed = [autovacuum_ran(window, server, table) for window in windows]
+
+    for name in ("writes", "reads"):
+        results = [getattr(window.step, name) for window in windows]
+        if not results or any(result is None for result in results):
+            continue
+        p99 = [result.summary()["p99_ms"] for result in results]
+        slope, _ = linear_fit(hours, p99)
+        series: Dict[str, Optional[float]] = {
+            "p99_first_ms": p99[0],
+            "p99_last_ms": p99[-1],
+            "p99_ms_per_hour": slope,
+        }
+        for metric in CORRELATED_METRICS:
+            pairs = [
+                (value, latency)
+                for window, latency in zip(windows, p99)
+                for value in [table_health(window, server, table).get(metric)]
+                if value is not None
+            ]
+            series[f"corr_{metric}"] = (
+                correlation([float(v) for v, _ in pairs], [y for _, y in pairs])
+                if pairs
+                else None
+            )
+        with_vacuum = [latency for latency, ran in zip(p99, vacuumed) if ran]
+        without_vacuum = [latency for latency, ran in zip(p99, vacuumed) if not ran]
+        series["p99_autovacuum_ms"] = (
+            sum(with_vacuum) / len(with_vacuum) if with_vacuum else None
+        )
+        series["p99_no_autovacuum_ms"] = (
+            sum(without_vacuum) / len(without_vacuum) if without_vacuum else None
+        )
+        report[name] = series
+    return report
@@ -0,0 +1,160 @@
+"""
+Materialized summary tables for the reporting paths.
+
+Per-category product statistics and per-day order totals are kept in
+materialized views, so dashboards read one row per category or day instead
+of aggregating every product and order on each rerun. The views are
+refreshed `CONCURRENTLY` on the primary, which keeps them readable during
+the refresh, and reach the replicas through physical replication.
+
+Materialized views are used instead of trigger-maintained rollups because
+every price update of the write workload would otherwise also update the
+row of its category, turning a few category rows into the hottest rows of
+the load test.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Engine, text
+
+from pgtools.instrumentation import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Definition and unique key (required for REFRESH CONCURRENTLY) of every view
+SUMMARY_VIEWS: Dict[str, Dict[str, str]] = {
+    "category_summary": {
+        "query": """
+            SELECT
+                category,
+                count(*) AS product_count,
+                count(*) FILTER (WHERE in_stock) AS in_stock_count,
+                avg(price) AS avg_price
+            FROM products
+            GROUP BY category
+        """,
+        "key": "category",
+    },
+    "daily_order_totals": {
+        "query": """
+            SELECT
+                date_trunc('day', o.order_date) AS day,
+                count(*) AS order_count,
+                sum(o.quantity) AS quantity,
+                sum(p.price * o.quantity) AS revenue
+            FROM orders o
+            JOIN products p ON p.id = o.product_id
+            WHERE o.order_date IS NOT NULL
+            GROUP BY date_trunc('day', o.order_date)
+        """,
+        "key": "day",
+    },
+}
+
+# Live aggregates used while the views have not been created
+LIVE_CATEGORY_SUMMARY = SUMMARY_VIEWS["category_summary"]["query"]
+LIVE_DAILY_ORDER_TOTALS = SUMMARY_VIEWS["daily_order_totals"]["query"]
+
+
+def summaries_exist(engine: Engine) -> bool:
+    """Check whether all summary views have been created."""
+    with engine.connect() as conn:
+        existing = conn.execute(
+            text("SELECT matviewname FROM pg_matviews WHERE matviewname = ANY(:names)"),
+            {"names": list(SUMMARY_VIEWS)},
+        ).scalars()
+        return set(existing) == set(SUMMARY_VIEWS)
+
+
+def create_summaries(engine: Engine) -> None:
+    """Create the summary views and their unique indexes if missing."""
+    with engine.begin() as conn:
+        for name, view in SUMMARY_VIEWS.items():
+            conn.execute(
+                text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {view['query']}")
+            )
+            conn.execute(
+                text(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_{view['key']}_key "
+                    f"ON {name} ({view['key']})"
+                )
+            )
+
+
+def drop_summaries(engine: Engine) -> None:
+    """Drop the summary views, e.g. before the tables they read are dropped."""
+    with engine.begin() as conn:
+        for name in SUMMARY_VIEWS:
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {name}"))
+
+
+def refresh_summaries(engine: Engine, concurrently: bool = True) -> Dict[str, float]:
+    """Refresh every summary view and return the seconds each refresh took."""
+    durations = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in SUMMARY_VIEWS:
+            start = time.perf_counter()
+            option = " CONCURRENTLY" if concurrently else ""
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW{option} {name}"))
+            durations[name] = time.perf_counter() - start
+    return durations
+
+
+def _read(conn: Any, name: str, live_query: str, order_by: str) -> List[Dict[str, Any]]:
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+    source = name if exists else f"({live_query}) AS live"
+    rows = conn.execute(text(f"SELECT * FROM {source} ORDER BY {order_by}"))
+    return [dict(row._mapping) for row in rows]
+
+
+def read_category_summary(conn: Any) -> List[Dict[str, Any]]:
+    """Per-category product count, in-stock count and average price."""
+    return _read(conn, "category_summary", LIVE_CATEGORY_SUMMARY, "category")
+
+
+def read_daily_order_totals(conn: Any) -> List[Dict[str, Any]]:
+    """Per-day order count, quantity and revenue, newest day first."""
+    return _read(conn, "daily_order_totals", LIVE_DAILY_ORDER_TOTALS, "day DESC")
+
+
+class SummaryRefresher:
+    """Refresh the summary views at a fixed interval in a background thread."""
+
+    def __init__(self, engine: Engine, interval: float = 60.0, concurrently: bool = True) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.concurrently = concurrently
+        self.durations: Dict[str, Histogram] = {name: Histogram() for name in SUMMARY_VIEWS}
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        try:
+            for name, seconds in refresh_summaries(self.engine, self.concurrently).items():
+                self.durations[name].observe(seconds)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.warning("Refreshing summaries failed: %s", e)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def start(self) -> "SummaryRefresher":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="summary-refresh", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
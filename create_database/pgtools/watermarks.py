@@ -0,0 +1,143 @@
+"""
+Change watermarks for incremental replication verification.
+
+A watermark records, per table, how far the previous verification got, so
+the next run only has to compare rows changed since then:
+
+- `append`: tables that are only ever inserted into (`APPEND_ONLY_COLUMNS`)
+  remember the largest value of a column that grows with every insert,
+  e.g. `orders.order_date`, which can be range-scanned with an index
+- `xmin`: all other tables remember the oldest transaction still running
+  on the primary; rows inserted or updated later carry a newer `xmin`,
+  which physical replication preserves on the replica
+
+A run compares the rows changed between the previous watermark and the one
+read at its start; later changes are left to the next run. Watermarks are
+stored in a JSON state file per primary/replica pair and only advanced for
+tables that verified successfully. Deleted rows are not visible to either
+strategy and are only detected by a full verification.
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from sqlalchemy import (
+    BigInteger,
+    Engine,
+    Table,
+    Text,
+    and_,
+    cast,
+    false,
+    func,
+    literal_column,
+    select,
+    text,
+)
+
+# Default location of the state file, relative to the working directory
+STATE_FILE = Path(".verify_replication_state.json")
+
+# Insert-only tables and the column that grows with every insert
+APPEND_ONLY_COLUMNS = {"orders": "order_date"}
+
+# Rows this much older than the append watermark are verified again, because
+# `now()` is the transaction start time and long transactions commit late
+DEFAULT_OVERLAP = timedelta(minutes=5)
+
+STATE_VERSION = 1
+
+
+@dataclass
+class Watermark:
+    strategy: str
+    value: str
+
+    def describe(self) -> str:
+        if self.strategy == "xmin":
+            return f"transaction {self.value}"
+        return self.value
+
+
+class WatermarkStore:
+    """Watermarks per primary/replica pair and table, kept in a JSON file."""
+
+    def __init__(self, path: Path = STATE_FILE) -> None:
+        self.path = Path(path)
+        self.state: Dict[str, Any] = {"version": STATE_VERSION, "pairs": {}}
+        if self.path.exists():
+            state = json.loads(self.path.read_text())
+            # Files written by other versions are ignored and replaced
+            if state.get("version") == STATE_VERSION:
+                self.state = state
+
+    def get(self, pair: str, table_name: str) -> Optional[Watermark]:
+        entry = self.state["pairs"].get(pair, {}).get(table_name)
+        return Watermark(entry["strategy"], entry["value"]) if entry else None
+
+    def set(self, pair: str, table_name: str, watermark: Watermark) -> None:
+        self.state["pairs"].setdefault(pair, {})[table_name] = {
+            **asdict(watermark),
+            "verified_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def save(self) -> None:
+        """Write the state atomically so an interrupted run keeps the old file."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.state, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+
+def pair_key(primary_host: Optional[str], replica_host: Optional[str]) -> str:
+    return f"{primary_host} -> {replica_host}"
+
+
+def current_watermark(engine: Engine, table: Table) -> Watermark:
+    """Read the watermark the next run of verification will start from."""
+    with engine.connect() as conn:
+        column = APPEND_ONLY_COLUMNS.get(table.name)
+        if column is not None:
+            value = conn.execute(select(func.max(table.c[column]))).scalar()
+            return Watermark("append", value.isoformat() if value is not None else "")
+
+        xmin = conn.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")).scalar()
+        return Watermark("xmin", str(xmin))
+
+
+def changed_rows_filter(
+    table: Table,
+    previous: Watermark,
+    current: Watermark,
+    overlap: timedelta = DEFAULT_OVERLAP,
+) -> Optional[Any]:
+    """Build the WHERE clause selecting rows changed between two watermarks.
+
+    Rows changed after `current` are left to the next run, so rows written
+    between reading the primary and the replica are not compared. Returns
+    None when the previous watermark cannot be used, e.g. because the table
+    changed strategy or the 32-bit `xmin` wrapped around since.
+    """
+    if previous.strategy != current.strategy:
+        return None
+
+    if previous.strategy == "append":
+        column = table.c[APPEND_ONLY_COLUMNS[table.name]]
+        if not current.value:
+            # The table was empty when the current watermark was read
+            return false()
+        until = column <= datetime.fromisoformat(current.value)
+        if not previous.value:
+            return until
+        return and_(column > datetime.fromisoformat(previous.value) - overlap, until)
+
+    # xmin is the low 32 bits of the 64-bit transaction id, comparable only
+    # while both watermarks lie in the same epoch
+    previous_xid, current_xid = int(previous.value), int(current.value)
+    if previous_xid >> 32 != current_xid >> 32 or previous_xid > current_xid:
+        return None
+    xmin = cast(cast(literal_column("xmin"), Text), BigInteger)
+    return and_(xmin >= (previous_xid & 0xFFFFFFFF), xmin < (current_xid & 0xFFFFFFFF))
@@ -0,0 +1,471 @@
+"""
+Python workload driver for the products table.
+
+Mirrors the JMeter write sampler (autocommitted `UPDATE products SET price`
+statements) but lets the rows that are written be chosen by a configurable
+key distribution, so that both contention-bound and throughput-bound
+scenarios can be measured deliberately:
+
+- `fixed`: always the first rows, like the JMeter script (maximum contention)
+- `uniform`: every product is equally likely
+- `zipf`: product at rank k is chosen with probability proportional to 1/k^s
+- `hotset`: a fraction of the products receives most of the writes
+
+Writes can also be batched (`WRITE_MODES`) to separate commit-rate driven
+from volume driven replication lag:
+
+- `autocommit`: one statement and one commit per row, like JMeter
+- `transaction`: all rows of an iteration in one transaction
+- `values`: one set-based `UPDATE ... FROM (VALUES ...)` statement per iteration
+
+Any mode can run with `synchronous_commit = off` so commits no longer wait
+for the WAL flush on the primary.
+
+The JMeter replica read sampler is available as `product_read_operation`,
+which can be spread over several replicas with a `pgtools.replicas.LoadBalancer`.
+"""
+
+import bisect
+import math
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import Engine, text
+from sqlalchemy.dialects.postgresql import insert
+
+from pgtools.instrumentation import Histogram
+from pgtools.models import Product
+
+if TYPE_CHECKING:
+    from pgtools.replicas import LoadBalancer
+
+DISTRIBUTIONS = ["fixed", "uniform", "zipf", "hotset"]
+
+WRITE_MODES = ["autocommit", "transaction", "values"]
+
+CATEGORIES = ["Electronics", "Home", "Clothing", "Books", "Garden", "Toys"]
+
+READ_PRODUCTS = text("SELECT * FROM products ORDER BY price DESC")
+
+UPDATE_PRICE = text("UPDATE products SET price = :price WHERE id = :id")
+
+# An operation runs one iteration of the workload on a connection
+Operation = Callable[[Any, random.Random], int]
+
+# Draws per requested key before the keys still missing are sampled without
+# replacement; skewed distributions can take very long to hit a rare key
+MAX_DRAWS_PER_KEY = 10
+
+
+class KeyChooser(ABC):
+    """Picks product keys according to a distribution."""
+
+    def __init__(self, keys: Sequence[Any]) -> None:
+        if not keys:
+            raise ValueError("The products table is empty; seed it first")
+        self.keys = list(keys)
+
+    @abstractmethod
+    def choose(self, rng: random.Random, count: int) -> List[Any]:
+        """Return `count` distinct keys (fewer if the distribution has fewer keys)."""
+
+
+class FixedKeys(KeyChooser):
+    """Always the first keys, like the `Product A`..`Product D` rows in JMeter."""
+
+    def choose(self, rng: random.Random, count: int) -> List[Any]:
+        return self.keys[:count]
+
+
+class RandomKeys(KeyChooser):
+    """Draws keys at random, by the index distribution of `_index`."""
+
+    def choose(self, rng: random.Random, count: int) -> List[Any]:
+        support = self._support()
+        count = min(count, len(support))
+        chosen: List[Any] = []
+        seen = set()
+        for _ in range(count * MAX_DRAWS_PER_KEY):
+            if len(chosen) == count:
+                break
+            key = self.keys[self._index(rng)]
+            if key not in seen:
+                seen.add(key)
+                chosen.append(key)
+        if len(chosen) < count:
+            remaining = [self.keys[index] for index in support if self.keys[index] not in seen]
+            chosen.extend(rng.sample(remaining, count - len(chosen)))
+        return chosen
+
+    @abstractmethod
+    def _index(self, rng: random.Random) -> int:
+        """Draw the index of one key."""
+
+    def _support(self) -> range:
+        """Indices `_index` can return; the fallback sampling stays within them."""
+        return range(len(self.keys))
+
+
+class UniformKeys(RandomKeys):
+    def _index(self, rng: random.Random) -> int:
+        return rng.randrange(len(self.keys))
+
+
+class ZipfianKeys(RandomKeys):
+    """Rank-based Zipfian distribution with exponent `s`."""
+
+    def __init__(self, keys: Sequence[Any], s: float = 1.0) -> None:
+        super().__init__(keys)
+        cumulative = 0.0
+        self.cumulative_weights = []
+        for rank in range(1, len(self.keys) + 1):
+            cumulative += 1.0 / rank**s
+            self.cumulative_weights.append(cumulative)
+
+    def _index(self, rng: random.Random) -> int:
+        target = rng.random() * self.cumulative_weights[-1]
+        return bisect.bisect_left(self.cumulative_weights, target)
+
+
+class HotSetKeys(RandomKeys):
+    """A `hot_fraction` of the keys receives `hot_probability` of the picks."""
+
+    def __init__(
+        self,
+        keys: Sequence[Any],
+        hot_fraction: float = 0.01,
+        hot_probability: float = 0.9,
+    ) -> None:
+        super().__init__(keys)
+        if not 0 < hot_fraction <= 1 or not 0 <= hot_probability <= 1:
+            raise ValueError("hot_fraction must be in (0, 1] and hot_probability in [0, 1]")
+        self.hot_count = max(1, math.ceil(len(self.keys) * hot_fraction))
+        self.hot_probability = hot_probability
+
+    def _index(self, rng: random.Random) -> int:
+        cold_count = len(self.keys) - self.hot_count
+        if cold_count == 0 or rng.random() < self.hot_probability:
+            return rng.randrange(self.hot_count)
+        return self.hot_count + rng.randrange(cold_count)
+
+    def _support(self) -> range:
+        if self.hot_probability == 1:
+            return range(self.hot_count)
+        if self.hot_probability == 0 and self.hot_count < len(self.keys):
+            return range(self.hot_count, len(self.keys))
+        return range(len(self.keys))
+
+
+def make_key_chooser(
+    distribution: str,
+    keys: Sequence[Any],
+    zipf_s: float = 1.0,
+    hot_fraction: float = 0.01,
+    hot_probability: float = 0.9,
+    rows_per_iteration: int = 1,
+) -> KeyChooser:
+    """Create the key chooser for a distribution name from `DISTRIBUTIONS`.
+
+    Raises ValueError for a hot set that cannot supply `rows_per_iteration`
+    distinct keys when every pick has to be hot.
+    """
+    if distribution == "fixed":
+        return FixedKeys(keys)
+    if distribution == "uniform":
+        return UniformKeys(keys)
+    if distribution == "zipf":
+        return ZipfianKeys(keys, s=zipf_s)
+    if distribution == "hotset":
+        chooser = HotSetKeys(keys, hot_fraction=hot_fraction, hot_probability=hot_probability)
+        if hot_probability == 1 and chooser.hot_count < rows_per_iteration:
+            raise ValueError(
+                f"A hot probability of 1 only picks from the {chooser.hot_count} hot keys, "
+                f"fewer than the {rows_per_iteration} rows per iteration"
+            )
+        return chooser
+    raise ValueError(f"Unknown key distribution: {distribution}")
+
+
+def load_product_keys(engine: Engine) -> List[uuid.UUID]:
+    """Load product ids in a stable order; rank 0 is the hottest key."""
+    with engine.connect() as conn:
+        result = conn.execute(text("SELECT id FROM products ORDER BY created_at, name, id"))
+        return [row[0] for row in result]
+
+
+def generate_products(count: int, start: int = 0) -> List[Dict[str, Any]]:
+    """Generate products in the format of data/sample_data.json."""
+    return [
+        {
+            "id": str(uuid.UUID(int=index + 1)),
+            "name": f"Product {index:06d}",
+            "category": CATEGORIES[index % len(CATEGORIES)],
+            "price": round(1 + (index * 7919) % 100000 / 100, 2),
+            "in_stock": index % 3 != 0,
+        }
+        for index in range(start, start + count)
+    ]
+
+
+def seed_products(engine: Engine, count: int, batch_size: int = 1000) -> int:
+    """Insert `count` generated products, skipping ids that already exist."""
+    inserted = 0
+    with engine.begin() as conn:
+        for start in range(0, count, batch_size):
+            products = generate_products(min(batch_size, count - start), start)
+            statement = insert(Product).on_conflict_do_nothing(index_elements=["id"])
+            result = conn.execute(
+                statement,
+                [dict(product, id=uuid.UUID(product["id"])) for product in products],
+            )
+            inserted += max(result.rowcount, 0)
+    return inserted
+
+
+def random_price(rng: random.Random) -> int:
+    """Random price in the same range as `${__Random(0000,9999)}` in JMeter."""
+    return rng.randint(0, 9999)
+
+
+def price_update_operation(chooser: KeyChooser, rows_per_iteration: int = 4) -> Operation:
+    """Update the price of `rows_per_iteration` rows, one autocommitted statement each."""
+
+    def operation(conn: Any, rng: random.Random) -> int:
+        keys = chooser.choose(rng, rows_per_iteration)
+        for key in keys:
+            conn.execute(UPDATE_PRICE, {"price": random_price(rng), "id": key})
+        return len(keys)
+
+    return operation
+
+
+def set_based_update(rows: int) -> Any:
+    """Build `UPDATE ... FROM (VALUES ...)` updating `rows` products at once."""
+    values = ", ".join(
+        f"(CAST(:id_{index} AS uuid), CAST(:price_{index} AS double precision))"
+        for index in range(rows)
+    )
+    return text(
+        "UPDATE products AS p SET price = v.price "
+        f"FROM (VALUES {values}) AS v(id, price) WHERE p.id = v.id"
+    )
+
+
+def batched_update_operation(
+    chooser: KeyChooser, rows_per_iteration: int = 4, mode: str = "transaction"
+) -> Operation:
+    """Update `rows_per_iteration` rows in one transaction or one statement.
+
+    Keys are sorted so concurrent batches lock rows in the same order and
+    do not deadlock each other. The caller commits (see `run_workload`).
+    """
+    if mode == "autocommit":
+        return price_update_operation(chooser, rows_per_iteration)
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode: {mode}")
+
+    statements: Dict[int, Any] = {}
+
+    def operation(conn: Any, rng: random.Random) -> int:
+        keys = sorted(chooser.choose(rng, rows_per_iteration), key=str)
+        if mode == "transaction":
+            for key in keys:
+                conn.execute(UPDATE_PRICE, {"price": random_price(rng), "id": key})
+            return len(keys)
+
+        statement = statements.get(len(keys))
+        if statement is None:
+            statement = statements[len(keys)] = set_based_update(len(keys))
+        parameters: Dict[str, Any] = {}
+        for index, key in enumerate(keys):
+            parameters[f"id_{index}"] = key
+            parameters[f"price_{index}"] = random_price(rng)
+        conn.execute(statement, parameters)
+        return len(keys)
+
+    return operation
+
+
+def product_read_operation() -> Operation:
+    """Read all products ordered by price, like the JMeter replica sampler."""
+
+    def operation(conn: Any, rng: random.Random) -> int:
+        return len(conn.execute(READ_PRODUCTS).fetchall())
+
+    return operation
+
+
+@dataclass
+class WorkloadResult:
+    """Throughput, latency and error counts of a workload run."""
+
+    iterations: int = 0
+    rows: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    latency: Histogram = field(default_factory=Histogram)
+    last_error: Optional[str] = None
+
+    @property
+    def iterations_per_second(self) -> float:
+        return self.iterations / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        attempts = self.iterations + self.errors
+        return self.errors / attempts if attempts else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        stats = self.latency.summary()
+        return {
+            "iterations": self.iterations,
+            "rows": self.rows,
+            "errors": self.errors,
+            "elapsed_s": self.elapsed,
+            "iterations_per_s": self.iterations_per_second,
+            "rows_per_s": self.rows_per_second,
+            "error_rate": self.error_rate,
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+            "max_ms": stats["max_ms"],
+        }
+
+
+def run_workload(
+    engine: Union[Engine, "LoadBalancer"],
+    operation: Operation,
+    threads: int = 1,
+    duration: float = 60.0,
+    rate_per_minute: Optional[float] = None,
+    autocommit: bool = True,
+    seed: Optional[int] = None,
+    stop_event: Optional[threading.Event] = None,
+    session_settings: Optional[Dict[str, str]] = None,
+    connection_per_iteration: bool = False,
+) -> WorkloadResult:
+    """Run `operation` from `threads` threads for `duration` seconds.
+
+    With `rate_per_minute`, iterations are paced so that all threads together
+    stay at that rate, like the Constant Throughput Timer in JMeter. Without
+    `autocommit`, every iteration is committed as one transaction.
+    `session_settings` are applied with `set_config` on every worker
+    connection, e.g. `{"synchronous_commit": "off"}`.
+
+    Every thread normally keeps one connection for the whole run. With
+    `connection_per_iteration`, a connection is checked out for every
+    iteration instead, so that `engine` can be a `LoadBalancer` choosing a
+    replica per read; commits and session settings do not apply then.
+    """
+    result = WorkloadResult()
+    lock = threading.Lock()
+    stop = stop_event or threading.Event()
+    base_seed = seed if seed is not None else random.randrange(2**32)
+    interval = threads * 60.0 / rate_per_minute if rate_per_minute else 0.0
+
+    def open_connection() -> Any:
+        conn = engine.connect()
+        try:
+            if autocommit:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            for name, value in (session_settings or {}).items():
+                conn.execute(
+                    text("SELECT set_config(:name, :value, false)"),
+                    {"name": name, "value": str(value)},
+                )
+            if conn.in_transaction():
+                conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def run_once(conn: Any, rng: random.Random) -> int:
+        if conn is None:
+            with engine.connect() as iteration_conn:
+                return operation(iteration_conn, rng)
+        rows = operation(conn, rng)
+        if not autocommit:
+            conn.commit()
+        return rows
+
+    def worker(index: int) -> None:
+        rng = random.Random(base_seed + index)
+        try:
+            conn = None if connection_per_iteration else open_connection()
+        except Exception as e:
+            # The thread cannot run without its connection, which shows as
+            # missed iterations besides the error
+            with lock:
+                result.errors += 1
+                result.last_error = f"connect: {e}"
+            return
+        try:
+            # Stagger the threads so paced iterations do not arrive in bursts
+            next_run = time.monotonic() + interval * index / threads
+            while not stop.is_set() and time.monotonic() < deadline:
+                if interval:
+                    delay = next_run - time.monotonic()
+                    if delay > 0 and stop.wait(delay):
+                        break
+                    next_run += interval
+
+                start = time.perf_counter()
+                try:
+                    rows = run_once(conn, rng)
+                except Exception as e:
+                    if conn is not None and conn.in_transaction():
+                        conn.rollback()
+                    with lock:
+                        result.errors += 1
+                        result.last_error = str(e)
+                    continue
+                result.latency.observe(time.perf_counter() - start, rows)
+                with lock:
+                    result.iterations += 1
+                    result.rows += rows
+        finally:
+            if conn is not None:
+                conn.close()
+
+    started = time.monotonic()
+    deadline = started + duration
+    workers = [
+        threading.Thread(target=worker, args=(index,), name=f"workload-{index}")
+        for index in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    try:
+        for thread in workers:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in workers:
+            thread.join()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def table_update_stats(engine: Engine, table_name: str = "products") -> Dict[str, int]:
+    """Return the update, HOT update and dead tuple counters of a table."""
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(
+                "SELECT n_tup_upd, n_tup_hot_upd, n_dead_tup "
+                "FROM pg_stat_user_tables WHERE relname = :table_name"
+            ),
+            {"table_name": table_name},
+        ).one_or_none()
+    if row is None:
+        return {"n_tup_upd": 0, "n_tup_hot_upd": 0, "n_dead_tup": 0}
+    return {"n_tup_upd": row[0], "n_tup_hot_upd": row[1], "n_dead_tup": row[2]}
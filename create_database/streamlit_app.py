@@ -4,112 +4,47 @@ Streamlit App for Azure PostgreSQL Product Management
 This app allows users to:
 1. View existing products in the database
 2. Create new orders for products
+
+Product and order lists are read from the primary unless
+`READ_BALANCING_POLICY` (round_robin, least_outstanding or lag_aware) is set,
+in which case they are spread over the configured replicas.
+
+Category and daily order totals come from materialized summary views; set
+`SUMMARY_REFRESH_SECONDS` to let the app refresh them on the primary.
 """
 
 import os
-import uuid
-from pathlib import Path
-from typing import Any, Dict, List, Optional, Type, TypeVar
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
 
-import pandas as pd
 import streamlit as st
-from dotenv import load_dotenv
 
 # SQLAlchemy imports
-from sqlalchemy import (
-    Engine,
-    create_engine,
-    Column,
-    Integer,
-    String,
-    Float,
-    Boolean,
-    DateTime,
-    ForeignKey,
-    func,
-)
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.sql import desc
 
-# Load environment variables from .env file if it exists
-env_path = Path(__file__).parent.parent / "terraform"
-env_file = env_path / "load_test_variables.env"
-if env_file.exists():
-    load_dotenv(env_file)
-else:
-    st.error(
-        "Warning: .env file not found. "
-        "Please create one with your database credentials."
-    )
-    st.stop()
-
-# Database connection parameters
-DB_CONFIG = {
-    "host": os.environ.get("PRIMARY_SERVER_FQDN"),
-    "user": os.environ.get("POSTGRES_ADMIN_USERNAME"),
-    "password": os.environ.get("POSTGRES_ADMIN_PASSWORD"),
-    "database": os.environ.get("DATABASE_NAME"),
-    "sslmode": "require",
-}
-
-# Define SQLAlchemy Base and Models
-Base = declarative_base()
-
-# Add type alias for mypy
-T = TypeVar("T", bound=Base)
-ModelType = Type[T]
-
-
-class Product(Base):
-    __tablename__ = "products"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(100), nullable=False)
-    category = Column(String(50), nullable=False)
-    price = Column(Float(precision=10, decimal_return_scale=2), nullable=False)
-    in_stock = Column(Boolean, nullable=False, default=True)
-    created_at = Column(DateTime, server_default=func.now())
-
-    # Relationship with Order model
-    orders = relationship("Order", back_populates="product")
-
-    def __repr__(self) -> str:
-        return (
-            f"<Product(id={self.id}, name='{self.name}', "
-            f"category='{self.category}', price={self.price})>"
-        )
-
+from pgtools.config import ConfigError, get_db_config, get_replica_configs, missing_env_vars
+from pgtools.db import create_db_engine
+from pgtools.models import Order, Product
+from pgtools.replicas import LoadBalancer, make_policy
+from pgtools.summaries import SummaryRefresher, read_category_summary, read_daily_order_totals
 
-class Order(Base):
-    __tablename__ = "orders"
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"))
-    quantity = Column(Integer, nullable=False)
-    order_date = Column(DateTime, server_default=func.now())
-
-    # Relationship with Product model
-    product = relationship("Product", back_populates="orders")
-
-    def __repr__(self) -> str:
-        return (
-            f"<Order(id={self.id}, product_id={self.product_id}, "
-            f"quantity={self.quantity})>"
-        )
+# Number of most recent orders listed in the order history
+ORDER_HISTORY_LIMIT = 100
 
 
 # Check if all required environment variables are set
 def check_env_vars() -> None:
     """Verify all required environment variables are set."""
-    required_vars = [
-        "PRIMARY_SERVER_FQDN",
-        "POSTGRES_ADMIN_USERNAME",
-        "POSTGRES_ADMIN_PASSWORD",
-        "DATABASE_NAME",
-    ]
-
-    missing_vars = [var for var in required_vars if not os.environ.get(var)]
+    try:
+        missing_vars = missing_env_vars("primary")
+    except ConfigError:
+        st.error(
+            "Warning: .env file not found. "
+            "Please create one with your database credentials."
+        )
+        st.stop()
 
     if missing_vars:
         st.error(
@@ -123,17 +58,8 @@ def check_env_vars() -> None:
 def init_connection() -> Engine:
     """Connect to PostgreSQL database using SQLAlchemy."""
     try:
-        # Create the connection string
-        user = DB_CONFIG["user"]
-        pw = DB_CONFIG["password"]
-        host = DB_CONFIG["host"]
-        db = DB_CONFIG["database"]
-        ssl = DB_CONFIG["sslmode"]
-        conn_str = f"postgresql+psycopg2://{user}:{pw}@{host}/{db}"
-        connection_string = f"{conn_str}?sslmode={ssl}"
-
         # Create the SQLAlchemy engine
-        engine = create_engine(connection_string, echo=False)
+        engine = create_db_engine(get_db_config("primary"))
 
         # Return the engine that can be used to create sessions
         return engine
@@ -142,34 +68,69 @@ def init_connection() -> Engine:
         st.stop()
 
 
+@st.cache_resource
+def init_read_balancer() -> Optional[LoadBalancer]:
+    """Spread reads over the replicas when a balancing policy is configured."""
+    policy = os.environ.get("READ_BALANCING_POLICY")
+    if not policy:
+        return None
+
+    try:
+        balancer = LoadBalancer.from_configs(
+            get_replica_configs(),
+            make_policy(policy, float(os.environ.get("READ_MAX_LAG_S", "1.0"))),
+        )
+        if policy == "lag_aware":
+            balancer.start_lag_monitor()
+        return balancer
+    except Exception as e:
+        st.error(f"Error configuring replica reads: {e}")
+        st.stop()
+
+
+@st.cache_resource
+def init_summary_refresher() -> Optional[SummaryRefresher]:
+    """Refresh the summary views periodically when configured."""
+    interval = os.environ.get("SUMMARY_REFRESH_SECONDS")
+    if not interval:
+        return None
+    return SummaryRefresher(init_connection(), interval=float(interval)).start()
+
+
+@contextmanager
+def read_connection() -> Iterator[Connection]:
+    """Connection for read-only queries, from a replica when balancing is enabled."""
+    balancer = init_read_balancer()
+    if balancer is None:
+        with init_connection().connect() as conn:
+            yield conn
+    else:
+        with balancer.connect() as conn:
+            yield conn
+
+
+def product_to_dict(product: Product) -> Dict[str, Any]:
+    """Convert a product to a dictionary."""
+    return {
+        "id": str(product.id),
+        "name": product.name,
+        "category": product.category,
+        "price": product.price,
+        "in_stock": product.in_stock,
+    }
+
+
 @st.cache_data(ttl=5)
 def get_products() -> List[Dict[str, Any]]:
     """Fetch all products from the database using SQLAlchemy."""
-    engine = init_connection()
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
     try:
-        # Query all products and order by id
-        products = session.query(Product).order_by(Product.created_at).all()
-
-        # Convert SQLAlchemy objects to dictionaries
-        products_list = []
-        for product in products:
-            products_list.append(
-                {
-                    "id": str(product.id),
-                    "name": product.name,
-                    "category": product.category,
-                    "price": product.price,
-                    "in_stock": product.in_stock,
-                }
-            )
+        with read_connection() as conn, Session(bind=conn) as session:
+            # Query all products and order by id
+            products = session.query(Product).order_by(Product.created_at).all()
 
-        session.close()
-        return products_list
+            # Convert SQLAlchemy objects to dictionaries
+            return [product_to_dict(product) for product in products]
     except Exception as e:
-        session.close()
         st.error(f"Error fetching products: {e}")
         return []
 
@@ -177,35 +138,38 @@ def get_products() -> List[Dict[str, Any]]:
 @st.cache_data(ttl=5)
 def get_product_by_id(product_id: str) -> Optional[Dict[str, Any]]:
     """Fetch a specific product by ID using SQLAlchemy."""
-    engine = init_connection()
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
     try:
-        # Query product by id
-        product = session.query(Product).filter(Product.id == product_id).first()
-
-        if product:
-            # Convert SQLAlchemy object to dictionary
-            product_dict = {
-                "id": str(product.id),
-                "name": product.name,
-                "category": product.category,
-                "price": product.price,
-                "in_stock": product.in_stock,
-            }
-
-            session.close()
-            return product_dict
-        else:
-            session.close()
-            return None
+        with read_connection() as conn, Session(bind=conn) as session:
+            # Query product by id
+            product = session.query(Product).filter(Product.id == product_id).first()
+            return product_to_dict(product) if product else None
     except Exception as e:
-        session.close()
         st.error(f"Error fetching product: {e}")
         return None
 
 
+@st.cache_data(ttl=5)
+def get_category_summary() -> List[Dict[str, Any]]:
+    """Fetch the per-category product statistics."""
+    try:
+        with read_connection() as conn:
+            return read_category_summary(conn)
+    except Exception as e:
+        st.error(f"Error fetching category summary: {e}")
+        return []
+
+
+@st.cache_data(ttl=5)
+def get_order_totals() -> List[Dict[str, Any]]:
+    """Fetch the per-day order totals."""
+    try:
+        with read_connection() as conn:
+            return read_daily_order_totals(conn)
+    except Exception as e:
+        st.error(f"Error fetching order totals: {e}")
+        return []
+
+
 def create_order(product_id: str, quantity: int) -> Optional[Dict[str, Any]]:
     """Create a new order in the database using SQLAlchemy."""
     engine = init_connection()
@@ -243,33 +207,29 @@ def create_order(product_id: str, quantity: int) -> Optional[Dict[str, Any]]:
 
 
 @st.cache_data(ttl=5)
-def get_orders() -> List[Dict[str, Any]]:
-    """Fetch all orders with product details using SQLAlchemy."""
-    engine = init_connection()
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
+def get_orders(limit: Optional[int] = ORDER_HISTORY_LIMIT) -> List[Dict[str, Any]]:
+    """Fetch the most recent orders with product details using SQLAlchemy."""
     try:
-        # Query orders joined with products
-        orders = (
-            session.query(
-                Order.id,
-                Order.quantity,
-                Order.order_date,
-                Product.id.label("product_id"),
-                Product.name.label("product_name"),
-                Product.price,
-                (Product.price * Order.quantity).label("total_price"),
+        with read_connection() as conn, Session(bind=conn) as session:
+            # Query orders joined with products
+            orders = (
+                session.query(
+                    Order.id,
+                    Order.quantity,
+                    Order.order_date,
+                    Product.id.label("product_id"),
+                    Product.name.label("product_name"),
+                    Product.price,
+                    (Product.price * Order.quantity).label("total_price"),
+                )
+                .join(Product)
+                .order_by(desc(Order.order_date))
+                .limit(limit)
+                .all()
             )
-            .join(Product)
-            .order_by(desc(Order.order_date))
-            .all()
-        )
 
-        # Convert result to list of dictionaries
-        orders_list = []
-        for order in orders:
-            orders_list.append(
+            # Convert result to list of dictionaries
+            return [
                 {
                     "id": str(order.id),
                     "quantity": order.quantity,
@@ -279,20 +239,35 @@ def get_orders() -> List[Dict[str, Any]]:
                     "price": order.price,
                     "total_price": order.total_price,
                 }
-            )
-
-        session.close()
-        return orders_list
+                for order in orders
+            ]
     except Exception as e:
-        session.close()
         st.error(f"Error fetching orders: {e}")
         return []
 
 
 def product_list_view() -> None:
     """Display the list of products."""
+    # pandas is only needed for rendering, so import it on first use
+    import pandas as pd
+
     st.header("Products")
 
+    summary = get_category_summary()
+    if summary:
+        st.subheader("By Category")
+        summary_df = pd.DataFrame(summary)
+        summary_df["avg_price"] = summary_df["avg_price"].apply(lambda x: f"${float(x):.2f}")
+        summary_df = summary_df.rename(
+            columns={
+                "category": "Category",
+                "product_count": "Products",
+                "in_stock_count": "In Stock",
+                "avg_price": "Avg Price",
+            }
+        )
+        st.dataframe(summary_df, use_container_width=True, hide_index=True)
+
     products = get_products()
 
     if not products:
@@ -374,8 +349,22 @@ def order_creation_view() -> None:
 
 def orders_list_view() -> None:
     """Display the list of existing orders."""
+    # pandas is only needed for rendering, so import it on first use
+    import pandas as pd
+
     st.header("Order History")
 
+    totals = get_order_totals()
+    if totals:
+        col1, col2 = st.columns(2)
+        col1.metric("Orders", sum(day["order_count"] for day in totals))
+        col2.metric("Revenue", f"${sum(float(day['revenue']) for day in totals):,.2f}")
+
+        totals_df = pd.DataFrame(totals)
+        totals_df["day"] = pd.to_datetime(totals_df["day"])
+        st.bar_chart(totals_df, x="day", y="revenue")
+
+    st.subheader(f"Most Recent {ORDER_HISTORY_LIMIT} Orders")
     orders = get_orders()
 
     if not orders:
@@ -426,6 +415,7 @@ def main() -> None:
 
     # Check environment variables
     check_env_vars()
+    init_summary_refresher()
 
     # Create tabs for different sections of the app
     tab1, tab2, tab3 = st.tabs(["Products", "Create Order", "Order History"])
@@ -1,69 +1,46 @@
 """
 Replication Verification Script for Azure PostgreSQL
 
-This script connects to both primary and replica PostgreSQL databases
+This script connects to the primary and every replica PostgreSQL database
 and verifies that the data is being properly replicated between them.
 It compares the data in all tables to ensure replication is working.
 """
 
-import os
 import sys
-from time import sleep
+from itertools import zip_longest
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-from dotenv import load_dotenv
+from time import sleep
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 
 # SQLAlchemy imports
-from sqlalchemy import (
-    Engine,
-    create_engine,
-    MetaData,
-    Table,
-    inspect,
-    text,
-    select,
-)
+from sqlalchemy import Engine, inspect, text, select
 from sqlalchemy.exc import SQLAlchemyError
 
-# Load environment variables from .env file if it exists
-env_path = Path(__file__).parent.parent / "terraform"
-env_file = env_path / "load_test_variables.env"
-if env_file.exists():
-    load_dotenv(env_file)
-else:
-    print(f"Warning: {env_file} not found.")
-    sys.exit(1)
-
-# Define config values for both database types
-PRIMARY_DB_CONFIG = {
-    "host": os.environ.get("PRIMARY_SERVER_FQDN"),
-    "user": os.environ.get("POSTGRES_ADMIN_USERNAME"),
-    "password": os.environ.get("POSTGRES_ADMIN_PASSWORD"),
-    "database": os.environ.get("DATABASE_NAME"),
-    "sslmode": "require",
-}
-
-REPLICA_DB_CONFIG = {
-    "host": os.environ.get("REPLICA_SERVER_FQDN"),
-    "user": os.environ.get("POSTGRES_ADMIN_USERNAME"),
-    "password": os.environ.get("POSTGRES_ADMIN_PASSWORD"),
-    "database": os.environ.get("DATABASE_NAME"),
-    "sslmode": "require",
-}
+from pgtools.config import ConfigError, get_db_config, get_replica_configs, missing_env_vars
+from pgtools.db import create_db_engine, reflect_table
+from pgtools.lag import REPLICA_LAG_QUERY
+from pgtools.watermarks import (
+    STATE_FILE,
+    Watermark,
+    WatermarkStore,
+    changed_rows_filter,
+    current_watermark,
+    pair_key,
+)
+
+# Rows fetched at a time when comparing the rows changed since the last run
+CHUNK_ROWS = 1000
 
 
 def check_env_vars() -> bool:
     """Verify all required environment variables are set."""
     # Database connection variables are required
-    primary_vars = [
-        "PRIMARY_SERVER_FQDN",
-        "REPLICA_SERVER_FQDN",
-        "POSTGRES_ADMIN_USERNAME",
-        "POSTGRES_ADMIN_PASSWORD",
-        "DATABASE_NAME",
-    ]
-
-    primary_missing = [var for var in primary_vars if not os.environ.get(var)]
+    try:
+        primary_missing = missing_env_vars("primary", "replica")
+    except ConfigError as e:
+        print(f"Warning: {e}")
+        sys.exit(1)
+
     if primary_missing:
         print(
             f"Error: Missing PRIMARY database environment variables: "
@@ -81,28 +58,10 @@ def check_env_vars() -> bool:
 def connect_to_database(config: Dict[str, Optional[str]], db_type: str) -> Engine:
     """Connect to the PostgreSQL database using SQLAlchemy."""
     try:
-        # Ensure all required values are present
-        user = config.get("user")
-        password = config.get("password")
-        host = config.get("host")
-        database = config.get("database")
-        sslmode = config.get("sslmode", "require")
-
-        if not all([user, password, host, database]):
-            raise ValueError(
-                f"Missing required {db_type} database connection parameters"
-            )
-
-        # Create the connection string
-        connection_string = (
-            f"postgresql+psycopg2://{user}:{password}@"
-            f"{host}/{database}?sslmode={sslmode}"
-        )
-
-        print(f"Connecting to {db_type} database at {host}...")
+        print(f"Connecting to {db_type} database at {config.get('host')}...")
 
         # Create engine with echo=False to avoid logging SQL statements
-        engine = create_engine(connection_string, echo=False)
+        engine = create_db_engine(config)
 
         # Test connection by making a simple query
         with engine.connect() as conn:
@@ -141,8 +100,7 @@ def get_table_row_count(engine: Engine, table_name: str) -> int:
 def get_table_data(engine: Engine, table_name: str) -> List[Dict[str, Any]]:
     """Get all data from a table as a list of dictionaries."""
     try:
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=engine)
+        table = reflect_table(engine, table_name)
 
         with engine.connect() as conn:
             # Order by all columns for consistent comparison
@@ -177,36 +135,142 @@ def compare_tables(primary_engine: Engine, replica_engine: Engine) -> bool:
     all_tables_match = True
 
     for table_name in primary_tables:
-        primary_count = get_table_row_count(primary_engine, table_name)
-        replica_count = get_table_row_count(replica_engine, table_name)
+        if not verify_table(primary_engine, replica_engine, table_name):
+            all_tables_match = False
 
-        print(f"\nVerifying table: {table_name}")
+    return all_tables_match
 
-        # Compare row counts
-        if primary_count != replica_count:
-            print(f"❌ Row count mismatch for table '{table_name}':")
-            print(f"   Primary: {primary_count} rows")
-            print(f"   Replica: {replica_count} rows")
-            all_tables_match = False
-            continue
 
-        print(f"✅ Row count matches: {primary_count} rows")
+def verify_table(primary_engine: Engine, replica_engine: Engine, table_name: str) -> bool:
+    """Compare the row count and, for small tables, the data of one table."""
+    primary_count = get_table_row_count(primary_engine, table_name)
+    replica_count = get_table_row_count(replica_engine, table_name)
 
-        # For small tables (< 1000 rows), compare the actual data
-        if primary_count < 1000:
-            primary_data = get_table_data(primary_engine, table_name)
-            replica_data = get_table_data(replica_engine, table_name)
+    print(f"\nVerifying table: {table_name}")
 
-            if primary_data == replica_data:
-                print(f"✅ Data matches for all {primary_count} rows")
-            else:
-                print(
-                    f"❌ Data mismatch in table '{table_name}' despite matching row counts"
+    # Compare row counts
+    if primary_count != replica_count:
+        print(f"❌ Row count mismatch for table '{table_name}':")
+        print(f"   Primary: {primary_count} rows")
+        print(f"   Replica: {replica_count} rows")
+        return False
+
+    print(f"✅ Row count matches: {primary_count} rows")
+
+    # For small tables (< 1000 rows), compare the actual data
+    if primary_count < 1000:
+        primary_data = get_table_data(primary_engine, table_name)
+        replica_data = get_table_data(replica_engine, table_name)
+
+        if primary_data == replica_data:
+            print(f"✅ Data matches for all {primary_count} rows")
+        else:
+            print(f"❌ Data mismatch in table '{table_name}' despite matching row counts")
+            return False
+    else:
+        print(f"ℹ️ Table has {primary_count} rows - skipping full data comparison")
+        # For large tables, we could add sampling or checksums here
+
+    return True
+
+
+def iter_changed_rows(
+    engine: Engine, table_name: str, previous: Watermark, current: Watermark
+) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of a table changed between two watermarks.
+
+    Rows are fetched `CHUNK_ROWS` at a time, so tables that changed a lot
+    are compared without loading them into memory.
+    """
+    table = reflect_table(engine, table_name)
+    with engine.connect() as conn:
+        where = changed_rows_filter(table, previous, current)
+        query = select(table).where(where).order_by(*[c for c in table.columns])
+        for row in conn.execution_options(yield_per=CHUNK_ROWS).execute(query):
+            yield dict(row._mapping)
+
+
+def compare_changed_rows(
+    primary_engine: Engine,
+    replica_engine: Engine,
+    table_name: str,
+    previous: Watermark,
+    current: Watermark,
+) -> Tuple[int, int, Optional[int]]:
+    """Compare the changed rows of a table on the primary and the replica.
+
+    Returns the number of changed rows on each server and the position of
+    the first row that differs, or None if all rows match.
+    """
+    primary_count = replica_count = 0
+    first_difference = None
+    primary_rows = iter_changed_rows(primary_engine, table_name, previous, current)
+    replica_rows = iter_changed_rows(replica_engine, table_name, previous, current)
+    for primary_row, replica_row in zip_longest(primary_rows, replica_rows):
+        primary_count += primary_row is not None
+        replica_count += replica_row is not None
+        if first_difference is None and primary_row != replica_row:
+            first_difference = max(primary_count, replica_count)
+    return primary_count, replica_count, first_difference
+
+
+def compare_tables_incremental(
+    primary_engine: Engine, replica_engine: Engine, store: WatermarkStore, pair: str
+) -> bool:
+    """Compare only the rows changed since the previous run's watermarks.
+
+    Tables without a usable watermark are verified in full. Watermarks are
+    advanced only for tables that match.
+    """
+    primary_tables = set(get_table_names(primary_engine))
+    replica_tables = set(get_table_names(replica_engine))
+
+    print("\n=== Incremental Table Comparison ===")
+
+    if primary_tables != replica_tables:
+        print("❌ Table mismatch between primary and replica:")
+        print(f"Tables only in primary: {primary_tables - replica_tables}")
+        print(f"Tables only in replica: {replica_tables - primary_tables}")
+        return False
+
+    all_tables_match = True
+
+    for table_name in sorted(primary_tables):
+        # Read the new watermark before comparing, so changes made during
+        # the comparison are verified again by the next run
+        table = reflect_table(primary_engine, table_name)
+        watermark = current_watermark(primary_engine, table)
+        previous = store.get(pair, table_name)
+        if previous is not None and changed_rows_filter(table, previous, watermark) is None:
+            previous = None
+
+        if previous is None:
+            print(f"\nℹ️ No usable watermark for table '{table_name}' - verifying all rows")
+            matches = verify_table(primary_engine, replica_engine, table_name)
+        else:
+            print(f"\nVerifying table: {table_name} (changes since {previous.describe()})")
+            try:
+                primary_count, replica_count, first_difference = compare_changed_rows(
+                    primary_engine, replica_engine, table_name, previous, watermark
                 )
+            except SQLAlchemyError as e:
+                print(f"Error getting changed rows from table {table_name}: {e}")
                 all_tables_match = False
+                continue
+
+            matches = first_difference is None
+            if matches:
+                print(f"✅ Data matches for all {primary_count} changed rows")
+            else:
+                print(f"❌ Changed rows differ for table '{table_name}':")
+                print(f"   Primary: {primary_count} rows")
+                print(f"   Replica: {replica_count} rows")
+                print(f"   First difference at changed row {first_difference}")
+
+        if matches:
+            store.set(pair, table_name, watermark)
         else:
-            print(f"ℹ️ Table has {primary_count} rows - skipping full data comparison")
-            # For large tables, we could add sampling or checksums here
+            all_tables_match = False
 
     return all_tables_match
 
@@ -216,19 +280,10 @@ def check_replication_lag(
 ) -> Optional[int]:
     """Check if there's replication lag between primary and replica."""
     try:
-        # This query works specifically for Azure PostgreSQL Flexible Server
-        lag_query = """
-        SELECT
-            CASE
-                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
-                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::INTEGER
-            END AS lag_seconds;
-        """
-
         # Execute on replica only - primary doesn't have these metrics
         with replica_engine.connect() as conn:
             try:
-                result = conn.execute(text(lag_query))
+                result = conn.execute(text(REPLICA_LAG_QUERY))
                 lag_seconds = result.scalar()
                 # Ensure we return an integer or default value
                 if lag_seconds is not None:
@@ -244,45 +299,90 @@ def check_replication_lag(
         return 0  # Default to no lag on error
 
 
-def main() -> None:
-    """Main function to verify replication between databases."""
+def check_replica_set_lag(
+    primary_engine: Engine, replica_engines: Dict[str, Engine]
+) -> Dict[str, Optional[int]]:
+    """Check the replication lag of every replica."""
+    return {
+        name: check_replication_lag(primary_engine, replica_engine)
+        for name, replica_engine in replica_engines.items()
+    }
+
+
+def main(incremental: bool = False, state_file: Optional[Path] = None) -> Dict[str, bool]:
+    """Main function to verify replication between databases.
+
+    With `incremental`, only rows changed since the previous incremental run
+    are compared, using the watermarks kept in `state_file`. Returns whether
+    each replica matched the primary.
+    """
     print("Azure PostgreSQL Replication Verification")
     print("========================================")
 
     # Check environment variables
     check_env_vars()
 
-    # Connect to both databases
-    primary_engine = connect_to_database(PRIMARY_DB_CONFIG, "PRIMARY")
-    replica_engine = connect_to_database(REPLICA_DB_CONFIG, "REPLICA")
+    # Connect to the primary and every replica
+    primary_config = get_db_config("primary")
+    primary_engine = connect_to_database(primary_config, "PRIMARY")
+    replica_configs = get_replica_configs()
+    replica_engines = {
+        str(config["host"]): connect_to_database(
+            config, "REPLICA" if len(replica_configs) == 1 else f"REPLICA {index}"
+        )
+        for index, config in enumerate(replica_configs, start=1)
+    }
 
     # Check replication lag first (if supported)
-    lag_seconds = check_replication_lag(primary_engine, replica_engine)
-    if lag_seconds is not None:
-        print(f"\nReplication lag: {lag_seconds} seconds")
-
-        # If lag is detected, wait a bit for replication to catch up
-        if lag_seconds > 0:
-            wait_time = min(
-                lag_seconds + 5, 30
-            )  # Wait for lag + 5 seconds, max 30 seconds
-            print(f"Waiting {wait_time} seconds for replication to catch up...")
-            sleep(wait_time)
-
-    # Compare tables between primary and replica
-    tables_match = compare_tables(primary_engine, replica_engine)
+    lags = check_replica_set_lag(primary_engine, replica_engines)
+    for name, lag_seconds in lags.items():
+        if lag_seconds is None:
+            continue
+        if len(lags) == 1:
+            print(f"\nReplication lag: {lag_seconds} seconds")
+        else:
+            print(f"Replication lag of {name}: {lag_seconds} seconds")
+
+    # If lag is detected, wait a bit for replication to catch up
+    max_lag = max((lag for lag in lags.values() if lag is not None), default=0)
+    if max_lag > 0:
+        wait_time = min(max_lag + 5, 30)  # Wait for lag + 5 seconds, max 30 seconds
+        print(f"Waiting {wait_time} seconds for replication to catch up...")
+        sleep(wait_time)
+
+    # Compare tables between the primary and each replica
+    store = WatermarkStore(state_file or STATE_FILE) if incremental else None
+    failed_replicas = []
+    for name, replica_engine in replica_engines.items():
+        if len(replica_engines) > 1:
+            print(f"\n=== Replica {name} ===")
+        if store is not None:
+            pair = pair_key(primary_config["host"], name)
+            tables_match = compare_tables_incremental(primary_engine, replica_engine, store, pair)
+        else:
+            tables_match = compare_tables(primary_engine, replica_engine)
+        if not tables_match:
+            failed_replicas.append(name)
+    if store is not None:
+        store.save()
 
     print("\n=== Replication Verification Summary ===")
-    if tables_match:
+    if not failed_replicas:
         print("✅ SUCCESS: All tables are properly replicated!")
-        print("The replica database is in sync with the primary database.")
+        if len(replica_engines) == 1:
+            print("The replica database is in sync with the primary database.")
+        else:
+            print(f"All {len(replica_engines)} replicas are in sync with the primary database.")
     else:
         print("❌ FAILED: Replication issues detected!")
         print("Some tables or data are not properly replicated between databases.")
+        if len(replica_engines) > 1:
+            print(f"Affected replicas: {', '.join(failed_replicas)}")
         print("Please check the Azure portal to verify replication status.")
 
     print("\nVerification completed!")
+    return {name: name not in failed_replicas for name in replica_engines}
 
 
 if __name__ == "__main__":
-    main()
+    main(incremental="--incremental" in sys.argv[1:])
@@ -0,0 +1,291 @@
+"""
+Async Replication Verification Script for Azure PostgreSQL
+
+Asyncio counterpart of verify_replication.py on the asyncpg driver. The
+primary and every replica are queried concurrently from one event loop:
+row counts and table data of all tables are requested from all servers at
+once instead of one query after the other, so verification takes roughly
+as long as the slowest server rather than the sum of all of them.
+
+Output and exit behaviour match verify_replication.py; incremental
+verification is only available in the synchronous script.
+"""
+
+import asyncio
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+# SQLAlchemy imports
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from pgtools.config import get_db_config, get_replica_configs
+from pgtools.db import create_async_db_engine, reflect_table
+from pgtools.lag import REPLICA_LAG_QUERY
+from verify_replication import check_env_vars
+
+
+async def connect_to_database(config: Dict[str, Optional[str]], db_type: str) -> AsyncEngine:
+    """Connect to the PostgreSQL database using an async SQLAlchemy engine."""
+    try:
+        print(f"Connecting to {db_type} database at {config.get('host')}...")
+
+        engine = create_async_db_engine(config)
+
+        # Test connection by making a simple query
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+        print(f"Connected successfully to {db_type} database!")
+        return engine
+    except Exception as e:
+        print(f"Error connecting to {db_type} PostgreSQL: {e}")
+        sys.exit(1)
+
+
+async def get_table_names(engine: AsyncEngine) -> List[str]:
+    """Get all table names from the database."""
+    try:
+        async with engine.connect() as conn:
+            return await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+    except Exception as e:
+        print(f"Error getting table names: {e}")
+        sys.exit(1)
+
+
+async def get_table_row_count(engine: AsyncEngine, table_name: str) -> int:
+    """Get the row count for a specific table."""
+    try:
+        async with engine.connect() as conn:
+            count = await conn.scalar(text(f'SELECT COUNT(*) FROM "{table_name}"'))
+            return int(count) if count is not None else 0
+    except Exception as e:
+        print(f"Error getting row count for table {table_name}: {e}")
+        return -1
+
+
+async def get_table_data(engine: AsyncEngine, table_name: str) -> List[Dict[str, Any]]:
+    """Get all data from a table as a list of dictionaries."""
+    try:
+        async with engine.connect() as conn:
+            # Reflection is cached per engine, like in the sync script
+            table = await conn.run_sync(
+                lambda sync_conn: reflect_table(engine.sync_engine, table_name, bind=sync_conn)
+            )
+
+            # Order by all columns for consistent comparison
+            query = select(table).order_by(*[c for c in table.columns])
+            result = await conn.execute(query)
+            return [dict(row._mapping) for row in result]
+    except Exception as e:
+        print(f"Error getting data from table {table_name}: {e}")
+        return []
+
+
+async def verify_table(
+    primary_engine: AsyncEngine, replica_engine: AsyncEngine, table_name: str
+) -> Tuple[bool, List[str]]:
+    """Compare one table and return whether it matches and the report lines.
+
+    The lines are returned instead of printed so that tables verified
+    concurrently still report in a stable order.
+    """
+    primary_count, replica_count = await asyncio.gather(
+        get_table_row_count(primary_engine, table_name),
+        get_table_row_count(replica_engine, table_name),
+    )
+
+    lines = [f"\nVerifying table: {table_name}"]
+
+    # Compare row counts
+    if primary_count != replica_count:
+        lines.append(f"❌ Row count mismatch for table '{table_name}':")
+        lines.append(f"   Primary: {primary_count} rows")
+        lines.append(f"   Replica: {replica_count} rows")
+        return False, lines
+
+    lines.append(f"✅ Row count matches: {primary_count} rows")
+
+    # For small tables (< 1000 rows), compare the actual data
+    if primary_count < 1000:
+        primary_data, replica_data = await asyncio.gather(
+            get_table_data(primary_engine, table_name),
+            get_table_data(replica_engine, table_name),
+        )
+
+        if primary_data == replica_data:
+            lines.append(f"✅ Data matches for all {primary_count} rows")
+        else:
+            lines.append(f"❌ Data mismatch in table '{table_name}' despite matching row counts")
+            return False, lines
+    else:
+        lines.append(f"ℹ️ Table has {primary_count} rows - skipping full data comparison")
+
+    return True, lines
+
+
+async def compare_tables_report(
+    primary_engine: AsyncEngine, replica_engine: AsyncEngine
+) -> Tuple[bool, List[str]]:
+    """Compare all tables concurrently and return whether they match and the report lines."""
+    primary_names, replica_names = await asyncio.gather(
+        get_table_names(primary_engine), get_table_names(replica_engine)
+    )
+    primary_tables = set(primary_names)
+    replica_tables = set(replica_names)
+
+    lines = ["\n=== Table Comparison ==="]
+
+    # Check if all tables exist in both databases
+    if primary_tables != replica_tables:
+        lines.append("❌ Table mismatch between primary and replica:")
+        lines.append(f"Tables only in primary: {primary_tables - replica_tables}")
+        lines.append(f"Tables only in replica: {replica_tables - primary_tables}")
+        return False, lines
+
+    lines.append(
+        f"✅ Found {len(primary_tables)} tables in both databases: {', '.join(primary_tables)}"
+    )
+
+    table_names = sorted(primary_tables)
+    results = await asyncio.gather(
+        *[verify_table(primary_engine, replica_engine, name) for name in table_names]
+    )
+    for _, table_lines in results:
+        lines.extend(table_lines)
+
+    return all(matches for matches, _ in results), lines
+
+
+async def compare_tables(primary_engine: AsyncEngine, replica_engine: AsyncEngine) -> bool:
+    """Compare all tables between primary and replica databases concurrently."""
+    matches, lines = await compare_tables_report(primary_engine, replica_engine)
+    print("\n".join(lines))
+    return matches
+
+
+async def check_replication_lag(
+    primary_engine: AsyncEngine, replica_engine: AsyncEngine
+) -> Optional[int]:
+    """Check if there's replication lag between primary and replica."""
+    try:
+        # Execute on replica only - primary doesn't have these metrics
+        async with replica_engine.connect() as conn:
+            try:
+                lag_seconds = await conn.scalar(text(REPLICA_LAG_QUERY))
+                if lag_seconds is not None:
+                    return int(lag_seconds)
+                return 0  # Default to no lag if query returns None
+            except SQLAlchemyError:
+                print(
+                    "ℹ️ Couldn't determine replication lag - query not supported on this server"
+                )
+                return 0  # Default to no lag if query not supported
+    except Exception as e:
+        print(f"Error checking replication lag: {e}")
+        return 0  # Default to no lag on error
+
+
+async def check_replica_set_lag(
+    primary_engine: AsyncEngine, replica_engines: Dict[str, AsyncEngine]
+) -> Dict[str, Optional[int]]:
+    """Check the replication lag of every replica concurrently."""
+    lags = await asyncio.gather(
+        *[
+            check_replication_lag(primary_engine, replica_engine)
+            for replica_engine in replica_engines.values()
+        ]
+    )
+    return dict(zip(replica_engines, lags))
+
+
+async def verify() -> Dict[str, bool]:
+    """Connect to all servers, wait out replication lag and compare tables.
+
+    Returns whether each replica matched the primary.
+    """
+    primary_engine = await connect_to_database(get_db_config("primary"), "PRIMARY")
+    replica_configs = get_replica_configs()
+    engines = await asyncio.gather(
+        *[
+            connect_to_database(
+                config, "REPLICA" if len(replica_configs) == 1 else f"REPLICA {index}"
+            )
+            for index, config in enumerate(replica_configs, start=1)
+        ]
+    )
+    replica_engines = {
+        str(config["host"]): engine for config, engine in zip(replica_configs, engines)
+    }
+
+    try:
+        # Check replication lag first (if supported)
+        lags = await check_replica_set_lag(primary_engine, replica_engines)
+        for name, lag_seconds in lags.items():
+            if lag_seconds is None:
+                continue
+            if len(lags) == 1:
+                print(f"\nReplication lag: {lag_seconds} seconds")
+            else:
+                print(f"Replication lag of {name}: {lag_seconds} seconds")
+
+        # If lag is detected, wait a bit for replication to catch up
+        max_lag = max((lag for lag in lags.values() if lag is not None), default=0)
+        if max_lag > 0:
+            wait_time = min(max_lag + 5, 30)  # Wait for lag + 5 seconds, max 30 seconds
+            print(f"Waiting {wait_time} seconds for replication to catch up...")
+            await asyncio.sleep(wait_time)
+
+        # All replicas are compared at once; each report is printed in order
+        reports = await asyncio.gather(
+            *[
+                compare_tables_report(primary_engine, replica_engine)
+                for replica_engine in replica_engines.values()
+            ]
+        )
+        failed_replicas = []
+        for name, (matches, lines) in zip(replica_engines, reports):
+            if len(replica_engines) > 1:
+                print(f"\n=== Replica {name} ===")
+            print("\n".join(lines))
+            if not matches:
+                failed_replicas.append(name)
+    finally:
+        await asyncio.gather(
+            primary_engine.dispose(), *[engine.dispose() for engine in replica_engines.values()]
+        )
+
+    print("\n=== Replication Verification Summary ===")
+    if not failed_replicas:
+        print("✅ SUCCESS: All tables are properly replicated!")
+        if len(replica_engines) == 1:
+            print("The replica database is in sync with the primary database.")
+        else:
+            print(f"All {len(replica_engines)} replicas are in sync with the primary database.")
+    else:
+        print("❌ FAILED: Replication issues detected!")
+        print("Some tables or data are not properly replicated between databases.")
+        if len(replica_engines) > 1:
+            print(f"Affected replicas: {', '.join(failed_replicas)}")
+        print("Please check the Azure portal to verify replication status.")
+
+    return {name: name not in failed_replicas for name in replica_engines}
+
+
+def main() -> Dict[str, bool]:
+    """Main function to verify replication between databases."""
+    print("Azure PostgreSQL Replication Verification (async)")
+    print("================================================")
+
+    # Check environment variables
+    check_env_vars()
+
+    results = asyncio.run(verify())
+
+    print("\nVerification completed!")
+    return results
+
+
+if __name__ == "__main__":
+    main()
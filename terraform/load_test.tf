@@ -14,7 +14,7 @@ RESOURCE_GROUP="${var.resource_group_name}"
 LOAD_TEST_NAME="${var.load_test_name}"
 TEST_NAME="postgresql-load-test"
 TEST_DESCRIPTION="Performance test of replication under load: 60 seconds"
-TARGET_URL="https://example.com"
+TARGET_URL="${var.api_target_url}"
 ENGINE_INSTANCES=${var.engine_instances}
 
 # PostgreSQL server information
@@ -22,7 +22,10 @@ PRIMARY_SERVER_NAME="${azurerm_postgresql_flexible_server.primary.name}"
 PRIMARY_SERVER_FQDN="${azurerm_postgresql_flexible_server.primary.fqdn}"
 REPLICA_SERVER_NAME="${azurerm_postgresql_flexible_server.replica.name}"
 REPLICA_SERVER_FQDN="${azurerm_postgresql_flexible_server.replica.fqdn}"
+REPLICA_SERVER_FQDNS="${join(",", concat([azurerm_postgresql_flexible_server.replica.fqdn], azurerm_postgresql_flexible_server.additional_replica[*].fqdn))}"
 DATABASE_NAME="${var.postgres_database_name}"
+POSTGRES_SKU_NAME="${azurerm_postgresql_flexible_server.primary.sku_name}"
+ADDITIONAL_REPLICAS=${var.additional_replicas}
 
 # Test parameters
 MAIN_THREADS=${var.main_threads}
@@ -287,6 +287,46 @@ resource "azurerm_postgresql_flexible_server" "replica" {
   tags = var.tags
 }
 
+# Additional read replicas for read scaling tests
+resource "azurerm_postgresql_flexible_server" "additional_replica" {
+  count                  = var.additional_replicas
+  name                   = "${var.postgres_server_name}repl${count.index + 2}"
+  resource_group_name    = azurerm_resource_group.main.name
+  location               = azurerm_resource_group.main.location
+  version                = "14"
+  administrator_login    = var.postgres_admin_username
+  administrator_password = var.postgres_admin_password
+  storage_mb             = 131072 # 128 GB
+  sku_name               = "MO_Standard_E2ds_v5"
+  create_mode            = "Replica"
+  source_server_id       = azurerm_postgresql_flexible_server.primary.id
+  zone                   = element(var.additional_replica_zones, count.index)
+
+  authentication {
+    active_directory_auth_enabled = true
+    password_auth_enabled         = true
+    tenant_id                     = data.azurerm_client_config.current.tenant_id
+  }
+
+  backup_retention_days        = 7
+  geo_redundant_backup_enabled = false
+
+  # Start after the first replica, which waits for the primary's database.
+  # Terraform creates the additional replicas in parallel; if Azure rejects
+  # concurrent replica creation from the primary, apply with -parallelism=1.
+  depends_on = [
+    azurerm_postgresql_flexible_server.replica
+  ]
+
+  timeouts {
+    create = "60m"
+    update = "60m"
+    delete = "30m"
+  }
+
+  tags = var.tags
+}
+
 # Add a delay before creating Key Vault secrets
 resource "time_sleep" "wait_before_secrets" {
   depends_on = [
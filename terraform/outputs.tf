@@ -54,6 +54,10 @@ output "postgres_replica_server_fqdn" {
   value = azurerm_postgresql_flexible_server.replica.fqdn
 }
 
+output "postgres_additional_replica_fqdns" {
+  value = azurerm_postgresql_flexible_server.additional_replica[*].fqdn
+}
+
 output "load_test_config_name" {
   value = var.load_test_test_name
   description = "The name for the load test configuration (to be created manually)"
@@ -99,6 +99,18 @@ variable "replica_loops" {
   default     = 400
 }
 
+variable "additional_replicas" {
+  description = "Number of read replicas to create in addition to the first one"
+  type        = number
+  default     = 0
+}
+
+variable "additional_replica_zones" {
+  description = "Availability zones of the additional replicas, used in turn"
+  type        = list(string)
+  default     = ["3"]
+}
+
 variable "main_writes_per_minute" {
   description = "Main database writes per minute"
   type        = number
@@ -115,4 +127,10 @@ variable "engine_instances" {
   description = "Number of engine instances for the load test"
   type        = number
   default     = 40
+}
+
+variable "api_target_url" {
+  description = "Base URL of the HTTP API service targeted by the load test"
+  type        = string
+  default     = "https://example.com"
 }
\ No newline at end of file